@@ -0,0 +1,296 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Fits many data files without the GUI.
+
+The files are read and fit in parallel by a pool of worker processes, and
+a row of results (alpha, beta, d_star and timings) is written for each
+file and estimator as soon as the file is done, as CSV or as JSON lines:
+
+    python -m visfitter.batch 'data/*.txt' -e ls lms -o fits.csv
+
+Files that are too large to read into memory can be fit with
+--out-of-core instead (see out_of_core.fitFile), which reports the exact
+d_star of each estimator's line over all of the points.
+
+This doesn't import PySide or pyqtgraph, so it runs without a display.
+'''
+
+# std lib imports
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+import logging
+log = logging.getLogger(__name__)
+
+# third party imports
+import numpy
+
+# local imports
+from . import linear_regression
+from . import out_of_core
+from . import parallel
+from . import parser
+
+# The line estimators of the registry, by command line name
+ESTIMATORS = dict((key, estimator) for key, estimator in
+                  linear_regression.ESTIMATORS.iteritems()
+                  if not estimator.multiple)
+
+FIELDS = ['file', 'estimator', 'n', 'alpha', 'beta', 'd_star', 'seed',
+          'load_seconds', 'fit_seconds', 'error']
+
+# The seed of the randomized estimators, so that a batch gives the same
+# results every time it is run
+SEED = 0
+
+
+def expandPaths(patterns):
+    '''
+    Returns the sorted paths matched by the glob patterns, without
+    duplicates. Patterns that match nothing are logged.
+    '''
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern)
+        if not matches:
+            log.warning('No files match %s', pattern)
+        paths.update(path for path in matches if os.path.isfile(path))
+    return sorted(paths)
+
+
+def getMedianResidual(x, y, alpha, beta):
+    '''
+    Returns d_star, the h-th smallest absolute residual of the line,
+    h = n // 2 + 1.
+    '''
+    r = numpy.absolute(y - (alpha + beta * x))
+    h = r.size // 2 + 1
+    return numpy.partition(r, h - 1)[h - 1]
+
+
+def fitFile(path, estimators, xcol=0, ycol=1, sep=None, seed=SEED):
+    '''
+    Reads a data file and fits it with each of the named estimators, and
+    returns a list of result dicts, one per estimator. The randomized
+    estimators are given the seed, which is reported in their 'seed'
+    entry. Errors are reported in the 'error' entry rather than raised, so
+    that one bad file doesn't stop a batch.
+    '''
+    start = time.time()
+    try:
+        x, y = parser.getXY(path, xcol, ycol, sep)
+        if x.size == 0:
+            raise ValueError('no rows could be read')
+    except Exception as e:
+        log.debug('Could not read %s', path, exc_info=True)
+        return [dict(file=path, estimator=name, error=str(e) or repr(e))
+                for name in estimators]
+    load_seconds = time.time() - start
+
+    rows = []
+    for name in estimators:
+        row = dict(file=path, estimator=name, n=x.size,
+                   load_seconds=load_seconds)
+        kwargs = {}
+        if ESTIMATORS[name].randomized:
+            kwargs['seed'] = row['seed'] = seed
+        start = time.time()
+        try:
+            alpha, beta = ESTIMATORS[name](x, y, **kwargs)[:2]
+            row.update(alpha=alpha, beta=beta,
+                       d_star=getMedianResidual(x, y, alpha, beta))
+        except Exception as e:
+            log.debug('Could not fit %s', path, exc_info=True)
+            row['error'] = str(e) or repr(e)
+        row['fit_seconds'] = time.time() - start
+        rows.append(row)
+    return rows
+
+
+def fitFileOutOfCore(path, estimators, xcol=0, ycol=1, sep=None,
+                     seed=SEED):
+    '''
+    Fits a data file in chunks, without reading it into memory, with
+    out_of_core.fitFile, and returns a list of result dicts like fitFile.
+    All of the estimators except least squares fit a random sample of the
+    points, drawn with the seed, and fit_seconds is the time taken by all
+    of them.
+    '''
+    try:
+        _alpha, _beta, result = out_of_core.fitFile(
+            path, xcol, ycol, sep, estimators, seed=seed, full_output=True)
+    except Exception as e:
+        log.debug('Could not fit %s', path, exc_info=True)
+        return [dict(file=path, estimator=name, error=str(e) or repr(e))
+                for name in estimators]
+    return [dict(file=path, estimator=c.key, n=result.n, alpha=c.alpha,
+                 beta=c.beta, d_star=c.d_star, seed=seed,
+                 fit_seconds=result.seconds)
+            for c in result.candidates]
+
+
+def _fitFile(args):
+    try:
+        if args[-1]:
+            return fitFileOutOfCore(*args[:-1])
+        return fitFile(*args[:-1])
+    except Exception:
+        # Anything else would be lost in the pool, so report it here
+        path, estimators = args[:2]
+        message = traceback.format_exc()
+        return [dict(file=path, estimator=name, error=message)
+                for name in estimators]
+
+
+def iterFits(paths, estimators, xcol=0, ycol=1, sep=None, processes=None,
+             out_of_core=False, seed=SEED):
+    '''
+    Fits each of the files with each of the named estimators, using a pool
+    of processes worker processes (one per core if None), and yields the
+    list of result dicts of each file in the order they complete. If
+    out_of_core is True, the files are fit with fitFileOutOfCore. Every
+    file is fit with the same seed, so the results don't depend on the
+    order the files are fit in.
+    '''
+    tasks = [(path, estimators, xcol, ycol, sep, seed, out_of_core)
+             for path in paths]
+    if processes is None:
+        processes = parallel.cpuCount()
+    processes = min(processes, len(tasks))
+    if processes <= 1:
+        for task in tasks:
+            yield _fitFile(task)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for rows in pool.imap_unordered(_fitFile, tasks):
+            yield rows
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class CSVWriter(object):
+
+    def __init__(self, f):
+        self.f = f
+        self.writer = csv.DictWriter(f, FIELDS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(dict((k, _format(v)) for k, v in
+                                  row.iteritems()))
+        self.f.flush()
+
+
+class JSONLinesWriter(object):
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, row):
+        self.f.write(json.dumps(dict((k, _format(v)) for k, v in
+                                     row.iteritems()), sort_keys=True))
+        self.f.write('\n')
+        self.f.flush()
+
+
+def _format(value):
+    if isinstance(value, numpy.generic):
+        return value.item()
+    return value
+
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(description='Fit lines to data '
+                                        'files without the GUI.')
+    argparser.add_argument('patterns', nargs='+', metavar='FILE',
+                           help='data files, or glob patterns of them')
+    argparser.add_argument('-e', '--estimators', nargs='+', default=['ls'],
+                           choices=sorted(ESTIMATORS), metavar='NAME',
+                           help='estimators to fit with: {} (default: ls)'
+                           ''.format(', '.join(sorted(ESTIMATORS))))
+    argparser.add_argument('-x', '--xcol', type=int, default=0)
+    argparser.add_argument('-y', '--ycol', type=int, default=1)
+    argparser.add_argument('--sep', default=None,
+                           help='column separator (default: sniffed)')
+    argparser.add_argument('-j', '--processes', type=int, default=None,
+                           help='number of worker processes (default: one '
+                           'per core)')
+    argparser.add_argument('--seed', type=int, default=SEED,
+                           help='seed of the randomized estimators, which '
+                           'is written to the output (default: {})'
+                           ''.format(SEED))
+    argparser.add_argument('--out-of-core', action='store_true',
+                           help='fit files that are too large for memory '
+                           'in chunks, fitting a random sample with all of '
+                           'the estimators but ls')
+    argparser.add_argument('-o', '--output', default='-',
+                           help='output file (default: stdout)')
+    argparser.add_argument('-f', '--format', choices=['csv', 'json'],
+                           default=None, help='output format (default: from '
+                           'the output file extension, or csv)')
+    argparser.add_argument('--debug', action='store_true')
+    args = argparser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else
+                        logging.WARNING)
+    paths = expandPaths(args.patterns)
+    if not paths:
+        return 1
+    output_format = args.format
+    if output_format is None:
+        output_format = ('json' if args.output.endswith(('.json', '.jsonl'))
+                         else 'csv')
+
+    if args.output == '-':
+        f = sys.stdout
+    else:
+        f = open(args.output, 'wb')
+    try:
+        writer = (JSONLinesWriter if output_format == 'json'
+                  else CSVWriter)(f)
+        failures = 0
+        for rows in iterFits(paths, args.estimators, args.xcol, args.ycol,
+                             args.sep, args.processes, args.out_of_core,
+                             args.seed):
+            for row in rows:
+                if row.get('error'):
+                    failures += 1
+                    log.warning('%s (%s): %s', row['file'], row['estimator'],
+                                row['error'].strip().splitlines()[-1])
+                writer.write(row)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
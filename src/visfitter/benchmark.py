@@ -0,0 +1,367 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Benchmarks the linear_regression estimators.
+
+Each estimator is timed on data sets like getRousseeuwData, with sizes
+from 10**2 to 10**6 points and several outlier fractions, in a fresh
+worker process, so that its peak memory can be measured too. Estimators
+are skipped for sizes above the largest they can fit in reasonable time.
+The fits of each data set are checked against a reference (the exact
+fit of the same objective), and the timings can be compared with a
+baseline from an earlier run to flag regressions:
+
+    python -m visfitter.benchmark --json before.json
+    python -m visfitter.benchmark --baseline before.json --csv after.csv
+'''
+
+# std lib imports
+import argparse
+import csv
+import json
+import multiprocessing
+import platform
+import sys
+import time
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# third party imports
+import numpy
+
+# local imports
+from . import linear_regression
+from .version import __version__
+
+
+class Estimator(object):
+    '''
+    An estimator to benchmark.
+
+    objective is 'ls', 'lms' or 'lts'. The fits of estimators with the same
+    objective are compared with the fit of the exact estimators, and must
+    agree to within rtol. max_size is the largest data set that is fit.
+    '''
+
+    def __init__(self, name, func, objective, exact=True, rtol=1e-9,
+                 max_size=None, **kwargs):
+        self.name = name
+        self.func = func
+        self.objective = objective
+        self.exact = exact
+        self.rtol = rtol
+        self.max_size = max_size
+        self.kwargs = kwargs
+
+    def __call__(self, x, y):
+        return self.func(x, y, **self.kwargs)[:2]
+
+
+ESTIMATORS = [
+    Estimator('leastSquares', linear_regression.leastSquares, 'ls'),
+    Estimator('leastMedianOfSquaresCrude',
+              linear_regression.leastMedianOfSquaresCrude, 'lms',
+              max_size=100),
+    Estimator('leastMedianOfSquares', linear_regression.leastMedianOfSquares,
+              'lms', max_size=1000),
+    Estimator('leastMedianOfSquaresSweep',
+              linear_regression.leastMedianOfSquaresSweep, 'lms',
+              max_size=1000),
+    Estimator('leastMedianOfSquaresRandom',
+              linear_regression.leastMedianOfSquaresRandom, 'lms',
+              exact=False, rtol=0.5, seed=0),
+    Estimator('leastTrimmedSquares', linear_regression.leastTrimmedSquares,
+              'lts', exact=False, seed=0),
+]
+
+SIZES = [10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]
+OUTLIER_FRACTIONS = [0., 0.2, 0.4]
+
+# Fields of the CSV output
+FIELDS = ['estimator', 'n', 'outlier_fraction', 'seed', 'repeats',
+          'min_seconds', 'median_seconds', 'peak_memory_mb', 'alpha',
+          'beta', 'objective', 'reference', 'agrees']
+
+
+def getData(n, outlier_fraction=0.4, seed=0):
+    '''
+    Returns x, y arrays of n points like getRousseeuwData: the inliers lie
+    near the line y = x + 2 for 1 <= x <= 4, and the outliers are clustered
+    around (7, 2).
+    '''
+    rng = numpy.random.RandomState(seed)
+    noutliers = int(round(n * outlier_fraction))
+    ninliers = n - noutliers
+    x = numpy.empty(n)
+    y = numpy.empty(n)
+    x[:ninliers] = rng.uniform(1, 4, ninliers)
+    y[:ninliers] = x[:ninliers] + 2 + rng.normal(0, 0.2, ninliers)
+    x[ninliers:] = rng.normal(7, 0.5, noutliers)
+    y[ninliers:] = rng.normal(2, 0.5, noutliers)
+    return x, y
+
+
+def getObjective(objective, x, y, alpha, beta):
+    '''
+    Returns the value of the objective, 'ls', 'lms' or 'lts', for the line
+    y = alpha + beta x.
+    '''
+    r = numpy.absolute(y - (alpha + beta * x))
+    if objective == 'ls':
+        return numpy.dot(r, r)
+    h = x.size // 2 + 1
+    r = numpy.partition(r, h - 1)
+    if objective == 'lts':
+        return numpy.dot(r[:h], r[:h])
+    return r[h - 1]
+
+
+def getPeakMemory():
+    '''
+    Returns the peak resident memory of this process in MB, or None if it
+    is unknown.
+    '''
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxrss / 2. ** 20  # bytes
+    return maxrss / 2. ** 10  # kilobytes
+
+
+def measure(name, n, outlier_fraction, seed=0, warmup=1, repeats=3):
+    '''
+    Times an estimator, and returns a dict of the results. The peak memory
+    is measured from after the data set is made, so this should be called
+    in a fresh process (see run).
+    '''
+    estimator = getEstimator(name)
+    x, y = getData(n, outlier_fraction, seed)
+    memory = getPeakMemory()
+    for _ in xrange(warmup):
+        estimator(x, y)
+    times = []
+    for _ in xrange(repeats):
+        start = time.time()
+        alpha, beta = estimator(x, y)
+        times.append(time.time() - start)
+    peak = getPeakMemory()
+    return dict(estimator=name, n=n, outlier_fraction=outlier_fraction,
+                seed=seed, repeats=repeats, min_seconds=min(times),
+                median_seconds=float(numpy.median(times)),
+                peak_memory_mb=(None if memory is None else peak - memory),
+                alpha=float(alpha), beta=float(beta),
+                objective=float(getObjective(estimator.objective, x, y,
+                                             alpha, beta)))
+
+
+def _measure(args):
+    return measure(*args)
+
+
+def getEstimator(name):
+    for estimator in ESTIMATORS:
+        if estimator.name == name:
+            return estimator
+    raise ValueError('unknown estimator: {}'.format(name))
+
+
+def run(names=None, sizes=SIZES, outlier_fractions=OUTLIER_FRACTIONS,
+        seed=0, warmup=1, repeats=3, log=None):
+    '''
+    Benchmarks the named estimators (all if None), and returns a list of
+    result dicts. Each measurement is made in a new worker process.
+    '''
+    if names is None:
+        names = [e.name for e in ESTIMATORS]
+    estimators = [getEstimator(name) for name in names]
+    results = []
+    for n in sizes:
+        for outlier_fraction in outlier_fractions:
+            group = []
+            for estimator in estimators:
+                if estimator.max_size is not None and n > estimator.max_size:
+                    continue
+                pool = multiprocessing.Pool(1, maxtasksperchild=1)
+                try:
+                    result = pool.apply(_measure, ((estimator.name, n,
+                                            outlier_fraction, seed, warmup,
+                                            repeats),))
+                finally:
+                    pool.terminate()
+                    pool.join()
+                group.append(result)
+            check(group)
+            if log is not None:
+                for result in group:
+                    log(formatResult(result))
+            results.extend(group)
+    return results
+
+
+def check(group):
+    '''
+    Sets the 'reference' and 'agrees' entries of the results of one data
+    set. The reference is the best objective found by an exact estimator
+    (or, for least squares, numpy.polyfit), and a fit agrees if its
+    objective is within the estimator's rtol of it. If there is no
+    reference, 'agrees' is None.
+    '''
+    if not group:
+        return
+    x, y = getData(group[0]['n'], group[0]['outlier_fraction'],
+                   group[0]['seed'])
+    references = {}
+    beta, alpha = numpy.polyfit(x, y, 1)
+    references['ls'] = getObjective('ls', x, y, alpha, beta)
+    for result in group:
+        estimator = getEstimator(result['estimator'])
+        if estimator.exact and estimator.objective != 'ls':
+            references[estimator.objective] = min(
+                references.get(estimator.objective, numpy.inf),
+                result['objective'])
+    for result in group:
+        estimator = getEstimator(result['estimator'])
+        reference = references.get(estimator.objective)
+        result['reference'] = reference
+        if reference is None:
+            result['agrees'] = None
+        else:
+            result['agrees'] = bool(result['objective'] <=
+                                    reference * (1 + estimator.rtol) + 1e-12)
+
+
+def compare(results, baseline, threshold=0.25, noise=1e-3):
+    '''
+    Returns the results that are slower than the same benchmark in the
+    baseline results by more than the threshold fraction (and by more than
+    noise seconds), as a list of (result, baseline_result) pairs.
+    '''
+    def key(result):
+        return (result['estimator'], result['n'], result['outlier_fraction'])
+    before = dict((key(result), result) for result in baseline)
+    regressions = []
+    for result in results:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        new_time = result['median_seconds']
+        old_time = old['median_seconds']
+        if (new_time > old_time * (1 + threshold) and
+                new_time - old_time > noise):
+            regressions.append((result, old))
+    return regressions
+
+
+def formatResult(result):
+    memory = result['peak_memory_mb']
+    return ('{estimator:<28} n={n:<8} outliers={outlier_fraction:<4} '
+            '{median_seconds:10.4f} s {memory:>9} MB  {status}'
+            ''.format(memory=('?' if memory is None
+                              else '{:.1f}'.format(memory)),
+                      status={True: 'ok', False: 'DISAGREES',
+                              None: '-'}[result.get('agrees')],
+                      **result))
+
+
+def writeJSON(path, results):
+    info = dict(version=__version__, python=platform.python_version(),
+                numpy=numpy.__version__, platform=platform.platform(),
+                time=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    with open(path, 'w') as f:
+        json.dump(dict(info=info, results=results), f, indent=1)
+
+
+def readJSON(path):
+    with open(path, 'r') as f:
+        return json.load(f)['results']
+
+
+def writeCSV(path, results):
+    with open(path, 'wb') as f:
+        writer = csv.DictWriter(f, FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the '
+                                     'linear_regression estimators.')
+    parser.add_argument('--estimators', nargs='+', metavar='NAME',
+                        choices=[e.name for e in ESTIMATORS],
+                        help='estimators to benchmark (default: all)')
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES,
+                        metavar='N')
+    parser.add_argument('--outlier-fractions', nargs='+', type=float,
+                        default=OUTLIER_FRACTIONS, metavar='F')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--json', metavar='PATH',
+                        help='write the results to a JSON file')
+    parser.add_argument('--csv', metavar='PATH',
+                        help='write the results to a CSV file')
+    parser.add_argument('--baseline', metavar='PATH',
+                        help='flag regressions against the results in a '
+                        'JSON file from an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='fractional slowdown that counts as a '
+                        'regression (default: 0.25)')
+    args = parser.parse_args(argv)
+
+    def log(line):
+        print line
+        sys.stdout.flush()
+    results = run(args.estimators, args.sizes, args.outlier_fractions,
+                  args.seed, args.warmup, args.repeats, log)
+    if args.json:
+        writeJSON(args.json, results)
+    if args.csv:
+        writeCSV(args.csv, results)
+
+    status = 0
+    disagreements = [r for r in results if r['agrees'] is False]
+    if disagreements:
+        status = 1
+        print
+        print 'Fits that disagree with the reference:'
+        for result in disagreements:
+            print '  {estimator} n={n} outliers={outlier_fraction}: ' \
+                  '{objective:g} vs {reference:g}'.format(**result)
+    if args.baseline:
+        regressions = compare(results, readJSON(args.baseline),
+                              args.threshold)
+        if regressions:
+            status = 1
+            print
+            print 'Regressions against {}:'.format(args.baseline)
+            for result, old in regressions:
+                print '  {estimator} n={n} outliers={outlier_fraction}: ' \
+                      '{new:.4f} s vs {old:.4f} s'.format(
+                          new=result['median_seconds'],
+                          old=old['median_seconds'], **result)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
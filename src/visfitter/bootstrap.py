@@ -0,0 +1,198 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Bootstrap confidence intervals and bands for the line estimators.
+
+Any estimator of linear_regression, func(x, y, **kwargs) -> alpha, beta,
+..., is refit to resamples of the points drawn with replacement, and the
+spread of the refit lines gives percentile confidence intervals for alpha
+and beta, and a pointwise confidence band for the line:
+
+    result = bootstrap(linear_regression.leastMedianOfSquaresRandom, x, y)
+    (alpha_low, alpha_high), (beta_low, beta_high) = result.intervals()
+    lower, upper = result.band(numpy.linspace(0, 10, 100))
+'''
+
+# std lib imports
+import time
+import logging
+log = logging.getLogger(__name__)
+
+# third party imports
+import numpy
+
+# local imports
+from . import parallel
+from .linear_regression import _report, applyMask
+
+# The most resample indices that are drawn at once
+INDEX_CHUNK_SIZE = 2 ** 22
+
+# The default number of batches of resamples
+BATCHES = 32
+
+
+class BootstrapResult(object):
+    '''
+    The lines fit to the resamples of a bootstrap.
+
+    alpha and beta are arrays of the intercepts and slopes of the resamples
+    that have been fit so far, in the order of the resamples, and
+    resamples is the number that were asked for. Resamples that the
+    estimator failed to fit, e.g. because all of their points have the same
+    x, are counted in failures, and left out.
+    '''
+
+    def __init__(self, alpha, beta, resamples, failures=0):
+        self.alpha = alpha
+        self.beta = beta
+        self.resamples = resamples
+        self.failures = failures
+
+    @property
+    def done(self):
+        return self.alpha.size + self.failures
+
+    def intervals(self, confidence=0.95):
+        '''
+        Returns the percentile confidence intervals of alpha and beta,
+        ((alpha_low, alpha_high), (beta_low, beta_high)), or NaNs if no
+        resample has been fit.
+        '''
+        q = _percentiles(confidence)
+        if self.alpha.size == 0:
+            return (numpy.nan, numpy.nan), (numpy.nan, numpy.nan)
+        return (tuple(numpy.percentile(self.alpha, q)),
+                tuple(numpy.percentile(self.beta, q)))
+
+    def band(self, x, confidence=0.95):
+        '''
+        Returns the pointwise percentile confidence band of the line at x,
+        as arrays (lower, upper) shaped like x.
+        '''
+        x = numpy.asarray(x, dtype=numpy.float64)
+        if self.alpha.size == 0:
+            nan = numpy.full(x.shape, numpy.nan)
+            return nan, nan.copy()
+        lines = self.alpha[:, None] + self.beta[:, None] * x.ravel()
+        lower, upper = numpy.percentile(lines, _percentiles(confidence),
+                                        axis=0)
+        return lower.reshape(x.shape), upper.reshape(x.shape)
+
+
+def _percentiles(confidence):
+    tail = 50. * (1 - confidence)
+    return [tail, 100. - tail]
+
+
+def bootstrap(func, x, y, resamples=200, seed=None, processes=None,
+              batch_size=None, mask=None, callback=None, update=None,
+              **kwargs):
+    '''
+    Fits func(x[i], y[i], **kwargs) for resamples random index arrays, i,
+    of n indices drawn with replacement, and returns a BootstrapResult.
+    The points that are masked out (see linear_regression.applyMask) are
+    left out before resampling.
+
+    The resamples are fit in batches of batch_size by a pool of processes
+    worker processes (one per core if None; 1 fits them in this process),
+    which map x and y from shared memory (see parallel.imapShared). Each
+    batch draws its index arrays at once from its own seed, which is drawn
+    from seed, so the result doesn't depend on the number of processes or
+    the order the batches finish in. By default, the resamples are split
+    into BATCHES batches, so that the work is balanced and progress can be
+    shown.
+
+    After each batch, the progress callback is called (see
+    linear_regression.FitCancelled), and update, if given, is called with a
+    BootstrapResult of the resamples that are done so far, e.g. to draw the
+    band as it converges.
+    '''
+    start_time = time.time()
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    x, y = applyMask(x, y, mask)
+    if x.size < 2:
+        raise ValueError('at least 2 points are needed to bootstrap a fit')
+    if processes is None:
+        processes = parallel.cpuCount()
+    processes = max(1, min(processes, resamples))
+    if batch_size is None:
+        batch_size = max(1, -(-resamples // BATCHES))
+    rng = numpy.random.RandomState(seed)
+    tasks = []
+    for first in xrange(0, resamples, batch_size):
+        count = min(batch_size, resamples - first)
+        tasks.append((func, first, count, rng.randint(2 ** 31), kwargs))
+
+    alpha = numpy.full(resamples, numpy.nan)
+    beta = numpy.full(resamples, numpy.nan)
+    done = 0
+    _report(callback, 0.)
+    if processes == 1:
+        results = (_fitResamples(x, y, *task) for task in tasks)
+    else:
+        results = parallel.imapShared(_fitResamples, x, y, tasks, processes)
+    for first, batch_alpha, batch_beta in results:
+        alpha[first:first + batch_alpha.size] = batch_alpha
+        beta[first:first + batch_beta.size] = batch_beta
+        done += batch_alpha.size
+        if update is not None:
+            update(_result(alpha, beta, done, resamples))
+        _report(callback, float(done) / resamples)
+
+    result = _result(alpha, beta, done, resamples)
+    log.debug('bootstrap: %s, %d resamples (%d failed) in %.3f s',
+              func.__name__, resamples, result.failures,
+              time.time() - start_time)
+    return result
+
+
+def _result(alpha, beta, done, resamples):
+    '''
+    Returns the BootstrapResult of the resamples that are done, which are
+    the entries of alpha and beta that aren't NaN, and the failures.
+    '''
+    fit = ~numpy.isnan(alpha)
+    return BootstrapResult(alpha[fit], beta[fit], resamples,
+                           done - numpy.count_nonzero(fit))
+
+
+def _fitResamples(x, y, func, first, count, seed, kwargs):
+    '''
+    Fits count resamples of x, y with func, and returns first and the
+    arrays of their alpha and beta, with NaNs for the resamples that
+    couldn't be fit.
+    '''
+    n = x.size
+    rng = numpy.random.RandomState(seed)
+    alpha = numpy.full(count, numpy.nan)
+    beta = numpy.full(count, numpy.nan)
+    rows = max(1, INDEX_CHUNK_SIZE // n)
+    for start in xrange(0, count, rows):
+        indices = rng.randint(n, size=(min(rows, count - start), n))
+        for i, index in enumerate(indices, start):
+            try:
+                alpha[i], beta[i] = func(x[index], y[index], **kwargs)[:2]
+            except ValueError:
+                log.debug('bootstrap: could not fit a resample',
+                          exc_info=True)
+    return first, alpha, beta
@@ -0,0 +1,105 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# third party imports
+from PySide import QtGui, QtCore
+
+
+class ColumnsDialog(QtGui.QDialog):
+    '''
+    Asks which columns of a data file hold x and y, how the columns are
+    separated, and, for multiple regression, which other columns are
+    regressors and which column, if any, holds weights or uncertainties.
+    '''
+
+    # (label, sep) pairs; a sep of None uses the parser's default, which is
+    # whitespace or a separator sniffed from the start of the file
+    separators = [('Auto', None),
+                  ('Comma', ','),
+                  ('Tab', '\t'),
+                  ('Semicolon', ';')]
+
+    def __init__(self, xcol=0, ycol=1, sep=None, regressors=(), wcol=None,
+                 sigma=False, parent=None):
+        super(ColumnsDialog, self).__init__(parent)
+        self.setWindowTitle('Columns')
+
+        self.xcolSpinBox = QtGui.QSpinBox()
+        self.xcolSpinBox.setRange(0, 999)
+        self.xcolSpinBox.setValue(xcol)
+        self.ycolSpinBox = QtGui.QSpinBox()
+        self.ycolSpinBox.setRange(0, 999)
+        self.ycolSpinBox.setValue(ycol)
+        self.sepComboBox = QtGui.QComboBox()
+        for label, _sep in self.separators:
+            self.sepComboBox.addItem(label)
+        seps = [s for _label, s in self.separators]
+        if sep in seps:
+            self.sepComboBox.setCurrentIndex(seps.index(sep))
+        self.regressorsLineEdit = QtGui.QLineEdit(
+            ', '.join(str(col) for col in regressors))
+        self.regressorsLineEdit.setPlaceholderText('e.g. 2, 3')
+        self.regressorsLineEdit.setToolTip('Columns used as regressors '
+                                           'besides x by the multiple '
+                                           'regression fits')
+        self.regressorsLineEdit.setValidator(QtGui.QRegExpValidator(
+            QtCore.QRegExp(r'[0-9,\s]*'), self))
+        # -1 is shown as 'None'
+        self.wcolSpinBox = QtGui.QSpinBox()
+        self.wcolSpinBox.setRange(-1, 999)
+        self.wcolSpinBox.setSpecialValueText('None')
+        self.wcolSpinBox.setValue(-1 if wcol is None else wcol)
+        self.sigmaCheckBox = QtGui.QCheckBox('Column holds uncertainties '
+                                             '(weight = 1 / sigma**2)')
+        self.sigmaCheckBox.setChecked(sigma)
+
+        buttons = QtGui.QDialogButtonBox(QtGui.QDialogButtonBox.Ok |
+                                         QtGui.QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QtGui.QFormLayout(self)
+        layout.addRow('X column:', self.xcolSpinBox)
+        layout.addRow('Y column:', self.ycolSpinBox)
+        layout.addRow('Separator:', self.sepComboBox)
+        layout.addRow('Other regressors:', self.regressorsLineEdit)
+        layout.addRow('Weight column:', self.wcolSpinBox)
+        layout.addRow('', self.sigmaCheckBox)
+        layout.addRow(buttons)
+
+    def getColumns(self):
+        '''
+        Returns xcol, ycol, sep.
+        '''
+        sep = self.separators[self.sepComboBox.currentIndex()][1]
+        return self.xcolSpinBox.value(), self.ycolSpinBox.value(), sep
+
+    def getRegressors(self):
+        '''
+        Returns regressors, wcol, sigma, where regressors is a list of the
+        other regressor columns, wcol is the weight column or None, and
+        sigma is True if it holds uncertainties rather than weights.
+        '''
+        text = self.regressorsLineEdit.text().replace(',', ' ')
+        regressors = [int(col) for col in text.split()]
+        wcol = self.wcolSpinBox.value()
+        return (regressors, None if wcol < 0 else wcol,
+                self.sigmaCheckBox.isChecked())
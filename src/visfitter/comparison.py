@@ -0,0 +1,156 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Fits a data set with several line estimators at once, to compare them.
+
+The estimators of the linear_regression registry are run concurrently by
+a pool of worker processes, which map x and y from shared memory (see
+parallel.imapShared), and a ComparisonRow is reported for each as soon as
+it finishes:
+
+    rows = compareEstimators(x, y, ['ls', 'lms', 'lts'],
+                             update=lambda rows: show(rows[-1]))
+'''
+
+# std lib imports
+import time
+import traceback
+import logging
+log = logging.getLogger(__name__)
+
+# third party imports
+import numpy
+
+# local imports
+from . import parallel
+from .diagnostics import getResiduals, robustScale
+from .linear_regression import ESTIMATORS, _report, applyMask
+
+
+class ComparisonRow(object):
+    '''
+    The fit of one estimator in a comparison.
+
+    key and name are those of the registry entry, and result is what the
+    estimator returned, with alpha and beta its line. d_star is the h-th
+    smallest absolute residual, h = n // 2 + 1, and scale the robust scale
+    of the residuals (see diagnostics.robustScale), of the points in the
+    fit, so that the fits can be compared on the same footing. seconds is
+    the wall time of the fit. If the fit failed, error holds the traceback,
+    and the other values are None.
+    '''
+
+    def __init__(self, key, name, result=None, d_star=None, scale=None,
+                 seconds=None, error=None):
+        self.key = key
+        self.name = name
+        self.result = result
+        self.d_star = d_star
+        self.scale = scale
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def alpha(self):
+        return None if self.result is None else self.result[0]
+
+    @property
+    def beta(self):
+        return None if self.result is None else self.result[1]
+
+
+def compareEstimators(x, y, keys=None, processes=None, mask=None,
+                      callback=None, update=None):
+    '''
+    Fits x, y with each of the line estimators of the registry named in
+    keys (all of them if None), and returns a list of ComparisonRows in the
+    order the fits finished.
+
+    The fits are run by a pool of processes worker processes (one per
+    core, but no more than there are estimators, if None; 1 fits them in
+    this process), each fit in a single process, and the slowest fits (by
+    their CostModels) are started first. The points that are masked out
+    (see linear_regression.applyMask) are left out of every fit.
+
+    After each fit, the progress callback is called with the fraction of
+    the estimators that are done (see linear_regression.FitCancelled), and
+    update, if given, is called with the list of the rows so far. Fits
+    that are running when the comparison is cancelled are abandoned.
+    '''
+    start = time.time()
+    if keys is None:
+        keys = [key for key, estimator in ESTIMATORS.iteritems()
+                if not estimator.multiple]
+    for key in keys:
+        if ESTIMATORS[key].multiple:
+            raise ValueError('{} is not a line estimator'.format(key))
+    if mask is not None:
+        mask = numpy.asarray(mask, dtype=bool)
+    n = x.size if mask is None else numpy.count_nonzero(mask)
+    keys = sorted(keys, key=lambda key: -ESTIMATORS[key].estimateSeconds(n))
+    tasks = [(key, mask) for key in keys]
+    if processes is None:
+        processes = parallel.cpuCount()
+    processes = max(1, min(processes, len(tasks)))
+
+    rows = []
+    _report(callback, 0.)
+    if processes == 1:
+        results = (_fitEstimator(x, y, *task) for task in tasks)
+    else:
+        results = parallel.imapShared(_fitEstimator, x, y, tasks, processes)
+    try:
+        for row in results:
+            rows.append(row)
+            if update is not None:
+                update(list(rows))
+            _report(callback, float(len(rows)) / len(tasks))
+    finally:
+        # Stops the pool, if the comparison was cancelled
+        results.close()
+    log.debug('compareEstimators: %d estimators on %d processes in %.3f s',
+              len(rows), processes, time.time() - start)
+    return rows
+
+
+def _fitEstimator(x, y, key, mask):
+    '''
+    Fits x, y with the registered estimator key, and returns its
+    ComparisonRow.
+    '''
+    estimator = ESTIMATORS[key]
+    x, y = applyMask(x, y, mask)
+    start = time.time()
+    try:
+        result = estimator(x, y)
+        seconds = time.time() - start
+        residuals, p = getResiduals(result, x, y)
+        scale = robustScale(residuals, p)
+        r = numpy.absolute(residuals)
+        h = r.size // 2 + 1
+        r.partition(h - 1)
+        d_star = r[h - 1]
+    except Exception:
+        log.debug('Could not fit with %s', key, exc_info=True)
+        return ComparisonRow(key, estimator.name,
+                             seconds=time.time() - start,
+                             error=traceback.format_exc())
+    return ComparisonRow(key, estimator.name, result, d_star, scale, seconds)
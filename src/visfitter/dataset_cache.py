@@ -0,0 +1,233 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import os
+import json
+import glob
+import time
+import hashlib
+import logging
+log = logging.getLogger(__name__)
+
+# third party imports
+import numpy
+
+# local imports
+from . import parser
+
+# Bump this whenever the layout of the cache files changes
+CACHE_VERSION = 1
+
+# The number of bytes at each end of the source file that are hashed
+FINGERPRINT_BYTES = 2 ** 16
+
+# The default limit on the total size of the copies in the cache directory
+MAX_BYTES = 2 ** 31
+
+
+def getDefaultCacheDir():
+    return os.path.join(os.path.expanduser('~'), '.cache', 'visfitter',
+                        'datasets')
+
+
+def getColumns(filepath, cols, sep=None, cache_dir=None, full_output=False,
+               max_bytes=MAX_BYTES):
+    '''
+    Reads the columns with the indices in cols from a data file like
+    parser.getColumns, but keeps a binary copy of the columns in cache_dir
+    (getDefaultCacheDir() if None). The copy is a .npy file holding a
+    (len(cols), n) float64 array, so the columns are returned as
+    contiguous, read-only memory maps, and reopening the file doesn't parse
+    it again. Files whose parser isn't cacheable (e.g. NumPy files, which
+    are memory mapped already) are read directly.
+
+    The copy is used as long as the size, modification time and
+    fingerprint (a hash of the first and last FINGERPRINT_BYTES bytes) of
+    the source file are unchanged. Otherwise, the file is parsed again and
+    the copy is replaced. After a copy is written, the least recently used
+    copies of other files are deleted until the cache directory is no
+    larger than max_bytes.
+
+    If full_output is True, the info dict of parser.getColumns is returned
+    as well, with 'cached' set to True if the copy was used.
+    '''
+    start = time.time()
+    cols = list(cols)
+    if not parser.getParserClass(filepath).cacheable:
+        columns, info = parser.getColumns(filepath, cols, sep,
+                                          full_output=True)
+        info['cached'] = False
+        return (columns, info) if full_output else columns
+    if cache_dir is None:
+        cache_dir = getDefaultCacheDir()
+    filepath = os.path.abspath(filepath)
+    key = hashlib.sha1(json.dumps([filepath] + cols + [sep])).hexdigest()
+    data_path = os.path.join(cache_dir, key + '.npy')
+    meta_path = os.path.join(cache_dir, key + '.json')
+    source = _describe(filepath)
+
+    meta = _readMeta(meta_path)
+    if (meta is not None and meta.get('source') == source and
+            os.path.exists(data_path)):
+        try:
+            data = numpy.load(data_path, mmap_mode='r')
+        except (IOError, ValueError):
+            log.warning('Could not read the cached copy of %s', filepath)
+        else:
+            try:
+                os.utime(data_path, None)  # mark it as recently used
+            except OSError:
+                pass
+            seconds = time.time() - start
+            log.info('Opened the cached copy of %s in %.3f s', filepath,
+                     seconds)
+            columns = list(data)
+            if full_output:
+                info = dict(meta['info'], cached=True, seconds=seconds)
+                return columns, info
+            return columns
+
+    columns, info = parser.getColumns(filepath, cols, sep, full_output=True)
+    try:
+        _write(data_path, meta_path, columns,
+               dict(version=CACHE_VERSION, source=source, info=info))
+        columns = list(numpy.load(data_path, mmap_mode='r'))
+    except (IOError, OSError):
+        log.warning('Could not cache %s in %s', filepath, cache_dir,
+                    exc_info=True)
+    else:
+        _evict(cache_dir, max_bytes, keep=key)
+    if full_output:
+        info['cached'] = False
+        return columns, info
+    return columns
+
+
+def getXY(filepath, xcol=0, ycol=1, sep=None, cache_dir=None,
+          full_output=False, max_bytes=MAX_BYTES):
+    '''
+    Reads the xcol and ycol columns of a data file like parser.getXY,
+    keeping a binary copy of them as getColumns does.
+
+    If full_output is True, the info dict of getColumns is returned as
+    well.
+    '''
+    (x, y), info = getColumns(filepath, (xcol, ycol), sep, cache_dir,
+                              full_output=True, max_bytes=max_bytes)
+    if full_output:
+        return x, y, info
+    return x, y
+
+
+def _describe(filepath):
+    '''
+    Returns a description of the file, which changes whenever it is
+    modified.
+    '''
+    stat = os.stat(filepath)
+    sha1 = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        sha1.update(f.read(FINGERPRINT_BYTES))
+        if stat.st_size > FINGERPRINT_BYTES:
+            f.seek(max(stat.st_size - FINGERPRINT_BYTES, FINGERPRINT_BYTES))
+            sha1.update(f.read(FINGERPRINT_BYTES))
+    return dict(size=stat.st_size, mtime=stat.st_mtime,
+                fingerprint=sha1.hexdigest())
+
+
+def _readMeta(meta_path):
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if meta.get('version') != CACHE_VERSION:
+        return None
+    return meta
+
+
+def _write(data_path, meta_path, columns, meta):
+    '''
+    Writes the cache files, replacing any old ones. The data is written to
+    a temporary file first, so that a partly written copy is never used.
+    '''
+    cache_dir = os.path.dirname(data_path)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    tmp_path = data_path + '.tmp'
+    size = columns[0].size if columns else 0
+    try:
+        data = numpy.lib.format.open_memmap(tmp_path, mode='w+',
+                                            dtype=numpy.float64,
+                                            shape=(len(columns), size))
+        for i, column in enumerate(columns):
+            data[i] = column
+        data.flush()
+        del data
+        _replace(tmp_path, data_path)
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        _replace(tmp_path, meta_path)
+    except (IOError, OSError):
+        _remove(tmp_path)
+        raise
+
+
+def _replace(src, dst):
+    if os.name == 'nt' and os.path.exists(dst):
+        os.remove(dst)  # rename doesn't overwrite on Windows
+    os.rename(src, dst)
+
+
+def _evict(cache_dir, max_bytes, keep):
+    '''
+    Deletes the least recently used copies, other than the one with the
+    key keep, until the directory is no larger than max_bytes. A copy's
+    .npy and .json files are deleted together.
+    '''
+    copies = {}
+    for path in (glob.glob(os.path.join(cache_dir, '*.npy')) +
+                 glob.glob(os.path.join(cache_dir, '*.json'))):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        key = os.path.splitext(os.path.basename(path))[0]
+        mtime, size, paths = copies.get(key, (0, 0, []))
+        copies[key] = (max(mtime, stat.st_mtime), size + stat.st_size,
+                       paths + [path])
+    total = sum(size for _mtime, size, _paths in copies.itervalues())
+    for _mtime, size, paths in sorted(v for k, v in copies.iteritems()
+                                      if k != keep):
+        if total <= max_bytes:
+            break
+        for path in paths:
+            _remove(path)
+        total -= size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,148 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Residual diagnostics of a fit: the residuals, a robust estimate of their
+scale, the standardized residuals and the outlier flags of every point,
+each computed with a few whole-array numpy operations, in O(n) time.
+'''
+
+# std lib imports
+import math
+import time
+import logging
+log = logging.getLogger(__name__)
+
+# third party imports
+import numpy
+
+# Points with standardized residuals larger than this are outliers
+CUTOFF = 2.5
+
+
+class Diagnostics(object):
+    '''
+    The residual diagnostics of a fit, for all of the points of the data
+    set, including any that were masked out of the fit.
+
+    residuals: y minus the fitted values, times the square roots of the
+        weights, if the fit was weighted
+    scale: the robust scale of the residuals of the points in the fit (see
+        robustScale)
+    standardized: the residuals divided by scale
+    outliers: True for the points whose standardized residuals are larger
+        than cutoff in magnitude
+
+    The fit result and the mask they were computed for are kept, so that
+    they can be cached with the fit and recomputed only when it changes.
+    '''
+
+    def __init__(self, result, mask, residuals, scale, cutoff=CUTOFF):
+        self.result = result
+        self.mask = mask
+        self.residuals = residuals
+        self.scale = scale
+        self.cutoff = cutoff
+        if scale > 0:
+            self.standardized = residuals / scale
+        else:
+            # A perfect fit; only points off the line are outliers
+            self.standardized = numpy.where(residuals == 0, 0.,
+                                            numpy.copysign(numpy.inf,
+                                                           residuals))
+        self.outliers = numpy.absolute(self.standardized) > cutoff
+        self.outlierCount = numpy.count_nonzero(self.outliers)
+
+    def __str__(self):
+        return 'scale = {:g}, {} of {} points outside {:g} scales'.format(
+            self.scale, self.outlierCount, self.residuals.size, self.cutoff)
+
+
+def getResiduals(result, x, y, regressors=None, weights=None):
+    '''
+    Returns the residuals of a fit result, and the number of coefficients
+    fit. The estimators of linear_regression return alpha, beta, ..., and
+    those of multiple_regression return an array of coefficients, the
+    intercept followed by those of the columns of regressors, which must
+    then be given.
+    '''
+    if isinstance(result, numpy.ndarray):
+        if regressors is None:
+            raise ValueError('the regressors of a multiple regression are '
+                             'needed')
+        r = regressors.dot(result[1:])
+        r += result[0]
+        p = result.size
+    else:
+        alpha, beta = result[:2]
+        r = beta * numpy.asarray(x, dtype=numpy.float64)
+        r += alpha
+        p = 2
+    numpy.subtract(y, r, out=r)
+    if weights is not None:
+        r *= numpy.sqrt(weights)
+    return r, p
+
+
+def robustScale(residuals, p=2, cutoff=CUTOFF):
+    '''
+    Returns the robust scale estimate of Rousseeuw and Leroy [1] of the
+    residuals of a fit of p coefficients. The preliminary scale,
+
+        s0 = 1.4826 (1 + 5 / (n - p)) sqrt(median(residuals**2)),
+
+    is consistent for normal errors, and corrected for small samples. The
+    final scale is the root mean square of the residuals within cutoff * s0,
+    with p degrees of freedom subtracted, so outliers don't inflate it.
+
+    [1] P. J. Rousseeuw and A. M. Leroy, Robust Regression and Outlier
+    Detection. New York: Wiley, 1987, ch. 5.
+    '''
+    n = residuals.size
+    if n <= p:
+        raise ValueError('more than {} points are needed to estimate the '
+                         'scale'.format(p))
+    r2 = residuals * residuals
+    # The median is selected in place, which only reorders r2
+    s0 = (1.4826 * (1 + 5. / (n - p)) *
+          math.sqrt(numpy.median(r2, overwrite_input=True)))
+    if s0 == 0:
+        return 0.
+    inside = r2[r2 <= (cutoff * s0) ** 2]
+    if inside.size <= p:
+        return s0
+    return math.sqrt(inside.sum() / (inside.size - p))
+
+
+def getDiagnostics(result, x, y, regressors=None, weights=None, mask=None,
+                   cutoff=CUTOFF):
+    '''
+    Returns the Diagnostics of a fit result of x, y (see getResiduals). The
+    scale is estimated from the points where mask is True, if it is given,
+    but every point is flagged.
+    '''
+    start = time.time()
+    residuals, p = getResiduals(result, x, y, regressors, weights)
+    included = residuals if mask is None else residuals[mask]
+    scale = robustScale(included, p, cutoff)
+    diagnostics = Diagnostics(result, mask, residuals, scale, cutoff)
+    log.debug('getDiagnostics: %s in %.3f s', diagnostics,
+              time.time() - start)
+    return diagnostics
@@ -0,0 +1,64 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# third party imports
+from PySide import QtGui, QtCore
+
+
+class EstimatorsDialog(QtGui.QDialog):
+    '''
+    Asks which estimators to compare, from a list of (key, text, checked)
+    items, one per estimator.
+    '''
+
+    def __init__(self, items, parent=None):
+        super(EstimatorsDialog, self).__init__(parent)
+        self.setWindowTitle('Fit All')
+
+        self.listWidget = QtGui.QListWidget()
+        for key, text, checked in items:
+            item = QtGui.QListWidgetItem(text, self.listWidget)
+            item.setData(QtCore.Qt.UserRole, key)
+            item.setFlags(item.flags() | QtCore.Qt.ItemIsUserCheckable)
+            item.setCheckState(QtCore.Qt.Checked if checked
+                               else QtCore.Qt.Unchecked)
+
+        buttons = QtGui.QDialogButtonBox(QtGui.QDialogButtonBox.Ok |
+                                         QtGui.QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QtGui.QVBoxLayout(self)
+        layout.addWidget(QtGui.QLabel('Estimators to fit with:'))
+        layout.addWidget(self.listWidget)
+        layout.addWidget(buttons)
+
+    def getKeys(self):
+        '''
+        Returns the keys of the checked estimators, in the order they are
+        listed.
+        '''
+        keys = []
+        for i in range(self.listWidget.count()):
+            item = self.listWidget.item(i)
+            if item.checkState() == QtCore.Qt.Checked:
+                keys.append(item.data(QtCore.Qt.UserRole))
+        return keys
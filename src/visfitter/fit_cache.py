@@ -0,0 +1,222 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import os
+import json
+import glob
+import hashlib
+import collections
+import cPickle as pickle
+import logging
+log = logging.getLogger(__name__)
+
+# third party imports
+import numpy
+
+# local imports
+from .version import __version__
+
+# Bump this whenever the layout of the cache files changes
+CACHE_VERSION = 1
+
+# Estimator and FitJob arguments that don't change the result
+IGNORED_KWARGS = frozenset(['callback', 'stats', 'processes', 'cancellable'])
+
+# The number of bytes hashed at a time
+HASH_CHUNK_BYTES = 2 ** 24
+
+
+def getDefaultCacheDir():
+    return os.path.join(os.path.expanduser('~'), '.cache', 'visfitter',
+                        'fits')
+
+
+def hashData(*arrays):
+    '''
+    Returns a hex digest of the contents of the arrays, e.g. x and y. MD5 is
+    used because it is about three times as fast as SHA-1 here, and the
+    digest only has to tell data sets apart, not resist tampering.
+    '''
+    md5 = hashlib.md5()
+    for a in arrays:
+        a = numpy.ascontiguousarray(a, dtype=numpy.float64)
+        md5.update(str(a.shape))
+        a = a.ravel()
+        step = HASH_CHUNK_BYTES // a.itemsize
+        for i in xrange(0, a.size, step):
+            md5.update(a[i:i + step])
+    return md5.hexdigest()
+
+
+def getKey(func, data_hash, kwargs):
+    '''
+    Returns the cache key of the fit func(x, y, **kwargs), where data_hash
+    is hashData(x, y), or None if the result shouldn't be cached. Fits with
+    a time budget aren't cached, since their results depend on the speed
+    of the machine. Array arguments, such as weights, are keyed by their
+    hashData.
+    '''
+    if kwargs.get('time_budget') is not None:
+        return None
+    params = dict((k, v) for k, v in kwargs.iteritems()
+                  if k not in IGNORED_KWARGS)
+    name = '{}.{}'.format(func.__module__, func.__name__)
+    description = json.dumps([CACHE_VERSION, __version__, name, data_hash,
+                              params], sort_keys=True, default=_describe)
+    return hashlib.sha1(description).hexdigest()
+
+
+def _describe(value):
+    if isinstance(value, numpy.ndarray):
+        return 'array ' + hashData(value)
+    return repr(value)
+
+
+class FitCache(object):
+    '''
+    Memoizes the results of fits.
+
+    Results are kept in memory for the max_entries most recently used
+    fits. If cache_dir is given, they are also pickled to it, so that they
+    survive restarts, and the least recently used files are deleted when
+    the total size of the directory exceeds max_bytes.
+    '''
+
+    def __init__(self, max_entries=256, cache_dir=None, max_bytes=2 ** 26):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._memory = collections.OrderedDict()
+
+    def get(self, key):
+        '''
+        Returns the result stored under key, or None if there isn't one.
+        '''
+        if key is None:
+            return None
+        try:
+            result = self._memory.pop(key)
+        except KeyError:
+            result = self._read(key)
+            if result is None:
+                return None
+        self._remember(key, result)
+        return result
+
+    def put(self, key, result):
+        if key is None:
+            return
+        self._remember(key, result)
+        if self.cache_dir is not None:
+            try:
+                self._write(key, result)
+            except (IOError, OSError, pickle.PicklingError):
+                log.warning('Could not cache a fit in %s', self.cache_dir,
+                            exc_info=True)
+
+    def call(self, func, x, y, data_hash=None, **kwargs):
+        '''
+        Returns func(x, y, **kwargs), from the cache if possible. Pass
+        data_hash = hashData(x, y) to avoid hashing x and y again.
+        '''
+        if data_hash is None:
+            data_hash = hashData(x, y)
+        key = getKey(func, data_hash, kwargs)
+        result = self.get(key)
+        if result is None:
+            result = func(x, y, **kwargs)
+            self.put(key, result)
+        return result
+
+    def clear(self):
+        self._memory.clear()
+        if self.cache_dir is not None:
+            for path in self._paths():
+                _remove(path)
+
+    def _remember(self, key, result):
+        self._memory[key] = result
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.pickle')
+
+    def _paths(self):
+        return glob.glob(os.path.join(self.cache_dir, '*.pickle'))
+
+    def _read(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+        except IOError:
+            return None
+        except Exception:
+            log.warning('Removing unreadable cached fit %s', path)
+            _remove(path)
+            return None
+        try:
+            os.utime(path, None)  # mark it as recently used
+        except OSError:
+            pass
+        return result
+
+    def _write(self, key, result):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        path = self._path(key)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)  # rename doesn't overwrite on Windows
+        os.rename(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        '''
+        Deletes the least recently used files until the directory is no
+        larger than max_bytes.
+        '''
+        files = []
+        for path in self._paths():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _mtime, size, _path in files)
+        for _mtime, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,206 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import time
+import traceback
+import logging
+log = logging.getLogger(__name__)
+
+# third party imports
+from PySide import QtCore
+
+
+class FitJob(object):
+    '''
+    A fit of x, y with one estimator, func(x, y, **kwargs). If the estimator
+    takes a progress callback (see linear_regression.FitCancelled), the job
+    can report its progress and be cancelled. If updates is True, it also
+    takes an update callback, which it calls with partial results (see
+    bootstrap.bootstrap). The cache_key is the fit_cache key to store the
+    result under, if any, and data_id identifies the data set, so that the
+    results of fits of a data set that has since been closed can be
+    ignored.
+    '''
+
+    def __init__(self, name, func, x, y, color=None, cancellable=True,
+                 cache_key=None, updates=False, data_id=None, **kwargs):
+        self.name = name
+        self.func = func
+        self.x = x
+        self.y = y
+        self.color = color
+        self.cancellable = cancellable
+        self.cache_key = cache_key
+        self.updates = updates
+        self.data_id = data_id
+        self.kwargs = kwargs
+
+    def run(self, callback=None, update=None):
+        kwargs = dict(self.kwargs)
+        if self.cancellable:
+            kwargs['callback'] = callback
+        if self.updates:
+            kwargs['update'] = update
+        return self.func(self.x, self.y, **kwargs)
+
+
+class FitThread(QtCore.QThread):
+    '''
+    Runs a FitJob outside of the GUI thread.
+    '''
+    progressChanged = QtCore.Signal(float)
+    fitUpdated = QtCore.Signal(object)
+    fitFinished = QtCore.Signal(object)
+    fitCancelled = QtCore.Signal()
+    fitFailed = QtCore.Signal(str)
+
+    # Minimum time between progress updates, in seconds
+    progressInterval = 0.1
+
+    def __init__(self, job, parent=None):
+        super(FitThread, self).__init__(parent)
+        self.job = job
+        self._cancelled = False
+        self._lastProgress = 0.
+        self._lastUpdate = 0.
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _callback(self, fraction):
+        now = time.time()
+        if now - self._lastProgress >= self.progressInterval:
+            self._lastProgress = now
+            self.progressChanged.emit(fraction)
+        return self._cancelled
+
+    def _update(self, result):
+        now = time.time()
+        if now - self._lastUpdate >= self.progressInterval:
+            self._lastUpdate = now
+            self.fitUpdated.emit(result)
+
+    def run(self):
+        from .linear_regression import FitCancelled
+        start = time.time()
+        try:
+            result = self.job.run(self._callback, self._update)
+        except FitCancelled:
+            log.debug('%s cancelled after %.3f s', self.job.name,
+                      time.time() - start)
+            self.fitCancelled.emit()
+        except Exception:
+            self.fitFailed.emit(traceback.format_exc())
+        else:
+            log.debug('%s finished in %.3f s', self.job.name,
+                      time.time() - start)
+            self.fitFinished.emit(result)
+
+
+class FitRunner(QtCore.QObject):
+    '''
+    Runs FitJobs one at a time in a FitThread. Jobs that are submitted while
+    another is running are coalesced, so that only the latest one runs
+    next.
+    '''
+    jobStarted = QtCore.Signal(object)
+    progressChanged = QtCore.Signal(object, float)
+    jobUpdated = QtCore.Signal(object, object)
+    jobFinished = QtCore.Signal(object, object)
+    jobCancelled = QtCore.Signal(object)
+    jobFailed = QtCore.Signal(object, str)
+    idle = QtCore.Signal()
+
+    def __init__(self, parent=None):
+        super(FitRunner, self).__init__(parent)
+        self._thread = None
+        self._pending = None
+
+    def isRunning(self):
+        return self._thread is not None
+
+    def submit(self, job):
+        if self._thread is None:
+            self._start(job)
+        else:
+            if self._pending is not None:
+                log.debug('%s replaced by %s', self._pending.name, job.name)
+            self._pending = job
+
+    def cancel(self):
+        '''
+        Drops any pending job and cancels the running one, if it is
+        cancellable.
+        '''
+        self._pending = None
+        if self._thread is not None:
+            self._thread.cancel()
+
+    def _start(self, job):
+        thread = FitThread(job, self)
+        thread.progressChanged.connect(self._progressChanged)
+        thread.fitUpdated.connect(self._fitUpdated)
+        thread.fitFinished.connect(self._fitFinished)
+        thread.fitCancelled.connect(self._fitCancelled)
+        thread.fitFailed.connect(self._fitFailed)
+        thread.finished.connect(self._threadFinished)
+        self._thread = thread
+        self.jobStarted.emit(job)
+        thread.start()
+
+    @QtCore.Slot(float)
+    def _progressChanged(self, fraction):
+        self.progressChanged.emit(self.sender().job, fraction)
+
+    @QtCore.Slot(object)
+    def _fitUpdated(self, result):
+        self.jobUpdated.emit(self.sender().job, result)
+
+    @QtCore.Slot(object)
+    def _fitFinished(self, result):
+        self.jobFinished.emit(self.sender().job, result)
+
+    @QtCore.Slot()
+    def _fitCancelled(self):
+        self.jobCancelled.emit(self.sender().job)
+
+    @QtCore.Slot(str)
+    def _fitFailed(self, message):
+        self.jobFailed.emit(self.sender().job, message)
+
+    @QtCore.Slot()
+    def _threadFinished(self):
+        self._thread.deleteLater()
+        self._thread = None
+        job, self._pending = self._pending, None
+        if job is not None:
+            self._start(job)
+        else:
+            self.idle.emit()
+
+    def wait(self):
+        '''
+        Cancels all jobs and waits for the running one to stop.
+        '''
+        self.cancel()
+        if self._thread is not None:
+            self._thread.wait()
@@ -0,0 +1,108 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import __builtin__
+import sys
+import time
+import logging
+log = logging.getLogger(__name__)
+
+
+class ImportTimer(object):
+    '''
+    Times the imports of new modules while it is installed, and the stages
+    of the startup that are marked with mark, from start (now if None).
+
+    Each import statement that loads new modules is recorded under the
+    name of the module it imports, with its total time and its own time, i.e.
+    without the time of the new imports that it triggered.
+    '''
+
+    def __init__(self, start=None):
+        self.start = time.time() if start is None else start
+        self.imports = {}  # name -> [total, own]
+        self.stages = []  # (name, time)
+        self._import = None
+        self._stack = []
+
+    def install(self):
+        if self._import is None:
+            self._import = __builtin__.__import__
+            __builtin__.__import__ = self._timedImport
+
+    def uninstall(self):
+        if self._import is not None:
+            __builtin__.__import__ = self._import
+            self._import = None
+
+    def mark(self, stage):
+        self.stages.append((stage, time.time()))
+
+    def _timedImport(self, *args, **kwargs):
+        before = set(sys.modules)
+        self._stack.append(0.)
+        start = time.time()
+        try:
+            return self._import(*args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            children = self._stack.pop()
+            # Python 2 also adds None entries for failed implicit relative
+            # imports, which aren't modules
+            new = [name for name in set(sys.modules) - before
+                   if sys.modules[name] is not None]
+            if new:
+                name = _getImportedName(args[0], new)
+                total, own = self.imports.get(name, (0., 0.))
+                self.imports[name] = [total + elapsed,
+                                      own + elapsed - children]
+                if self._stack:
+                    self._stack[-1] += elapsed
+
+    def report(self, limit=25):
+        '''
+        Logs the stage times and the slowest imports.
+        '''
+        last = self.start
+        for stage, t in self.stages:
+            log.info('%-40s %7.3f s (at %.3f s)', stage, t - last,
+                     t - self.start)
+            last = t
+        imports = sorted(self.imports.iteritems(), key=lambda item:
+                         item[1][0], reverse=True)
+        log.info('%d imports; the slowest %d (total, own):',
+                 len(imports), min(limit, len(imports)))
+        for name, (total, own) in imports[:limit]:
+            log.info('    %-40s %7.3f s %7.3f s', name, total, own)
+
+
+def _getImportedName(name, new):
+    '''
+    Returns the new module that an import of name loaded, resolving
+    relative imports, or the shortest new name if there isn't one.
+    '''
+    if name in new:
+        return name
+    relative = [n for n in new if n.endswith('.' + name)]
+    if relative:
+        return min(relative, key=len)
+    return min(new, key=len)
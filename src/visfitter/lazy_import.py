@@ -0,0 +1,61 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Modules that are imported when they are first used, to speed up the
+startup of the GUI:
+
+    lod = LazyModule('.lod', __package__)
+    ...
+    pyramid = lod.DecimationPyramid(x, y)  # imports lod
+'''
+
+# std lib imports
+import importlib
+
+
+class LazyModule(object):
+    '''
+    Stands in for the module name (relative to package, if it starts with
+    a dot), and imports it when one of its attributes is first looked up,
+    or when load is called.
+    '''
+
+    def __init__(self, name, package=None):
+        self._name = name
+        self._package = package
+        self._module = None
+
+    def load(self):
+        '''
+        Imports the module, if it hasn't been, and returns it.
+        '''
+        if self._module is None:
+            self._module = importlib.import_module(self._name, self._package)
+        return self._module
+
+    def __getattr__(self, attr):
+        # Only called for attributes that aren't found normally, i.e. those
+        # of the module
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return '<LazyModule {!r} ({})>'.format(self._name, state)
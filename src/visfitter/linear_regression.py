@@ -20,32 +20,369 @@
 #############################################################################
 
 # std lib imports
+import collections
+import heapq
 import logging
+import math
+import os
+import time
 log = logging.getLogger(__name__)
 
 # third party imports
-from PySide import QtGui, QtCore
 import numpy
-import scipy.optimize
 
+# local imports
+from . import parallel
+from . import parser
 
-def leastSquares(x, y):
-    def func(c):
-        return c[0] + c[1] * x - y
-    result = scipy.optimize.leastsq(func, (0, 0))
-    print 'leastSquares:', result[0][0], result[0][1]
-    return result[0][0], result[0][1]
 
+class FitCancelled(Exception):
+    '''
+    Raised when a fit is cancelled.
+
+    The slower estimators accept a callback, which is called periodically
+    with the fraction of the fit that is complete, and cancel the fit by
+    raising FitCancelled as soon as it returns True.
+    '''
+
+
+def _report(callback, fraction):
+    if callback is not None and callback(fraction):
+        raise FitCancelled()
+
+
+class FitStats(object):
+    '''
+    Counters and timers of a fit. The estimators that take a stats argument
+    fill in a FitStats passed to them, and also log one at debug level, if
+    debug logging is enabled. Otherwise, nothing is counted or timed.
+
+    candidates: the number of candidate lines that were evaluated
+    pruned: the number of candidates rejected without a selection
+    selections: the number of medians or order statistics selected
+    selectSeconds: the time spent in those selections
+    updates: the number of times the best fit so far improved
+    seconds: the total time of the fit
+    '''
+    fields = ['candidates', 'pruned', 'selections', 'selectSeconds',
+              'updates', 'seconds']
+
+    def __init__(self):
+        self.candidates = 0
+        self.pruned = 0
+        self.selections = 0
+        self.selectSeconds = 0.
+        self.updates = 0
+        self.seconds = 0.
+
+    def merge(self, other):
+        '''
+        Adds the counts and times of other, e.g. from a worker process,
+        except for the total time.
+        '''
+        self.candidates += other.candidates
+        self.pruned += other.pruned
+        self.selections += other.selections
+        self.selectSeconds += other.selectSeconds
+        self.updates += other.updates
+        return self
+
+    def asDict(self):
+        return dict((name, getattr(self, name)) for name in self.fields)
+
+    def __str__(self):
+        return ('{candidates} candidates ({pruned} pruned), {selections} '
+                'selections in {selectSeconds:.3f} s, {updates} updates, '
+                '{seconds:.3f} s total'.format(**self.asDict()))
+
+
+def _startStats(stats):
+    '''
+    Returns stats, or a new FitStats if it is None and debug logging is
+    enabled, so that there is something to log.
+    '''
+    if stats is None and log.isEnabledFor(logging.DEBUG):
+        return FitStats()
+    return stats
+
+
+def _finishStats(name, stats, start):
+    if stats is not None:
+        stats.seconds = time.time() - start
+        log.debug('%s: %s', name, stats)
+
+
+def applyMask(x, y, mask):
+    '''
+    Returns the points of x, y where mask is True, or x, y themselves if
+    mask is None.
+
+    The estimators take a boolean mask shaped like x, so that points can be
+    excluded from a fit (e.g. outliers selected in the plot) by flipping
+    their entries, without the caller keeping copies of the remaining data.
+    '''
+    if mask is None:
+        return x, y
+    mask = numpy.asarray(mask, dtype=bool)
+    if mask.shape != numpy.shape(x):
+        raise ValueError('the mask must have one entry per point, not {}'
+                         ''.format(mask.shape))
+    return x[mask], y[mask]
+
+
+class LeastSquaresAccumulator(object):
+    '''
+    Accumulates the sufficient statistics of a least squares line fit, so
+    that data can be fit in chunks, in a single pass, and in O(1) memory.
+
+    The count, means and centered sums of squares and products are kept,
+    rather than raw sums, which would lose precision to cancellation. Each
+    chunk is summarized with numpy and combined with the running statistics
+    using the pairwise update of Chan, Golub and LeVeque [1]. Accumulators
+    of separate parts of the data (e.g. from worker processes) are combined
+    the same way with merge, or with +. The update is run backwards by
+    remove and unmerge (or -), so that the fit can follow k points being
+    excluded from, or returned to, the data in O(k). Downdating can lose
+    precision when most of the points are removed, so the accumulator
+    should be rebuilt if only a few remain.
+
+    [1] T. F. Chan, G. H. Golub and R. J. LeVeque, "Algorithms for
+    computing the sample variance: analysis and recommendations," The
+    American Statistician, vol. 37, no. 3, pp. 242-247, Aug. 1983.
+    '''
+
+    def __init__(self):
+        self.n = 0
+        self.xmean = 0.
+        self.ymean = 0.
+        self.sxx = 0.
+        self.syy = 0.
+        self.sxy = 0.
+
+    @classmethod
+    def fromPoints(cls, x, y):
+        '''
+        Returns the accumulator of the points x, y.
+        '''
+        x = numpy.asarray(x, dtype=numpy.float64).ravel()
+        y = numpy.asarray(y, dtype=numpy.float64).ravel()
+        if x.size != y.size:
+            raise ValueError('x and y must be the same size')
+        chunk = cls()
+        if x.size == 0:
+            return chunk
+        chunk.n = x.size
+        chunk.xmean = x.mean()
+        chunk.ymean = y.mean()
+        dx = x - chunk.xmean
+        dy = y - chunk.ymean
+        chunk.sxx = numpy.dot(dx, dx)
+        chunk.syy = numpy.dot(dy, dy)
+        chunk.sxy = numpy.dot(dx, dy)
+        return chunk
+
+    def update(self, x, y):
+        '''
+        Adds the points x, y.
+        '''
+        return self.merge(LeastSquaresAccumulator.fromPoints(x, y))
+
+    def remove(self, x, y):
+        '''
+        Removes the points x, y, which must have been added before.
+        '''
+        return self.unmerge(LeastSquaresAccumulator.fromPoints(x, y))
+
+    def merge(self, other):
+        '''
+        Adds the points accumulated by other.
+        '''
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+        n = self.n + other.n
+        dx = other.xmean - self.xmean
+        dy = other.ymean - self.ymean
+        f = float(self.n) * other.n / n
+        self.xmean += dx * other.n / n
+        self.ymean += dy * other.n / n
+        self.sxx += other.sxx + dx * dx * f
+        self.syy += other.syy + dy * dy * f
+        self.sxy += other.sxy + dx * dy * f
+        self.n = n
+        return self
+
+    def unmerge(self, other):
+        '''
+        Removes the points accumulated by other, which must be a subset of
+        the points accumulated by self.
+        '''
+        if other.n == 0:
+            return self
+        if other.n > self.n:
+            raise ValueError('cannot remove more points than were added')
+        if other.n == self.n:
+            self.__init__()
+            return self
+        n = self.n - other.n
+        dx = other.xmean - self.xmean
+        dy = other.ymean - self.ymean
+        f = float(self.n) * other.n / n
+        self.xmean -= dx * other.n / n
+        self.ymean -= dy * other.n / n
+        # clipped, since rounding can leave them slightly negative
+        self.sxx = max(self.sxx - other.sxx - dx * dx * f, 0.)
+        self.syy = max(self.syy - other.syy - dy * dy * f, 0.)
+        self.sxy -= other.sxy + dx * dy * f
+        self.n = n
+        return self
 
-def leastMedianOfSquaresCrude(x, y):
+    def copy(self):
+        return LeastSquaresAccumulator().merge(self)
+
+    def __add__(self, other):
+        return self.copy().merge(other)
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __sub__(self, other):
+        return self.copy().unmerge(other)
+
+    def __isub__(self, other):
+        return self.unmerge(other)
+
+    def fit(self):
+        '''
+        Returns alpha, beta of the least squares line, y = alpha + beta x.
+        '''
+        if self.n < 2 or self.sxx == 0:
+            raise ValueError('at least two distinct x values are needed')
+        beta = self.sxy / self.sxx
+        return self.ymean - beta * self.xmean, beta
+
+    def residualVariance(self):
+        '''
+        Returns the unbiased estimate of the variance of the residuals.
+        '''
+        if self.n < 3:
+            raise ValueError('at least three points are needed')
+        _alpha, beta = self.fit()
+        # sum of squared residuals, clipped since rounding can make it
+        # slightly negative for a perfect fit
+        ssr = max(self.syy - beta * self.sxy, 0.)
+        return ssr / (self.n - 2)
+
+    def standardErrors(self):
+        '''
+        Returns the standard errors of alpha and beta.
+        '''
+        s2 = self.residualVariance()
+        alpha_err = math.sqrt(s2 * (1. / self.n +
+                                    self.xmean ** 2 / self.sxx))
+        beta_err = math.sqrt(s2 / self.sxx)
+        return alpha_err, beta_err
+
+
+def leastSquares(x, y, mask=None, full_output=False, stats=None):
+    '''
+    Fits the line y = alpha + beta x by least squares, and returns alpha,
+    beta.
+
+    If full_output is True, the LeastSquaresAccumulator of x and y is
+    returned as well, which gives the standard errors of alpha and beta.
+    The mask argument is described in applyMask, and the stats argument in
+    FitStats.
+    '''
+    start = time.time()
+    stats = _startStats(stats)
+    x, y = applyMask(x, y, mask)
+    acc = LeastSquaresAccumulator().update(x, y)
+    alpha, beta = acc.fit()
+    if stats is not None:
+        stats.candidates += 1
+        stats.updates += 1
+    log.debug('leastSquares: alpha = %g, beta = %g', alpha, beta)
+    _finishStats('leastSquares', stats, start)
+    if full_output:
+        return alpha, beta, acc
+    return alpha, beta
+
+
+def leastSquaresFile(filepath, xcol=0, ycol=1, sep=None, full_output=False,
+                     callback=None):
+    '''
+    Fits the xcol and ycol columns of a data file by least squares like
+    leastSquares, in a single pass over the file, without reading the
+    whole file into memory. The progress callback is described in
+    FitCancelled; the fraction complete is estimated from the number of
+    bytes read so far, so it is only approximate for compressed files.
+    '''
+    acc = LeastSquaresAccumulator()
+    size = float(max(os.path.getsize(filepath), 1))
+    with open(filepath, 'rb') as f:
+        cls = parser.getParserClass(filepath, f.read(parser.SNIFF_BYTES))
+        f.seek(0)
+        p = cls(f)
+        for x, y in p.iterXY(xcol, ycol, sep):
+            acc.update(x, y)
+            _report(callback, min(p.bytesRead / size, 1.))
+    alpha, beta = acc.fit()
+    if full_output:
+        return alpha, beta, acc
+    return alpha, beta
+
+
+def leastMedianOfSquaresCrude(x, y, mask=None, full_output=False,
+                              processes=1, callback=None, stats=None):
     '''
     Implementation of Crude Algorithm from [1].
 
+    If processes is not 1, the outer loop is split across that many worker
+    processes (one per core if None). Ties are broken in favour of the first
+    triple in the order of the serial loops, so the result does not depend
+    on the number of processes.
+
+    If full_output is True, the median absolute residual, d_star, of the
+    fit is returned as well. The progress callback is described in
+    FitCancelled, the mask argument in applyMask, and the stats argument in
+    FitStats.
+
     [1] J. M. Steele and W. L. Steiger, "Algorithms and complexity for least
     median of squares regression," Discrete Applied Mathematics, vol. 14,
     no. 1, pp. 93-100, May 1986.
     '''
+    start_time = time.time()
+    stats = _startStats(stats)
+    x, y = applyMask(x, y, mask)
+    n = x.size
+    if processes == 1:
+        results = [_crudeSearch(x, y, 0, 1, callback, stats)]
+    else:
+        # Interleave the outer loop, since the early ii's have the most work
+        ntasks = 4 * (processes or parallel.cpuCount())
+        tasks = [(start, ntasks, None, _workerStats(stats))
+                 for start in xrange(min(ntasks, n))]
+        results = _collect(parallel.imapShared(_crudeSearch, x, y, tasks,
+                                               processes),
+                           len(tasks), callback, stats)
+    d_star, _, alpha_star, beta_star = min(results)[:4]
+    log.debug('leastMedianOfSquaresCrude: %s %s', alpha_star, beta_star)
+    _finishStats('leastMedianOfSquaresCrude', stats, start_time)
+    if full_output:
+        return alpha_star, beta_star, d_star
+    return alpha_star, beta_star
+
+
+def _crudeSearch(x, y, start, step, callback=None, stats=None):
+    '''
+    Runs the crude algorithm for ii in xrange(start, n, step), and returns
+    (d_star, (ii, jj, kk), alpha_star, beta_star, stats) of the best triple.
+    '''
     d_star = numpy.inf
+    key_star = ()
     alpha_star = 0
     beta_star = 0
 
@@ -53,7 +390,8 @@ def leastMedianOfSquaresCrude(x, y):
         return numpy.median(numpy.absolute((y - (alpha + beta * x))))
 
     n = x.size
-    for ii in xrange(n):
+    for ii in xrange(start, n, step):
+        _report(callback, 1 - (float(n - ii) / n) ** 3)
         for jj in xrange(ii + 1, n):
             for kk in xrange(jj + 1, n):
                 i, j, k = ii, jj, kk
@@ -65,78 +403,1439 @@ def leastMedianOfSquaresCrude(x, y):
                 if x[j] > x[k]:
                     j, k = k, j
                 if not ((x[i] <= x[j]) and (x[j] <= x[k])):
-                    print x[i], x[j], x[k]
-                    raise Exception()
+                    raise ValueError('x cannot be ordered: {}, {}, {}'
+                                     ''.format(x[i], x[j], x[k]))
                 # assign beta and alpha
                 if x[i] == x[k]:
                     continue
                 beta = (y[i] - y[k]) / (x[i] - x[k])
                 alpha = (y[j] + y[k] - beta * (x[j] + x[k])) / 2
                 # get the median
-                d = f(alpha, beta)
+                if stats is None:
+                    d = f(alpha, beta)
+                else:
+                    t = time.time()
+                    d = f(alpha, beta)
+                    stats.selectSeconds += time.time() - t
+                    stats.candidates += 1
+                    stats.selections += 1
                 if d < d_star:
                     d_star = d
+                    key_star = (ii, jj, kk)
                     alpha_star = alpha
                     beta_star = beta
-    print 'leastMedianOfSquaresCrude:', alpha_star, beta_star
-    return alpha_star, beta_star
+                    if stats is not None:
+                        stats.updates += 1
+    return d_star, key_star, alpha_star, beta_star, stats
 
 
-def leastMedianOfSquares(x, y):
+def _workerStats(stats):
+    '''
+    Returns a FitStats for a worker process to fill in, if stats isn't
+    None.
+    '''
+    return None if stats is None else FitStats()
+
+
+def _collect(results, ntasks, callback, stats=None):
+    '''
+    Returns a list of the results from a parallel.imapShared iterator,
+    reporting the progress to callback as each task completes. The stats of
+    each task, the last item of its result, are merged into stats.
+    '''
+    collected = []
+    for result in results:
+        collected.append(result)
+        if stats is not None:
+            stats.merge(result[-1])
+        _report(callback, float(len(collected)) / ntasks)
+    return collected
+
+
+def leastMedianOfSquares(x, y, chunk_size=2 ** 16, mask=None,
+                         full_output=False, processes=1, callback=None,
+                         stats=None):
     '''
     Implementation of Algorithm 2 from [1].
 
+    Rather than looping over the (r, s) pairs one at a time, the residuals
+    are computed for blocks of pairs at once. Each block holds at most
+    chunk_size residuals (but at least one row of n), so the peak memory
+    does not grow with the number of pairs. Rows that cannot beat the best
+    fit so far are rejected by counting the residuals within dstar of the
+    line, and the m-th order statistics of the remaining rows are selected
+    with numpy.partition instead of sorting. Pairs with x[r] == x[s] are
+    skipped, since their slope is undefined.
+
+    If full_output is True, the median absolute residual, d_star, of the
+    fit (half the width of the narrowest strip) is returned as well.
+
+    If processes is not 1, the pairs are split across that many worker
+    processes (one per core if None). Ties are broken in favour of the first
+    pair in the order of the serial loops, so the result does not depend on
+    the number of processes. The progress callback is described in
+    FitCancelled, the mask argument in applyMask, and the stats argument in
+    FitStats.
+
     [1] J. M. Steele and W. L. Steiger, "Algorithms and complexity for least
     median of squares regression," Discrete Applied Mathematics, vol. 14,
     no. 1, pp. 93-100, May 1986.
     '''
+    start_time = time.time()
+    stats = _startStats(stats)
+    x, y = applyMask(x, y, mask)
+    n = x.size
+    npairs = n * (n - 1)
+    if processes == 1:
+        results = [_algorithm2Search(x, y, 0, npairs, chunk_size,
+                                     callback, stats)]
+    else:
+        ntasks = 4 * (processes or parallel.cpuCount())
+        bounds = numpy.linspace(0, npairs, ntasks + 1).astype(int)
+        tasks = [(bounds[i], bounds[i + 1], chunk_size, None,
+                  _workerStats(stats))
+                 for i in xrange(ntasks) if bounds[i] < bounds[i + 1]]
+        results = _collect(parallel.imapShared(_algorithm2Search, x, y,
+                                               tasks, processes),
+                           len(tasks), callback, stats)
+    dstar, _, alpha_star, beta_star = min(results)[:4]
+    log.debug('leastMedianOfSquares: %s %s', alpha_star, beta_star)
+    _finishStats('leastMedianOfSquares', stats, start_time)
+    if full_output:
+        return alpha_star, beta_star, dstar / 2
+    return alpha_star, beta_star
+
+
+def _algorithm2Search(x, y, start, stop, chunk_size, callback=None,
+                      stats=None):
+    '''
+    Runs Algorithm 2 for the pairs start to stop in the order of the
+    (r, s) loops, and returns (dstar, pair, alpha_star, beta_star, stats)
+    of the best pair, where dstar is the width of the narrowest strip
+    found.
+    '''
     alpha_star, beta_star = (0, 0)
     dstar = numpy.inf
     n = x.size
-    m = (n - 2) / 2
-    z = numpy.empty(n)
-    for r in xrange(n):
-        for s in xrange(n):
-            if r == s:
+    m = (n - 2) // 2
+    pair_star = n * (n - 1)
+    rows = max(1, chunk_size // n)
+    z = numpy.empty((rows, n))
+    side = numpy.empty((rows, n), dtype=bool)
+    for block in xrange(start, stop, rows):
+        _report(callback, float(block - start) / (stop - start))
+        # Enumerate the pairs in the same order as the nested r, s loops
+        k = numpy.arange(block, min(block + rows, stop))
+        r = k // (n - 1)
+        s = k % (n - 1)
+        s += s >= r
+        keep = x[r] != x[s]
+        k = k[keep]
+        r = r[keep]
+        s = s[keep]
+        b = r.size
+        if b == 0:
+            continue
+        beta = (y[r] - y[s]) / (x[r] - x[s])
+        zb = z[:b]
+        numpy.subtract(x, x[r][:, None], out=zb)
+        numpy.multiply(zb, beta[:, None], out=zb)
+        numpy.subtract(y - y[r][:, None], zb, out=zb)
+        if stats is not None:
+            stats.candidates += b
+        if m == 0:
+            # r and s alone are a median of the points
+            i = 0
+            dstar, pair_star = 0., k[i]
+            alpha_star, beta_star = y[r[i]] - beta[i] * x[r[i]], beta[i]
+            break
+        # r and s are on the line, z = 0, and the strip between it and a
+        # parallel line through the m-th nearest other point on either side
+        # holds m + 2 points, i.e. a median. Exclude r and s (and rounding
+        # errors in z[s]) by moving them to infinity.
+        rb = numpy.arange(b)
+        zb[rb, r] = numpy.inf
+        zb[rb, s] = numpy.inf
+
+        # Only rows with m points within dstar on one side can improve the
+        # fit. The others are rejected by counting, which is much cheaper
+        # than selecting.
+        sb = side[:b]
+        if dstar < numpy.inf:
+            numpy.less(zb, dstar, out=sb)
+            sb &= zb >= 0
+            above = sb.sum(axis=1) >= m
+            numpy.greater(zb, -dstar, out=sb)
+            sb &= zb <= 0
+            below = sb.sum(axis=1) >= m
+            candidates = numpy.flatnonzero(above | below)
+            if stats is not None:
+                stats.pruned += b - candidates.size
+            if candidates.size == 0:
                 continue
-            d = numpy.inf
-            beta = (y[r] - y[s]) / (x[r] - x[s])
-            print 'beta =', beta
-            zPi = []
-            zN = []
-            for i in xrange(n):
-                z[i] = y[i] - y[r] - beta * (x[i] - x[r])
-                if z[i] > 0:
-                    zPi.append(z[i])
-                else:
-                    zN.append(z[i])
-            print 'z.size = ', z.size
-            print 'len(zPi) = ', len(zPi)
-            print 'len(zN) = ', len(zN)
-            zPi.sort()
-            zN.sort()
-            print 'len:', len(zPi), 'm:', m
-            if m > len(zPi):
-                mth_smallest_from_zPi = zPi[-1]
-            else:
-                mth_smallest_from_zPi = zPi[m - 1]
-            if m > len(zN):
-                mth_largest_from_zN = zN[0]
-            else:
-                mth_largest_from_zN = zN[-m]
-            if abs(mth_smallest_from_zPi) < abs(mth_largest_from_zN):
-                z_p = mth_smallest_from_zPi
-            else:
-                z_p = mth_largest_from_zN
-            p = numpy.where(z==z_p)[0][0]  # get the first index
-            alpha = (y[r] + y[p] - beta * (x[r] + x[p])) / 2
-            if abs(z_p) < dstar:
-                dstar = abs(z_p)
-                alpha_star, beta_star = (alpha, beta)
-    print 'leastMedianOfSquares:', alpha_star, beta_star
+        else:
+            candidates = numpy.arange(b)
+        zc = zb[candidates]
+
+        # The m-th smallest non-negative and the m-th largest non-positive
+        # residuals, or infinity if there are fewer than m of them
+        if stats is not None:
+            t = time.time()
+        zPi = numpy.where(zc >= 0, zc, numpy.inf)
+        zPi.partition(m - 1, axis=1)
+        mth_smallest_from_zPi = zPi[:, m - 1]
+        zN = numpy.where(zc <= 0, -zc, numpy.inf)
+        zN.partition(m - 1, axis=1)
+        mth_largest_from_zN = -zN[:, m - 1]
+        if stats is not None:
+            stats.selectSeconds += time.time() - t
+            stats.selections += 2 * candidates.size
+
+        z_p = numpy.where(mth_smallest_from_zPi < -mth_largest_from_zN,
+                          mth_smallest_from_zPi, mth_largest_from_zN)
+        d = numpy.absolute(z_p)
+        i = d.argmin()  # the first minimum, as in the nested loops
+        if d[i] < dstar:
+            dstar = d[i]
+            offset = z_p[i] / 2  # to the line midway across the strip
+            i = candidates[i]
+            pair_star = k[i]
+            alpha_star = y[r[i]] - beta[i] * x[r[i]] + offset
+            beta_star = beta[i]
+            if stats is not None:
+                stats.updates += 1
+    return dstar, pair_star, alpha_star, beta_star, stats
+
+
+def leastMedianOfSquaresSweep(x, y, mask=None, full_output=False,
+                              callback=None, stats=None):
+    '''
+    Exact least median of squares fit by sweeping the dual arrangement [1, 2].
+
+    Each point (x[i], y[i]) is mapped to the dual line
+    r[i](beta) = y[i] - beta * x[i], the intercept of the line with slope
+    beta through that point. For a fixed slope, the best intercept lies in
+    the middle of the narrowest window of h = n // 2 + 1 consecutive dual
+    lines, and the width of a given window only changes where one of its
+    bounding lines swaps places with a neighbour. Sweeping beta from -inf to
+    +inf and evaluating the affected windows at every vertex of the
+    arrangement therefore finds the optimum.
+
+    Only the current order of the dual lines and a heap of the intersections
+    of adjacent lines are stored, so the sweep takes O(n^2 log n) time and
+    O(n) memory. The sweep is sequential, and runs in python at a few
+    microseconds per vertex: about 3 s for 1000 points and 13 s for 2000,
+    so larger data sets should be fit with leastMedianOfSquaresRandom
+    (which the registry falls back to).
+
+    For odd n, the result is the same as that of leastMedianOfSquaresCrude
+    and leastMedianOfSquares. For even n, the crude algorithm minimizes the
+    mean of the two middle absolute residuals, whereas this, like
+    leastMedianOfSquares, minimizes the h-th smallest, as in [3], so the
+    fits can differ.
+
+    If full_output is True, the h-th smallest absolute residual, d_star, of
+    the fit is returned as well. The progress callback is described in
+    FitCancelled, the mask argument in applyMask, and the stats argument in
+    FitStats; the candidates are the vertices of the arrangement, each of
+    which is evaluated without a selection.
+
+    [1] H. Edelsbrunner and D. L. Souvaine, "Computing least median of squares
+    regression lines and guided topological sweep," Journal of the American
+    Statistical Association, vol. 85, no. 409, pp. 115-119, Mar. 1990.
+
+    [2] D. L. Souvaine and J. M. Steele, "Time- and space-efficient algorithms
+    for least median of squares regression," Journal of the American
+    Statistical Association, vol. 82, no. 399, pp. 794-801, Sep. 1987.
+
+    [3] P. J. Rousseeuw, "Least Median of Squares Regression," Journal of the
+    American Statistical Association, vol. 79, no. 388, pp. 871-880, Dec. 1984.
+    '''
+    start_time = time.time()
+    stats = _startStats(stats)
+    x, y = applyMask(x, y, mask)
+    n = x.size
+    h = n // 2 + 1
+    d_star = numpy.inf
+    alpha_star = 0
+    beta_star = 0
+    updates = 0
+
+    # Plain python lists are much faster than numpy arrays for the scalar
+    # accesses in the sweep below.
+    xs = x.tolist()
+    ys = y.tolist()
+
+    # At beta = -inf the dual lines are ordered by increasing x.
+    order = numpy.lexsort((y, x)).tolist()
+    rank = [0] * n
+    for p, i in enumerate(order):
+        rank[i] = p
+
+    # Adjacent lines u below v will cross in the future only if x[u] < x[v].
+    events = []
+    for p in xrange(n - 1):
+        u, v = order[p], order[p + 1]
+        if xs[u] < xs[v]:
+            events.append(((ys[u] - ys[v]) / (xs[u] - xs[v]), u, v))
+    heapq.heapify(events)
+
+    last = n - h
+    nvertices = n * (n - 1) // 2
+    swaps = 0
+    while events:
+        beta, u, v = heapq.heappop(events)
+        p = rank[u]
+        if p + 1 >= n or order[p + 1] != v:
+            continue  # stale event; u and v are no longer adjacent
+        swaps += 1
+        if not swaps & 0x3fff:
+            _report(callback, float(swaps) / nvertices)
+        order[p], order[p + 1] = v, u
+        rank[u], rank[v] = p + 1, p
+
+        # Evaluate the windows that are bounded by the swapped lines
+        for q in (p - h + 1, p - h + 2, p, p + 1):
+            if q < 0 or q > last:
+                continue
+            bottom = order[q]
+            top = order[q + h - 1]
+            r_bottom = ys[bottom] - beta * xs[bottom]
+            r_top = ys[top] - beta * xs[top]
+            d = (r_top - r_bottom) / 2
+            if d < d_star:
+                d_star = d
+                alpha_star = (r_top + r_bottom) / 2
+                beta_star = beta
+                updates += 1
+
+        # Schedule the crossings of the new neighbours
+        if p > 0:
+            w = order[p - 1]
+            if xs[w] < xs[v]:
+                heapq.heappush(events,
+                               ((ys[w] - ys[v]) / (xs[w] - xs[v]), w, v))
+        if p + 2 < n:
+            w = order[p + 2]
+            if xs[u] < xs[w]:
+                heapq.heappush(events,
+                               ((ys[u] - ys[w]) / (xs[u] - xs[w]), u, w))
+
+    # Rounding can leave the width of a window whose bounding lines cross
+    # at the vertex slightly negative
+    d_star = max(d_star, 0.)
+    log.debug('leastMedianOfSquaresSweep: %s %s', alpha_star, beta_star)
+    if stats is not None:
+        stats.candidates += swaps
+        stats.updates += updates
+    _finishStats('leastMedianOfSquaresSweep', stats, start_time)
+    if full_output:
+        return alpha_star, beta_star, d_star
     return alpha_star, beta_star
 
 
+def leastMedianOfSquaresRandom(x, y, confidence=0.99, outlier_fraction=0.5,
+                               subsets=3000, time_budget=None, seed=None,
+                               chunk_size=2 ** 16, initial=None, mask=None,
+                               full_output=False, callback=None, stats=None):
+    '''
+    Approximate least median of squares fit by random resampling, as in
+    PROGRESS [1].
+
+    Candidate lines are drawn through random pairs of points, and each is
+    scored by the h-th smallest absolute residual, h = n // 2 + 1, which is
+    found by selection in O(n). The candidates are scored in blocks of at
+    most chunk_size residuals. The intercept of the best line is then
+    adjusted to the exact least median of squares intercept for its slope.
+
+    Sampling stops as soon as the probability that at least one of the
+    pairs drawn so far is free of outliers reaches the requested confidence,
+    assuming the given fraction of outliers. It also stops after subsets
+    pairs, or after time_budget seconds, if given. If there are no more than
+    subsets pairs in total, all of them are tried instead. The seed is
+    passed to numpy.random.RandomState.
+
+    initial, if given, is the alpha, beta of a line to start from, e.g. the
+    fit of the data before more points were appended to it. It is scored
+    before any pair, so the fit is never worse than it, even if the time
+    budget runs out.
+
+    If full_output is True, the h-th smallest absolute residual, d_star, of
+    the fit is returned as well. The progress callback is described in
+    FitCancelled, the mask argument in applyMask, and the stats argument in
+    FitStats.
+
+    [1] P. J. Rousseeuw and A. M. Leroy, Robust Regression and Outlier
+    Detection. New York: Wiley, 1987, ch. 5.
+    '''
+    start_time = time.time()
+    stats = _startStats(stats)
+    x, y = applyMask(x, y, mask)
+    n = x.size
+    h = n // 2 + 1
+    d_star = numpy.inf
+    alpha_star = 0
+    beta_star = 0
+    rows = max(1, chunk_size // n)
+    exhaustive = n * (n - 1) // 2 <= subsets
+    if exhaustive:
+        i, j = numpy.triu_indices(n, 1)
+        required = i.size
+    else:
+        rng = numpy.random.RandomState(seed)
+        required = _requiredSubsets(confidence, outlier_fraction, subsets)
+    if initial is not None:
+        alpha_star, beta_star = initial[:2]
+        r = numpy.absolute(y - (alpha_star + beta_star * x))
+        d_star = numpy.partition(r, h - 1)[h - 1]
+
+    drawn = 0
+    while drawn < required:
+        _report(callback, float(drawn) / required)
+        if time_budget is not None and time.time() - start_time > time_budget:
+            log.debug('leastMedianOfSquaresRandom: time budget exhausted '
+                      'after %d subsets', drawn)
+            break
+        b = min(rows, required - drawn)
+        if exhaustive:
+            r = i[drawn:drawn + b]
+            s = j[drawn:drawn + b]
+        else:
+            r = rng.randint(n, size=b)
+            s = rng.randint(n - 1, size=b)
+            s += s >= r
+        drawn += b
+        keep = x[r] != x[s]
+        r = r[keep]
+        s = s[keep]
+        if r.size == 0:
+            continue
+
+        beta = (y[r] - y[s]) / (x[r] - x[s])
+        alpha = y[r] - beta * x[r]
+        z = numpy.absolute(y - alpha[:, None] - beta[:, None] * x)
+        if stats is not None:
+            t = time.time()
+        z.partition(h - 1, axis=1)
+        if stats is not None:
+            stats.selectSeconds += time.time() - t
+            stats.candidates += r.size
+            stats.selections += r.size
+        d = z[:, h - 1]
+        k = d.argmin()
+        if d[k] < d_star:
+            d_star = d[k]
+            alpha_star = alpha[k]
+            beta_star = beta[k]
+            if stats is not None:
+                stats.updates += 1
+
+    if d_star < numpy.inf:
+        alpha_star, d_star = _leastMedianIntercept(y - beta_star * x, h)
+    log.debug('leastMedianOfSquaresRandom: %s %s (%d subsets)',
+              alpha_star, beta_star, drawn)
+    _finishStats('leastMedianOfSquaresRandom', stats, start_time)
+    if full_output:
+        return alpha_star, beta_star, d_star
+    return alpha_star, beta_star
+
+
+def leastTrimmedSquares(x, y, coverage=0.5, starts=500, steps=2, keep=10,
+                        partition_size=300, groups=5, seed=None,
+                        chunk_size=2 ** 16, initial=None, mask=None,
+                        full_output=False, callback=None, stats=None):
+    '''
+    Least trimmed squares fit by FAST-LTS [1]. Minimizes the sum of the h
+    smallest squared residuals, where h is the larger of n // 2 + 1 and
+    coverage * n, so that about 1 - coverage of the points may be outliers.
+
+    Each of starts candidate lines is drawn through a random pair of points
+    (or all pairs are tried, if there are no more than starts), and
+    improved by steps concentration steps (C-steps), each of which refits
+    the line by least squares to the h points it fits best and never
+    increases the trimmed sum of squares. The keep best candidates are
+    then iterated to convergence. The C-steps of a batch of candidates are
+    done together, in blocks of at most chunk_size residuals.
+
+    If n is more than 2 * partition_size, the starts are instead divided
+    among up to groups disjoint random subsets of partition_size points,
+    the keep best of each subset are improved on the union of the subsets,
+    and the keep best of those get steps C-steps on the whole data set,
+    after which only the best one is iterated to convergence. This way,
+    the cost of the starts doesn't grow with n. The seed is passed to
+    numpy.random.RandomState.
+
+    initial, if given, is the alpha, beta of a line to start from, e.g. the
+    fit of the data before more points were appended to it. It is iterated
+    to convergence along with the best candidates, so the fit is never
+    worse than it, and fewer starts are needed to track a fit as the data
+    grows.
+
+    If full_output is True, the trimmed sum of squares of the fit is
+    returned as well. The progress callback is described in FitCancelled,
+    the mask argument in applyMask, and the stats argument in FitStats.
+
+    [1] P. J. Rousseeuw and K. Van Driessen, "Computing LTS Regression for
+    Large Data Sets," Data Mining and Knowledge Discovery, vol. 12, no. 1,
+    pp. 29-45, Jan. 2006.
+    '''
+    start_time = time.time()
+    stats = _startStats(stats)
+    x, y = applyMask(x, y, mask)
+    n = x.size
+    if n < 2:
+        raise ValueError('at least 2 points are needed to fit a line')
+    h = _trimmedCoverage(n, coverage)
+    rng = numpy.random.RandomState(seed)
+
+    _report(callback, 0.)
+    if n > 2 * partition_size:
+        ngroups = min(groups, n // partition_size)
+        sample = rng.permutation(n)[:ngroups * partition_size]
+        best = []
+        for i, group in enumerate(numpy.split(sample, ngroups)):
+            xg = x[group]
+            yg = y[group]
+            alpha, beta = _lineStarts(xg, yg, starts // ngroups, rng)
+            alpha, beta, q = _cSteps(xg, yg, alpha, beta,
+                                     _trimmedCoverage(xg.size, coverage),
+                                     steps, chunk_size, stats)
+            best.append(_best(alpha, beta, q, keep))
+            _report(callback, 0.5 * (i + 1) / ngroups)
+        alpha, beta = [numpy.concatenate(a) for a in zip(*best)]
+        xs = x[sample]
+        ys = y[sample]
+        alpha, beta, q = _cSteps(xs, ys, alpha, beta,
+                                 _trimmedCoverage(xs.size, coverage), steps,
+                                 chunk_size, stats)
+        alpha, beta = _best(alpha, beta, q, keep)
+        alpha, beta, q = _cSteps(x, y, alpha, beta, h, steps, chunk_size,
+                                 stats)
+        alpha, beta = _best(alpha, beta, q, 1)
+    else:
+        alpha, beta = _lineStarts(x, y, starts, rng)
+        alpha, beta, q = _cSteps(x, y, alpha, beta, h, steps, chunk_size,
+                                 stats)
+        alpha, beta = _best(alpha, beta, q, keep)
+    if initial is not None:
+        alpha = numpy.append(alpha, initial[0])
+        beta = numpy.append(beta, initial[1])
+    _report(callback, 0.75)
+    alpha, beta, q = _cSteps(x, y, alpha, beta, h, None, chunk_size, stats)
+
+    k = q.argmin() if q.size else None
+    if k is None or not numpy.isfinite(q[k]):
+        raise ValueError('at least 2 distinct x values are needed to fit '
+                         'a line')
+    alpha_star, beta_star, q_star = alpha[k], beta[k], q[k]
+    log.debug('leastTrimmedSquares: %s %s (h = %d)', alpha_star, beta_star,
+              h)
+    _finishStats('leastTrimmedSquares', stats, start_time)
+    if full_output:
+        return alpha_star, beta_star, q_star
+    return alpha_star, beta_star
+
+
+def _trimmedCoverage(n, coverage):
+    return min(max(n // 2 + 1, int(math.ceil(coverage * n))), n)
+
+
+def _lineStarts(x, y, starts, rng):
+    '''
+    Returns the intercepts and slopes of the lines through starts random
+    pairs of points, or through all pairs if there are no more than
+    starts. Pairs with equal x are skipped.
+    '''
+    n = x.size
+    if n * (n - 1) // 2 <= starts:
+        r, s = numpy.triu_indices(n, 1)
+    else:
+        r = rng.randint(n, size=starts)
+        s = rng.randint(n - 1, size=starts)
+        s += s >= r
+    keep = x[r] != x[s]
+    r = r[keep]
+    s = s[keep]
+    beta = (y[r] - y[s]) / (x[r] - x[s])
+    return y[r] - beta * x[r], beta
+
+
+def _best(alpha, beta, q, keep):
+    k = numpy.argsort(q)[:keep]
+    return alpha[k], beta[k]
+
+
+def _cSteps(x, y, alpha, beta, h, steps, chunk_size, stats=None):
+    '''
+    Applies up to steps C-steps to each of the lines alpha + beta x, or
+    applies them until the lines stop improving if steps is None. Returns
+    the new alpha and beta, and the trimmed sums of squares, q, of the h
+    smallest squared residuals of the lines.
+    '''
+    # Center the data, so that the sums of the refits don't lose precision
+    x0 = x.mean()
+    y0 = y.mean()
+    xc = x - x0
+    yc = y - y0
+    xx = xc * xc
+    xy = xc * yc
+    alpha = numpy.array(alpha, dtype=numpy.float64) + beta * x0 - y0
+    beta = numpy.array(beta, dtype=numpy.float64)
+    q = numpy.empty(alpha.size)
+    rows = max(1, chunk_size // x.size)
+    for start in xrange(0, alpha.size, rows):
+        block = slice(start, start + rows)
+        a = alpha[block]
+        b = beta[block]
+        mask, qb = _trimmedSubsets(xc, yc, a, b, h, stats)
+        active = numpy.arange(a.size)
+        step = 0
+        while active.size and (steps is None or step < steps):
+            step += 1
+            # Refit each active line to its h best points, with one
+            # matrix-vector product per sum
+            count = mask.sum(axis=1)
+            sx = mask.dot(xc) / count
+            sy = mask.dot(yc) / count
+            sxx = mask.dot(xx) / count - sx * sx
+            sxy = mask.dot(xy) / count - sx * sy
+            ok = sxx > 0
+            nb = numpy.where(ok, sxy / numpy.where(ok, sxx, 1), b[active])
+            na = numpy.where(ok, sy - nb * sx, a[active])
+            nmask, nq = _trimmedSubsets(xc, yc, na, nb, h, stats)
+            # Keep iterating the lines that improved
+            improved = nq < qb[active]
+            better = active[improved]
+            a[better] = na[improved]
+            b[better] = nb[improved]
+            qb[better] = nq[improved]
+            if stats is not None:
+                stats.updates += better.size
+            active = better
+            mask = nmask[improved]
+        q[block] = qb
+    return alpha - beta * x0 + y0, beta, q
+
+
+def _trimmedSubsets(x, y, alpha, beta, h, stats=None):
+    '''
+    Returns a float mask of the h points with the smallest squared
+    residuals of each of the lines alpha + beta x (more if there are ties),
+    and the sums of those h squared residuals.
+    '''
+    r = y - alpha[:, None] - beta[:, None] * x
+    r *= r
+    if stats is not None:
+        t = time.time()
+    z = r.copy()
+    z.partition(h - 1, axis=1)
+    if stats is not None:
+        stats.selectSeconds += time.time() - t
+        stats.candidates += alpha.size
+        stats.selections += alpha.size
+    q = z[:, :h].sum(axis=1)
+    mask = (r <= z[:, h - 1, None]).astype(numpy.float64)
+    return mask, q
+
+
+def theilSen(x, y, approximate=False, samples=2 ** 16, confidence=0.95,
+             seed=None, mask=None, full_output=False, callback=None,
+             stats=None):
+    '''
+    Theil-Sen fit [1, 2]. The slope, beta, is the median of the slopes of
+    the lines through all pairs of points with distinct x, and the
+    intercept, alpha, is the median of y - beta x.
+
+    The median slope is found by randomized slope selection [3], in
+    expected O(n log n) time, without listing the n (n - 1) / 2 slopes:
+    the number of slopes below t is the number of pairs of points whose
+    order by y - t x is the reverse of their order by x, which is counted
+    like the inversions of a permutation. An interval of slopes that
+    contains the median is narrowed to the order statistics around it of
+    a sample of the slopes inside the interval, until few enough slopes are
+    left in it to list them.
+
+    If approximate is True, and there are more than samples slopes, beta is
+    instead the median of the slopes of samples random pairs of points,
+    which takes O(samples log samples) time.
+
+    If full_output is True, a confidence interval, (low, high), for beta is
+    returned as well. For the approximate fit, it is the distribution-free
+    interval for the median of all of the slopes, at the given confidence,
+    from the order statistics of the sampled slopes. For the exact fit, it
+    is (beta, beta). The seed is passed to numpy.random.RandomState. The
+    progress callback is described in FitCancelled, the mask argument in
+    applyMask, and the stats argument in FitStats.
+
+    [1] H. Theil, "A rank-invariant method of linear and polynomial
+    regression analysis," Proc. Koninklijke Nederlandse Akademie van
+    Wetenschappen, vol. 53, 1950.
+    [2] P. K. Sen, "Estimates of the regression coefficient based on
+    Kendall's tau," Journal of the American Statistical Association,
+    vol. 63, no. 324, pp. 1379-1389, Dec. 1968.
+    [3] M. B. Dillencourt, D. M. Mount and N. S. Netanyahu, "A randomized
+    algorithm for slope selection," International Journal of Computational
+    Geometry and Applications, vol. 2, no. 1, pp. 1-27, 1992.
+    '''
+    start_time = time.time()
+    stats = _startStats(stats)
+    x, y = applyMask(x, y, mask)
+    rng = numpy.random.RandomState(seed)
+    base, base_rank, distinct = _slopeOrder(x, y)
+    total = distinct.sum() // 2
+    if total == 0:
+        raise ValueError('at least 2 distinct x values are needed to fit '
+                         'a line')
+
+    if approximate and total > samples:
+        slopes = _randomSlopes(x, y, samples, rng)
+        slopes.sort()
+        if stats is not None:
+            stats.candidates += slopes.size
+        beta = numpy.median(slopes)
+        interval = _medianInterval(slopes, confidence)
+    else:
+        k = (total - 1) // 2
+        selected = _selectSlopes(x, y, base, base_rank, k, total - 1 - k,
+                                 total, rng, callback, stats)
+        beta = selected.mean()
+        interval = (beta, beta)
+
+    alpha = numpy.median(y - beta * x)
+    log.debug('theilSen: %s %s', alpha, beta)
+    _finishStats('theilSen', stats, start_time)
+    if full_output:
+        return alpha, beta, interval
+    return alpha, beta
+
+
+def repeatedMedian(x, y, approximate=False, samples=1024, confidence=0.95,
+                   seed=None, mask=None, full_output=False, callback=None,
+                   stats=None):
+    '''
+    Siegel's repeated median fit [1]. The slope, beta, is the median over
+    the points of the median of the slopes of the lines through each point
+    and the other points with a different x, and the intercept, alpha, is
+    the median of y - beta x. For an even number of values, the lower
+    median is used, as in [2].
+
+    The slope is found by the randomized algorithm of [2], in expected
+    O(n log n) time. The number of the slopes of each point below t is
+    counted for all points at once, like the inversions of a permutation
+    (see theilSen). An interval that contains beta is narrowed using a
+    sample of the slopes inside it, from which the medians of the points
+    are estimated, until few enough slopes are left in it to list them.
+
+    If approximate is True, beta is instead the median of the medians of
+    samples random points, each over the slopes to samples random other
+    points, which takes O(samples**2) time. If there are no more than
+    samples points, this is exact.
+
+    If full_output is True, a confidence interval, (low, high), for beta is
+    returned as well. For the approximate fit, it is the distribution-free
+    interval for the median over all of the points, at the given
+    confidence, from the order statistics of the sampled medians, which
+    ignores the error of the medians of the points when n is larger than
+    samples. For the exact fit, it is (beta, beta). The seed is passed to
+    numpy.random.RandomState. The progress callback is described in
+    FitCancelled, the mask argument in applyMask, and the stats argument in
+    FitStats.
+
+    [1] A. F. Siegel, "Robust regression using repeated medians,"
+    Biometrika, vol. 69, no. 1, pp. 242-244, Apr. 1982.
+    [2] J. Matousek, D. M. Mount and N. S. Netanyahu, "Efficient randomized
+    algorithms for the repeated median line estimator," Algorithmica,
+    vol. 20, no. 2, pp. 136-150, 1998.
+    '''
+    start_time = time.time()
+    stats = _startStats(stats)
+    x, y = applyMask(x, y, mask)
+    rng = numpy.random.RandomState(seed)
+    base, base_rank, distinct = _slopeOrder(x, y)
+    valid = numpy.flatnonzero(distinct)
+    if valid.size == 0:
+        raise ValueError('at least 2 distinct x values are needed to fit '
+                         'a line')
+
+    if approximate:
+        if valid.size > samples:
+            points = valid[rng.randint(valid.size, size=samples)]
+        else:
+            points = valid
+        medians = numpy.sort(_pointMedians(x, y, points, samples, rng,
+                                           stats))
+        beta = medians[(medians.size - 1) // 2]
+        interval = _medianInterval(medians, confidence)
+    else:
+        beta = _selectRepeatedMedian(x, y, base, base_rank, distinct, rng,
+                                     callback, stats)
+        interval = (beta, beta)
+
+    alpha = numpy.median(y - beta * x)
+    log.debug('repeatedMedian: %s %s', alpha, beta)
+    _finishStats('repeatedMedian', stats, start_time)
+    if full_output:
+        return alpha, beta, interval
+    return alpha, beta
+
+
+def _slopeOrder(x, y):
+    '''
+    Returns the order of the points by x, and then y, their ranks in that
+    order, and the number of points with a different x than each point.
+    '''
+    base = numpy.lexsort((y, x))
+    base_rank = numpy.empty(x.size, dtype=numpy.intp)
+    base_rank[base] = numpy.arange(x.size)
+    xs = x[base]
+    first = numpy.searchsorted(xs, xs, 'left')
+    last = numpy.searchsorted(xs, xs, 'right')
+    distinct = numpy.empty(x.size, dtype=numpy.int64)
+    distinct[base] = x.size - (last - first)
+    return base, base_rank, distinct
+
+
+def _ranksAt(x, y, t, base, base_rank):
+    '''
+    Returns the ranks of the points in the order of y - t x, which is the
+    order of the lines of slope t through them, with ties broken by
+    base_rank. Two points with distinct x swap places in this order when t
+    passes the slope of the line through them, and points with the same x
+    never do. At t = -inf, this is the order of _slopeOrder.
+    '''
+    if t == -numpy.inf:
+        return base_rank
+    if t == numpy.inf:
+        key = -x[base]
+    else:
+        key = y[base] - t * x[base]
+    # A stable sort of the points in base order breaks the ties by
+    # base_rank, and is faster than lexsort
+    rank = numpy.empty(x.size, dtype=numpy.intp)
+    rank[base[key.argsort(kind='mergesort')]] = numpy.arange(x.size)
+    return rank
+
+
+def _inversionLevels(v):
+    '''
+    Splits the inversions of v, a permutation of range(n), i.e. the pairs
+    of positions p < q with v[p] > v[q], by the highest bit in which v[p]
+    and v[q] differ. This is a radix sort of v from the highest bit, which
+    partitions the values stably by each bit in turn, in O(n) per bit.
+    Before the partition by bit b, the values that agree in the higher bits
+    form a group, and since v is a permutation, the group of the values
+    starting at g, a multiple of 2**(b + 1), starts at position g, after g
+    / 2 values with bit b set.
+
+    Yields (pos, npos, bit, ones_before, ones_start) for each bit, from the
+    highest. pos and npos are the positions in v of the values in their
+    order before and after the partition by the bit, and the other arrays
+    are indexed like pos. ones_before is the number of values with the bit
+    set before each value within its group, and ones_start is the position
+    of the first value of its group with the bit set after the partition.
+    A value without the bit forms inversions with the ones_before values
+    with the bit before it, which end up at npos[ones_start:ones_start +
+    ones_before], and a value with the bit at position i forms inversions
+    with the ones_start - i + ones_before values without it after it.
+    '''
+    n = v.size
+    a = v
+    pos = numpy.arange(n)
+    index = numpy.arange(n)
+    for b in xrange(max(int(n - 1).bit_length(), 1) - 1, -1, -1):
+        bit = (a >> b) & 1
+        start = a & ~((1 << (b + 1)) - 1)
+        ones_before = numpy.cumsum(bit)
+        ones_before -= bit
+        ones_before -= start >> 1
+        ones_start = start
+        ones_start += 1 << b
+        numpy.minimum(ones_start, n, out=ones_start)
+        new = numpy.where(bit, ones_start + ones_before, index - ones_before)
+        npos = numpy.empty_like(pos)
+        npos[new] = pos
+        yield pos, npos, bit, ones_before, ones_start
+        a = v[npos]
+        pos = npos
+
+
+def _countInversions(v, per_element=False):
+    '''
+    Returns the number of inversions of v, a permutation of range(n), or,
+    if per_element is True, the number of inversions that each position of
+    v is part of.
+    '''
+    if per_element:
+        counts = numpy.zeros(v.size, dtype=numpy.int64)
+        index = numpy.arange(v.size)
+    total = 0
+    for pos, _npos, bit, ones_before, ones_start in _inversionLevels(v):
+        if per_element:
+            counts[pos] += numpy.where(bit, ones_start - index + ones_before,
+                                       ones_before)
+        else:
+            total += ones_before.sum() - ones_before.dot(bit)
+    return counts if per_element else int(total)
+
+
+def _inversionPairs(v, which=None):
+    '''
+    Returns the inversions of v, a permutation of range(n), as arrays of
+    the earlier and later positions, p and q. If which is given, only the
+    inversions with those indices (sorted, in an arbitrary but fixed
+    numbering of the inversions) are returned, e.g. to sample them.
+    '''
+    earlier = []
+    later = []
+    offset = 0
+    for pos, npos, bit, ones_before, ones_start in _inversionLevels(v):
+        z = numpy.flatnonzero((bit == 0) & (ones_before > 0))
+        k = ones_before[z]
+        ends = numpy.cumsum(k)
+        if which is None:
+            e = numpy.repeat(numpy.arange(z.size), k)
+            local = numpy.arange(ends[-1] if ends.size else 0)
+        else:
+            lo, hi = numpy.searchsorted(which, [offset, offset +
+                                               (ends[-1] if ends.size else 0)])
+            local = which[lo:hi] - offset
+            e = numpy.searchsorted(ends, local, 'right')
+        if ends.size:
+            offset += ends[-1]
+        r = local - (ends[e] - k[e])
+        later.append(pos[z[e]])
+        earlier.append(npos[ones_start[z[e]] + r])
+    return numpy.concatenate(earlier), numpy.concatenate(later)
+
+
+def _bandPairs(x, y, lo_rank, hi_rank, which=None):
+    '''
+    Returns the pairs of points, as arrays i and j, whose slopes are at
+    least lo and less than hi, given the ranks of the points at lo and hi,
+    or only those with the indices in which (see _inversionPairs).
+    '''
+    order = numpy.empty(x.size, dtype=numpy.intp)
+    order[lo_rank] = numpy.arange(x.size)
+    p, q = _inversionPairs(hi_rank[order], which)
+    return order[p], order[q]
+
+
+def _slopes(x, y, i, j):
+    return (y[i] - y[j]) / (x[i] - x[j])
+
+
+def _selectSlopes(x, y, base, base_rank, first, last, total, rng,
+                  callback=None, stats=None):
+    '''
+    Returns the first-th through last-th smallest of the total slopes of
+    the pairs of points with distinct x, by randomized slope selection.
+    '''
+    n = x.size
+    limit = max(8 * n, 2 ** 20)
+    lo = -numpy.inf
+    hi = numpy.inf
+    lo_rank = base_rank
+    hi_rank = _ranksAt(x, y, hi, base, base_rank)
+    below_lo = 0
+    below_hi = total
+    margin = 3.
+    while below_hi - below_lo > limit:
+        _report(callback, min(0.9, math.log(total / float(below_hi -
+                                                          below_lo)) /
+                              max(math.log(total / float(limit)), 1.)))
+        m = below_hi - below_lo
+        samples = min(4 * n, m)
+        if below_lo == 0 and below_hi == total:
+            # Every slope is in the band, so sample pairs of points directly
+            slopes = _randomSlopes(x, y, samples, rng)
+        else:
+            which = numpy.sort(rng.randint(m, size=samples)
+                               .astype(numpy.int64))
+            slopes = _slopes(x, y, *_bandPairs(x, y, lo_rank, hi_rank, which))
+        if stats is not None:
+            stats.candidates += slopes.size
+            stats.updates += 1
+        # Bracket the wanted ranks with order statistics of the sample
+        spread = margin * math.sqrt(samples)
+        i = int(math.floor((first - below_lo) * samples / float(m) - spread))
+        j = int(math.ceil((last + 1 - below_lo) * samples / float(m) +
+                          spread))
+        if i <= 0 and j >= samples:
+            break
+        slopes.partition([k for k in (i, j) if 0 < k < samples])
+        narrowed = False
+        if i > 0:
+            t = slopes[i]
+            rank = _ranksAt(x, y, t, base, base_rank)
+            below = _countInversions(rank[base])
+            if below <= first and t > lo:
+                lo, lo_rank, below_lo = t, rank, below
+                narrowed = True
+        if j < samples:
+            t = numpy.nextafter(slopes[j], numpy.inf)
+            rank = _ranksAt(x, y, t, base, base_rank)
+            below = _countInversions(rank[base])
+            if below > last and t < hi:
+                hi, hi_rank, below_hi = t, rank, below
+                narrowed = True
+        if not narrowed:
+            if slopes.min() == slopes.max():
+                # The remaining slopes are equal, up to rounding
+                return numpy.full(last - first + 1, slopes[0])
+            margin *= 2
+
+    slopes = _slopes(x, y, *_bandPairs(x, y, lo_rank, hi_rank))
+    if stats is not None:
+        stats.candidates += slopes.size
+        stats.selections += 1
+    # Rounding may misplace slopes that are almost equal to lo or hi
+    wanted = numpy.clip(numpy.arange(first, last + 1) - below_lo, 0,
+                        max(slopes.size - 1, 0))
+    slopes.partition(wanted)
+    return slopes[wanted]
+
+
+def _selectRepeatedMedian(x, y, base, base_rank, distinct, rng,
+                          callback=None, stats=None):
+    '''
+    Returns the repeated median slope, by randomized selection over the
+    medians of the points [2]. The median of a point is below t if more
+    than k of its slopes are, where k = (distinct - 1) // 2, so the number
+    of medians below t follows from the counts of the slopes of each point
+    below t.
+    '''
+    n = x.size
+    limit = max(8 * n, 2 ** 20)
+    valid = distinct > 0
+    k = (distinct - 1) // 2
+    K = (numpy.count_nonzero(valid) - 1) // 2
+    lo = -numpy.inf
+    hi = numpy.inf
+    lo_rank = base_rank
+    hi_rank = _ranksAt(x, y, hi, base, base_rank)
+    lo_count = numpy.zeros(n, dtype=numpy.int64)
+    hi_count = distinct
+    below_lo = 0
+    margin = 3.
+    while True:
+        active = valid & (lo_count <= k) & (k < hi_count)
+        points = numpy.flatnonzero(active)
+        wanted = K - below_lo
+        band = (hi_count - lo_count)
+        m = band.sum() // 2
+        _report(callback, min(0.9, 1. - points.size / float(n)))
+        if m <= limit:
+            slopes, owners = _pointSlopes(x, y, lo_rank, hi_rank, active)
+            medians = _groupSelect(slopes, owners, points,
+                                   k[points] - lo_count[points])
+            break
+        if points.size * n <= 8 * limit:
+            medians = _exactPointMedians(x, y, points, k[points], stats)
+            break
+
+        if lo == -numpy.inf and hi == numpy.inf:
+            # Every slope is in the band, so estimate the medians of a
+            # sample of the points from random partners
+            sample = points[rng.randint(points.size, size=min(points.size,
+                                                              4096))]
+            estimates = numpy.sort(_pointMedians(x, y, sample, 2048, rng,
+                                                 stats))
+        else:
+            # Estimate the medians of the active points from a sample of
+            # the slopes in the band
+            which = numpy.sort(rng.randint(m, size=min(m, 4 * n))
+                               .astype(numpy.int64))
+            slopes, owners = _pointSlopes(x, y, lo_rank, hi_rank, active,
+                                          which)
+            counts = numpy.bincount(owners, minlength=n)[points]
+            sampled = counts > 0
+            fraction = ((k[points] - lo_count[points] + 0.5) /
+                        band[points].astype(numpy.float64))
+            estimates = numpy.sort(_groupSelect(
+                slopes, owners, points[sampled],
+                (fraction[sampled] * counts[sampled]).astype(numpy.int64)))
+            if stats is not None:
+                stats.candidates += slopes.size
+        if stats is not None:
+            stats.updates += 1
+        # Bracket the wanted median between the order statistics of the
+        # estimates around it
+        e = estimates.size
+        spread = margin * math.sqrt(e)
+        i = int(math.floor(wanted * e / float(points.size) - spread))
+        j = int(math.ceil((wanted + 1) * e / float(points.size) + spread))
+        if i <= 0 and j >= e:
+            medians = _exactPointMedians(x, y, points, k[points], stats)
+            break
+        narrowed = False
+        if i > 0:
+            t = estimates[i]
+            rank, count = _countsAt(x, y, t, base, base_rank)
+            below = numpy.count_nonzero(valid & (count > k))
+            if below <= K and t > lo:
+                lo, lo_rank, lo_count, below_lo = t, rank, count, below
+                narrowed = True
+        if j < e:
+            t = numpy.nextafter(estimates[j], numpy.inf)
+            rank, count = _countsAt(x, y, t, base, base_rank)
+            below = numpy.count_nonzero(valid & (count > k))
+            if below > K and t < hi:
+                hi, hi_rank, hi_count = t, rank, count
+                narrowed = True
+        if not narrowed:
+            margin *= 2
+
+    medians.partition(wanted)
+    return medians[wanted]
+
+
+def _countsAt(x, y, t, base, base_rank):
+    '''
+    Returns the ranks of the points at t (see _ranksAt), and the number of
+    the slopes of each point that are less than t.
+    '''
+    rank = _ranksAt(x, y, t, base, base_rank)
+    count = numpy.empty(x.size, dtype=numpy.int64)
+    count[base] = _countInversions(rank[base], per_element=True)
+    return rank, count
+
+
+def _pointSlopes(x, y, lo_rank, hi_rank, active, which=None):
+    '''
+    Returns the slopes between lo and hi (see _bandPairs) of the active
+    points, and the point each of them belongs to. Each slope belongs to
+    both of its points.
+    '''
+    i, j = _bandPairs(x, y, lo_rank, hi_rank, which)
+    slopes = _slopes(x, y, i, j)
+    owners = numpy.concatenate((i, j))
+    slopes = numpy.concatenate((slopes, slopes))
+    keep = active[owners]
+    return slopes[keep], owners[keep]
+
+
+def _groupSelect(slopes, owners, points, r):
+    '''
+    Returns the r-th smallest of the slopes that belong to each of the
+    points, or the nearest one that exists.
+    '''
+    order = numpy.lexsort((slopes, owners))
+    owners = owners[order]
+    first = numpy.searchsorted(owners, points, 'left')
+    last = numpy.searchsorted(owners, points, 'right') - 1
+    return slopes[order][numpy.clip(first + r, first, last)]
+
+
+def _exactPointMedians(x, y, points, k, stats=None):
+    '''
+    Returns the k-th smallest slope of each of the points, by computing
+    all of their slopes.
+    '''
+    n = x.size
+    medians = numpy.empty(points.size)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        for i, p in enumerate(points):
+            dx = x - x[p]
+            slopes = (y - y[p]) / dx
+            slopes[dx == 0] = numpy.inf
+            slopes.partition(k[i])
+            medians[i] = slopes[k[i]]
+    if stats is not None:
+        stats.candidates += points.size * n
+        stats.selections += points.size
+    return medians
+
+
+def _pointMedians(x, y, points, partners, rng, stats=None):
+    '''
+    Returns the lower median of the slopes of each of the points to
+    partners random points, or to all points if there are no more than
+    partners of them. Points without slopes to other x are left out.
+    '''
+    n = x.size
+    if n <= partners:
+        others = numpy.tile(numpy.arange(n), (points.size, 1))
+    else:
+        others = rng.randint(n, size=(points.size, partners))
+    dx = x[others] - x[points, None]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        slopes = (y[others] - y[points, None]) / dx
+    slopes[dx == 0] = numpy.inf
+    slopes.sort(axis=1)
+    counts = numpy.count_nonzero(dx, axis=1)
+    keep = counts > 0
+    if stats is not None:
+        stats.candidates += slopes.size
+        stats.selections += points.size
+    return slopes[keep, (counts[keep] - 1) // 2]
+
+
+def _randomSlopes(x, y, samples, rng):
+    '''
+    Returns the slopes of samples pairs of points with distinct x, drawn
+    uniformly with replacement.
+    '''
+    n = x.size
+    slopes = []
+    needed = samples
+    while needed > 0:
+        i = rng.randint(n, size=2 * needed)
+        j = rng.randint(n, size=2 * needed)
+        keep = x[i] != x[j]
+        s = _slopes(x, y, i[keep], j[keep])[:needed]
+        slopes.append(s)
+        needed -= s.size
+    return numpy.concatenate(slopes)
+
+
+def _medianInterval(values, confidence):
+    '''
+    Returns the distribution-free confidence interval for the median of a
+    population from the sorted values of a random sample of it, using the
+    normal approximation to the binomial distribution of the number of
+    values below the median.
+    '''
+    m = values.size
+    half = _normalQuantile(0.5 + 0.5 * confidence) * math.sqrt(m) / 2
+    low = max(int(math.floor(m / 2. - half)) - 1, 0)
+    high = min(int(math.ceil(m / 2. + half)), m - 1)
+    return values[low], values[high]
+
+
+def _normalQuantile(p):
+    '''
+    Returns the p-th quantile of the standard normal distribution, by
+    bisection.
+    '''
+    low, high = -40., 40.
+    for _ in xrange(100):
+        z = 0.5 * (low + high)
+        if 0.5 * math.erfc(-z / math.sqrt(2)) < p:
+            low = z
+        else:
+            high = z
+    return 0.5 * (low + high)
+
+
+def _requiredSubsets(confidence, outlier_fraction, subsets, size=2):
+    '''
+    Returns the number of random subsets of size points needed to draw at
+    least one subset without outliers with the given confidence, capped at
+    subsets.
+    '''
+    clean = (1 - outlier_fraction) ** size
+    if clean >= 1:
+        return 1
+    if clean <= 0:
+        return subsets
+    required = math.log(1 - confidence) / math.log(1 - clean)
+    return int(min(max(math.ceil(required), 1), subsets))
+
+
+def _leastMedianIntercept(r, h):
+    '''
+    Returns the intercept, alpha, that minimizes the h-th smallest value of
+    abs(r - alpha), and that value. This is the middle of the shortest
+    window containing h of the values of r.
+    '''
+    r = numpy.sort(r)
+    widths = r[h - 1:] - r[:r.size - h + 1]
+    k = widths.argmin()
+    return (r[k] + r[k + h - 1]) / 2, widths[k] / 2
+
+
+class CostModel(object):
+    '''
+    A model of the running time of an estimator on n points,
+
+        seconds = overhead + coefficient * n**power * log2(n)**log_power,
+
+    e.g. CostModel(2e-7, 2, 1) for an O(n^2 log n) estimator. The
+    coefficients of the estimators registered here were measured with
+    visfitter.benchmark on a modest machine; they are only meant to tell
+    a fit of seconds from one of hours.
+    '''
+
+    def __init__(self, coefficient, power=1, log_power=0, overhead=0.):
+        self.coefficient = coefficient
+        self.power = power
+        self.log_power = log_power
+        self.overhead = overhead
+
+    @property
+    def complexity(self):
+        terms = []
+        if self.power:
+            terms.append('n' if self.power == 1 else
+                         'n^{}'.format(self.power))
+        if self.log_power:
+            terms.append('log n' if self.log_power == 1 else
+                         'log^{} n'.format(self.log_power))
+        return 'O({})'.format(' '.join(terms) or '1')
+
+    def seconds(self, n):
+        n = max(n, 2)
+        return (self.overhead + self.coefficient * float(n) ** self.power *
+                math.log(n, 2) ** self.log_power)
+
+
+class Estimator(object):
+    '''
+    An entry of the estimator registry, ESTIMATORS, which describes an
+    estimator for the GUI and the command line tools.
+
+    key: the short name of the estimator, e.g. for the command line
+    name: the name of the estimator, e.g. for the Fit menu
+    description: a sentence describing it, e.g. for a tool tip
+    func: the estimator, func(x, y, **kwargs)
+    cost: a CostModel of its running time
+    exact: whether it finds the exact optimum of its objective
+    randomized: whether its result depends on a random seed, which it
+        takes as seed, to be passed to numpy.random.RandomState
+    weights: whether it takes per-point weights
+    streaming: whether it can fit the data in chunks, in a single pass
+    parallel: whether it takes a number of worker processes
+    cancellable: whether it takes a progress callback (see FitCancelled)
+    multiple: whether it is a multiple_regression estimator, which takes
+        an (n, k) array of regressors
+    fallback: the key of a faster, approximate estimator of the same
+        objective, to use instead on data sets that are too large
+    color: the color of its line in the plot
+    kwargs: the keyword arguments that func is called with
+
+    Calling the entry calls func with kwargs, updated with any keyword
+    arguments given.
+    '''
+
+    def __init__(self, key, name, description, func, cost, exact=True,
+                 randomized=False, weights=False, streaming=False,
+                 parallel=False,
+                 cancellable=True, multiple=False, fallback=None,
+                 color='k', **kwargs):
+        self.key = key
+        self.name = name
+        self.description = description
+        self.func = func
+        self.cost = cost
+        self.exact = exact
+        self.randomized = randomized
+        self.weights = weights
+        self.streaming = streaming
+        self.parallel = parallel
+        self.cancellable = cancellable
+        self.multiple = multiple
+        self.fallback = fallback
+        self.color = color
+        self.kwargs = kwargs
+
+    @property
+    def complexity(self):
+        return self.cost.complexity
+
+    def estimateSeconds(self, n, processes=1):
+        '''
+        Returns the estimated running time of a fit of n points, using
+        processes worker processes if the estimator is parallel.
+        '''
+        seconds = self.cost.seconds(n)
+        if self.parallel and processes > 1:
+            seconds /= processes
+        return seconds
+
+    def __call__(self, x, y, **kwargs):
+        if kwargs:
+            kwargs = dict(self.kwargs, **kwargs)
+        else:
+            kwargs = self.kwargs
+        return self.func(x, y, **kwargs)
+
+    def __repr__(self):
+        return 'Estimator({!r}, {})'.format(self.key, self.complexity)
+
+
+# The estimator registry, in the order of the Fit menu. Estimators of other
+# modules, e.g. multiple_regression, are added with registerEstimator when
+# they are imported.
+ESTIMATORS = collections.OrderedDict()
+
+
+def registerEstimator(estimator):
+    '''
+    Adds an Estimator to the registry, and returns it.
+    '''
+    if estimator.key in ESTIMATORS:
+        raise ValueError('an estimator is already registered as {!r}'
+                         ''.format(estimator.key))
+    ESTIMATORS[estimator.key] = estimator
+    return estimator
+
+
+def getFallback(estimator, n, seconds, processes=1):
+    '''
+    Follows the fallbacks of estimator until one is estimated to fit n
+    points within seconds, and returns it, or the last one if none is fast
+    enough. Returns estimator itself if it is fast enough, or has no
+    fallback.
+    '''
+    seen = set()
+    while (estimator.estimateSeconds(n, processes) > seconds and
+           estimator.fallback is not None and estimator.key not in seen):
+        seen.add(estimator.key)
+        estimator = ESTIMATORS[estimator.fallback]
+    return estimator
+
+
+registerEstimator(Estimator(
+    'ls', 'Least Squares', 'Fit using least squares', leastSquares,
+    CostModel(1e-8), streaming=True, cancellable=False, color='r'))
+registerEstimator(Estimator(
+    'lms', 'Least Median of Squares',
+    'Fit using the least median of squares (the (n // 2 + 1)-th smallest '
+    'absolute residual), by sweeping the dual arrangement; about 3 s for '
+    '1000 points', leastMedianOfSquaresSweep, CostModel(3.2e-7, 2, 1),
+    fallback='lms-random', color='b'))
+registerEstimator(Estimator(
+    'lms-steele-steiger', 'Least Median of Squares (Steele-Steiger)',
+    'Fit using Algorithm 2 of Steele and Steiger', leastMedianOfSquares,
+    CostModel(7.5e-9, 3), parallel=True, fallback='lms-random',
+    color='m'))
+registerEstimator(Estimator(
+    'lms-crude', 'Least Median of Squares (Crude)',
+    'Fit using the crude algorithm of Steele and Steiger; for even n, it '
+    'minimizes the mean of the two middle absolute residuals',
+    leastMedianOfSquaresCrude, CostModel(1.3e-7, 4), parallel=True,
+    fallback='lms', color=(128, 128, 0)))
+registerEstimator(Estimator(
+    'lms-random', 'Least Median of Squares (Random Subsets)',
+    'Fit using the least median of squares of random subsets',
+    leastMedianOfSquaresRandom, CostModel(3.5e-7, overhead=0.01),
+    exact=False, randomized=True, color='g'))
+registerEstimator(Estimator(
+    'lts', 'Least Trimmed Squares', 'Fit using least trimmed squares '
+    '(FAST-LTS)', leastTrimmedSquares, CostModel(1.6e-6, overhead=0.02),
+    exact=False, randomized=True, color=(255, 128, 0)))
+registerEstimator(Estimator(
+    'theil-sen', 'Theil-Sen', 'Fit using the median of the pairwise slopes '
+    '(Theil-Sen)', theilSen, CostModel(2e-8, 1, 2),
+    fallback='theil-sen-approx', color=(0, 160, 160)))
+registerEstimator(Estimator(
+    'theil-sen-approx', 'Theil-Sen (Approximate)', 'Fit using the median '
+    'of a random sample of the pairwise slopes, with a confidence interval',
+    theilSen, CostModel(5e-7, overhead=0.02), exact=False,
+    randomized=True, color=(0, 160, 160), approximate=True,
+    full_output=True))
+registerEstimator(Estimator(
+    'repeated-median', 'Repeated Median', 'Fit using Siegel\'s repeated '
+    'median', repeatedMedian, CostModel(5.5e-8, 1, 2, overhead=0.8),
+    fallback='repeated-median-approx', color=(160, 0, 160)))
+registerEstimator(Estimator(
+    'repeated-median-approx', 'Repeated Median (Approximate)', 'Fit using '
+    'Siegel\'s repeated median of a random sample of the points, with a '
+    'confidence interval', repeatedMedian, CostModel(3e-7, overhead=0.12),
+    exact=False, randomized=True, color=(160, 0, 160), approximate=True,
+    full_output=True))
+
+
 def getSimpleData():
     import random
     random.seed(0)
@@ -179,9 +1878,19 @@ if __name__ == '__main__':
     plt.plot(x2, c[0] + c[1] * x2, 'b-', label='LS')
 
     # least median of squares
-    c = leastMedianOfSquaresCrude(x, y)
+    c = leastMedianOfSquaresSweep(x, y)
     plt.plot(x2, c[0] + c[1] * x2, 'g-', label='LMS')
 
+    # least trimmed squares
+    c = leastTrimmedSquares(x, y)
+    plt.plot(x2, c[0] + c[1] * x2, 'm-', label='LTS')
+
+    # median slopes
+    c = theilSen(x, y)
+    plt.plot(x2, c[0] + c[1] * x2, 'c-', label='Theil-Sen')
+    c = repeatedMedian(x, y)
+    plt.plot(x2, c[0] + c[1] * x2, 'y-', label='RM')
+
     # Show the plot
     plt.xlim(0, 10)
     plt.ylim(0, 8)
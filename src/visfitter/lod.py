@@ -0,0 +1,182 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Level of detail for scatter plots that are too large to draw point by
+point.
+'''
+
+# std lib imports
+import time
+import logging
+log = logging.getLogger(__name__)
+
+# third party imports
+import numpy
+
+
+class DecimationPyramid(object):
+    '''
+    A multiresolution sample of a data set, for drawing only what is
+    visible at the current zoom.
+
+    Level 0 holds all of the points, sorted by x. Each following level
+    holds a random subset of about 1 / factor of the points of the level
+    before it, down to min_points, so every level is a uniform random
+    sample of the data set. Since the subsets are taken with a mask, the
+    levels stay sorted by x, and the points in an x range are found in any
+    level with a binary search. The levels also hold the index of each
+    point in x and y, so that per-point values, e.g. residuals, can be
+    looked up for the points that are drawn.
+    '''
+
+    def __init__(self, x, y, factor=4, min_points=4096, seed=0):
+        start = time.time()
+        x = numpy.asarray(x, dtype=numpy.float64)
+        y = numpy.asarray(y, dtype=numpy.float64)
+        self.factor = factor
+        self.min_points = min_points
+        self.size = x.size
+        if x.size:
+            self.bounds = (x.min(), x.max(), y.min(), y.max())
+        else:
+            self.bounds = (0., 1., 0., 1.)
+        order = numpy.argsort(x, kind='mergesort')
+        self.levels = [(x[order], y[order], order)]
+        self._rng = numpy.random.RandomState(seed)
+        self._addLevels()
+        log.debug('DecimationPyramid: %d levels for %d points in %.3f s',
+                  len(self.levels), self.size, time.time() - start)
+
+    def _addLevels(self):
+        level = self.levels[-1]
+        while level[0].size > self.min_points:
+            keep = self._rng.random_sample(level[0].size) < 1. / self.factor
+            level = tuple(a[keep] for a in level)
+            self.levels.append(level)
+
+    def extend(self, x, y):
+        '''
+        Adds the points x, y, e.g. rows appended to a file. The new points
+        are sampled into each level as they would have been if they had
+        been there from the start, and merged into it in O(size of the
+        level), so adding k points takes O(n + k log k) time.
+        '''
+        x = numpy.asarray(x, dtype=numpy.float64)
+        y = numpy.asarray(y, dtype=numpy.float64)
+        if x.size == 0:
+            return
+        if self.size:
+            xmin, xmax, ymin, ymax = self.bounds
+            self.bounds = (min(xmin, x.min()), max(xmax, x.max()),
+                           min(ymin, y.min()), max(ymax, y.max()))
+        else:
+            self.bounds = (x.min(), x.max(), y.min(), y.max())
+        order = numpy.argsort(x, kind='mergesort')
+        new = (x[order], y[order], order + self.size)
+        self.size += x.size
+        for i, level in enumerate(self.levels):
+            if i:
+                keep = self._rng.random_sample(new[0].size) < 1. / self.factor
+                new = tuple(a[keep] for a in new)
+            # Insert after equal x, so that the merge is stable
+            at = level[0].searchsorted(new[0], 'right')
+            self.levels[i] = tuple(numpy.insert(a, at, b)
+                                   for a, b in zip(level, new))
+        self._addLevels()
+        log.debug('DecimationPyramid: %d points added, %d levels for %d '
+                  'points', x.size, len(self.levels), self.size)
+
+    def fraction(self, level):
+        '''
+        Returns the fraction of the data set held by level.
+        '''
+        return self.levels[level][0].size / float(max(self.size, 1))
+
+    def _slice(self, level, xmin, xmax):
+        lx, ly, li = self.levels[level]
+        i = lx.searchsorted(xmin, 'left')
+        j = lx.searchsorted(xmax, 'right')
+        return lx[i:j], ly[i:j], li[i:j]
+
+    def _select(self, xmin, xmax, ymin, ymax, max_points):
+        '''
+        Returns the finest level which is estimated to have no more than
+        max_points points in the box, and the points of that level which
+        are in it, and their indices.
+        '''
+        # The x range of the level is found in O(log n), but the y range
+        # needs a scan, so start from the finest level with at most
+        # max_points points in the x range...
+        level = len(self.levels) - 1
+        for i in xrange(len(self.levels)):
+            lx = self.levels[i][0]
+            count = (lx.searchsorted(xmax, 'right') -
+                     lx.searchsorted(xmin, 'left'))
+            if count <= max_points:
+                level = i
+                break
+        sx, sy, si = self._slice(level, xmin, xmax)
+        inside = (sy >= ymin) & (sy <= ymax)
+        # ...then go to finer levels while the fraction of the x range
+        # inside the y range says they will fit too
+        while level > 0 and sx.size:
+            ratio = inside.sum() / float(sx.size)
+            fx, fy, fi = self._slice(level - 1, xmin, xmax)
+            if fx.size * ratio > max_points:
+                break
+            level -= 1
+            sx, sy, si = fx, fy, fi
+            inside = (sy >= ymin) & (sy <= ymax)
+        return level, sx[inside], sy[inside], si[inside]
+
+    def estimateCount(self, xmin, xmax, ymin, ymax, max_points=2 ** 16):
+        '''
+        Returns an estimate of the number of points of the data set in the
+        box, from a level with no more than about max_points of them.
+        '''
+        level, sx = self._select(xmin, xmax, ymin, ymax, max_points)[:2]
+        return sx.size / self.fraction(level)
+
+    def points(self, xmin, xmax, ymin, ymax, max_points=2 ** 14,
+               full_output=False):
+        '''
+        Returns the x and y arrays of the points of the finest level with
+        no more than about max_points points in the box, and the fraction
+        of the data set that level holds. If full_output is True, the
+        indices of the points in the data set are returned as well.
+        '''
+        level, sx, sy, si = self._select(xmin, xmax, ymin, ymax, max_points)
+        if full_output:
+            return sx, sy, self.fraction(level), si
+        return sx, sy, self.fraction(level)
+
+    def density(self, xmin, xmax, ymin, ymax, bins=(256, 256),
+                max_points=2 ** 21):
+        '''
+        Returns a 2D histogram of the points in the box, with shape bins and
+        x along the first axis, binned from the finest level with no more
+        than about max_points points in the box and scaled to estimate the
+        counts of the whole data set.
+        '''
+        level, sx, sy = self._select(xmin, xmax, ymin, ymax, max_points)[:3]
+        counts, _xedges, _yedges = numpy.histogram2d(sx, sy, bins,
+                                    range=((xmin, xmax), (ymin, ymax)))
+        return counts / self.fraction(level)
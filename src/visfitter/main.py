@@ -23,6 +23,8 @@
 import logging
 import argparse
 import sys
+import time
+startTime = time.time()
 
 # third party imports
 from PySide import QtGui, QtCore
@@ -39,7 +41,15 @@ if __name__ == '__main__':
 from visfitter.exception_handling import install_excepthook
 
 
-def run(debug):
+def run(debug, profile_startup=False):
+    # Time the rest of the startup, including the imports
+    timer = None
+    if profile_startup:
+        from visfitter.import_timing import ImportTimer
+        timer = ImportTimer(startTime)
+        timer.mark('Import PySide')
+        timer.install()
+
     # This is needed for pyqtgraph to function smoothly:
     QtGui.QApplication.setGraphicsSystem("raster")
 
@@ -56,9 +66,13 @@ def run(debug):
     settings.sync()
     if debug:
         logging.basicConfig(level=logging.DEBUG)
+    elif profile_startup:
+        logging.basicConfig(level=logging.INFO)
     install_excepthook()
+    if timer is not None:
+        timer.mark('Create the QApplication')
 
-    runner = AppRunner(debug)
+    runner = AppRunner(debug, timer)
     QtCore.QTimer.singleShot(0, runner.run)
     app.exec_()
 
@@ -84,22 +98,41 @@ class AppRunner(QtCore.QObject):
     QObject to run application. This provides an event loop, so we can
     have a splash screen while importing, etc.'''
 
-    def __init__(self, debug):
+    def __init__(self, debug, timer=None):
         super(AppRunner, self).__init__()
+        self.timer = timer
 
         self.splash = QtGui.QSplashScreen(makeSplashLogo())
         self.splash.show()
         self.splash.raise_()
         self.splash.activateWindow()
+        self.mark('Show the splash screen')
+
+    def mark(self, stage):
+        if self.timer is not None:
+            self.timer.mark(stage)
 
     def run(self):
         from visfitter.main_window import MainWindow
+        self.mark('Import MainWindow')
         # Create main window
         self.w = MainWindow()
+        self.mark('Create MainWindow')
         self.splash.finish(self.w)
         self.w.show()
         self.w.raise_()
         self.w.activateWindow()
+        self.mark('Show MainWindow')
+        if self.timer is not None:
+            QtCore.QTimer.singleShot(0, self.reportStartup)
+
+    def reportStartup(self):
+        '''
+        Logs the startup times, once the main window has been drawn.
+        '''
+        self.timer.mark('Draw MainWindow')
+        self.timer.uninstall()
+        self.timer.report()
 
 if sys.platform != 'win32':
     from single_process import single_process
@@ -108,5 +141,8 @@ if sys.platform != 'win32':
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--debug', action='store_true')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='log the time taken by each stage of the '
+                        'startup and by the slowest imports')
     args = parser.parse_args()
-    run(args.debug)
+    run(args.debug, args.profile_startup)
@@ -20,6 +20,7 @@
 #############################################################################
 
 # std lib imports
+import functools
 import os.path
 import logging
 log = logging.getLogger(__name__)
@@ -27,9 +28,7 @@ log = logging.getLogger(__name__)
 # third party imports
 from PySide import QtGui, QtCore
 import numpy
-from scipy.optimize import minimize
 import pyqtgraph as pg
-from pyqtgraph.graphicsItems.PlotItem import PlotItem
 # Use black text on white background
 pg.setConfigOption('background', 'w')
 pg.setConfigOption('foreground', 'k')
@@ -38,8 +37,62 @@ pg.setConfigOptions(antialias=True)
 
 # local imports
 from .version import __version__
-from . import parser
-from . import linear_regression
+from .columns_dialog import ColumnsDialog
+from .estimators_dialog import EstimatorsDialog
+from . import fit_cache
+from . import fit_job
+from .lazy_import import LazyModule
+# These are imported when they are first used, to speed up the startup
+bootstrap = LazyModule('.bootstrap', __package__)
+comparison = LazyModule('.comparison', __package__)
+dataset_cache = LazyModule('.dataset_cache', __package__)
+diagnostics = LazyModule('.diagnostics', __package__)
+lod = LazyModule('.lod', __package__)
+parallel = LazyModule('.parallel', __package__)
+parser = LazyModule('.parser', __package__)
+spatial_index = LazyModule('.spatial_index', __package__)
+# The estimators' registry is imported when the Fit menu is first shown
+linear_regression = LazyModule('.linear_regression', __package__)
+multiple_regression = LazyModule('.multiple_regression', __package__)
+
+
+def formatSeconds(seconds):
+    '''
+    Returns a rough, readable duration, e.g. '3 minutes'.
+    '''
+    for unit, size in (('day', 86400), ('hour', 3600), ('minute', 60)):
+        if seconds >= size:
+            break
+    else:
+        unit, size = 'second', 1
+    count = int(round(seconds / size))
+    if unit == 'day' and count > 365:
+        return 'more than a year'
+    return '{} {}{}'.format(count, unit, '' if count == 1 else 's')
+
+
+class SelectionViewBox(pg.ViewBox):
+    '''
+    A ViewBox in which dragging with Shift held draws a selection rectangle,
+    rather than panning. When the drag ends, sigSelected is emitted with the
+    rectangle, in data coordinates, and whether Ctrl was held as well.
+    '''
+    sigSelected = QtCore.Signal(object, bool)
+
+    def mouseDragEvent(self, ev, axis=None):
+        if (axis is None and ev.button() == QtCore.Qt.LeftButton and
+                ev.modifiers() & QtCore.Qt.ShiftModifier):
+            ev.accept()
+            if ev.isFinish():
+                self.rbScaleBox.hide()
+                rect = QtCore.QRectF(self.mapToView(ev.buttonDownPos()),
+                                     self.mapToView(ev.pos())).normalized()
+                self.sigSelected.emit(rect, bool(ev.modifiers() &
+                                                 QtCore.Qt.ControlModifier))
+            else:
+                self.updateScaleBox(ev.buttonDownPos(), ev.pos())
+        else:
+            super(SelectionViewBox, self).mouseDragEvent(ev, axis)
 
 
 class MainWindow(QtGui.QMainWindow):
@@ -49,6 +102,79 @@ class MainWindow(QtGui.QMainWindow):
 
         # Initialize private variables
         self.plot = None
+        self.x = None
+        self.y = None
+        self.pyramid = None
+        self.scatter = None
+        self.excludedScatter = None
+        self.densityImage = None
+        self.filepath = None
+        self.lastFit = None
+        self.lastResult = None
+        # The diagnostics.Diagnostics of the last fit, when they are shown
+        self.lastDiagnostics = None
+        self.dataHash = None
+        # Incremented whenever a new data set is shown, so that fits of the
+        # previous one can be ignored. Rows appended in follow mode don't
+        # change it.
+        self.dataId = 0
+        # The plotted line of each fit, by name
+        self.lines = {}
+        # The keys of the estimators of the running or last comparison whose
+        # lines have been plotted
+        self.comparedKeys = set()
+        # The lower and upper curves and the fill of the bootstrap band
+        self.band = None
+        # For multiple regression: the other regressor columns and their
+        # medians, x and the other regressors as the columns of an (n, k)
+        # array (made when first needed), the weights (or None), and the
+        # hash of the regressors and y
+        self.otherRegressors = []
+        self.regressorMedians = None
+        self.regressors = None
+        self.weights = None
+        self.regressorHash = None
+        # The columns read from data files, their separator, the number of
+        # other regressors, and whether there is a weight column and it
+        # holds sigmas
+        self.fileColumns = None
+
+        # The points that are excluded from fits are False in the mask, which
+        # is None if there are none. They are selected with a
+        # spatial_index.StripIndex, which is built when first needed.
+        self.mask = None
+        self.spatialIndex = None
+
+        # In follow mode, a parser.TailReader of the file
+        self.follower = None
+        # The least squares statistics of the included points of the first
+        # accumulatorRows rows, if they are needed, which are kept up to date
+        # as points are excluded or included, and rows are appended
+        self.accumulator = None
+        self.accumulatorRows = 0
+
+        # Fit results are remembered across sessions
+        self.fitCache = fit_cache.FitCache(
+            cache_dir=fit_cache.getDefaultCacheDir())
+
+        # Views with more than this many points are drawn as a density
+        # image, and views with fewer are drawn with up to this many points
+        self.densityThreshold = 2 ** 17
+        self.maxPoints = 2 ** 14
+
+        # Fits that are estimated to take longer than this many seconds are
+        # run only after a warning, or with a faster fallback estimator
+        self.slowFitSeconds = 10.
+
+        # Fits run in a background thread
+        self.fitRunner = fit_job.FitRunner(self)
+        self.fitRunner.jobStarted.connect(self.fitStarted)
+        self.fitRunner.progressChanged.connect(self.fitProgress)
+        self.fitRunner.jobUpdated.connect(self.fitUpdated)
+        self.fitRunner.jobFinished.connect(self.fitFinished)
+        self.fitRunner.jobCancelled.connect(self.fitCancelled)
+        self.fitRunner.jobFailed.connect(self.fitFailed)
+        self.fitRunner.idle.connect(self.fitIdle)
 
         # Initialize QSettings object
         self.settings = QtCore.QSettings()
@@ -70,29 +196,122 @@ class MainWindow(QtGui.QMainWindow):
         self.openAction.setShortcut('Ctrl+O')
         self.openAction.triggered.connect(self.openFile)
 
+        self.columnsAction = QtGui.QAction('&Columns...', self)
+        self.columnsAction.setStatusTip('Choose the columns to read from '
+                                        'data files')
+        self.columnsAction.setToolTip('Choose the columns to read from '
+                                      'data files')
+        self.columnsAction.triggered.connect(self.setColumns)
+
+        self.followAction = QtGui.QAction('&Follow File', self)
+        self.followAction.setStatusTip('Read and fit the rows that are '
+                                       'appended to the file')
+        self.followAction.setToolTip('Read and fit the rows that are '
+                                     'appended to the file')
+        self.followAction.setCheckable(True)
+        self.followAction.triggered.connect(self.setFollowing)
+
+        self.followIntervalAction = QtGui.QAction('Follow &Interval...', self)
+        self.followIntervalAction.setStatusTip('Set the minimum time between '
+                                               'refreshes in follow mode')
+        self.followIntervalAction.setToolTip('Set the minimum time between '
+                                             'refreshes in follow mode')
+        self.followIntervalAction.triggered.connect(self.setFollowInterval)
+
         self.closeAction = QtGui.QAction('Close &Window', self)
         self.closeAction.setStatusTip('Close the Window')
         self.closeAction.setToolTip('Close the Window')
         self.closeAction.setShortcut('Ctrl+W')
         self.closeAction.triggered.connect(self.close)
 
-        self.fitLSAction = QtGui.QAction('Least Squares', self)
-        self.fitLSAction.setStatusTip('Fit using the least squares')
-        self.fitLSAction.setToolTip('Fit using the least squares')
-        self.fitLSAction.triggered.connect(self.plotLinearLeastSquares)
+        self.autoFallbackAction = QtGui.QAction(
+            'Use &Faster Estimators Automatically', self)
+        self.autoFallbackAction.setStatusTip('Fit large data sets with a '
+                                             'faster approximate estimator, '
+                                             'rather than asking first')
+        self.autoFallbackAction.setToolTip('Fit large data sets with a faster '
+                                           'approximate estimator, rather '
+                                           'than asking first')
+        self.autoFallbackAction.setCheckable(True)
+        self.autoFallbackAction.setChecked(
+            self.settings.value('autoFallback', 'false') == 'true')
+        self.autoFallbackAction.toggled.connect(self.setAutoFallback)
+
+        self.fitAllAction = QtGui.QAction('Fit &All...', self)
+        self.fitAllAction.setStatusTip('Fit with several estimators at '
+                                       'once, and compare them')
+        self.fitAllAction.setToolTip('Fit with several estimators at once, '
+                                     'and compare them')
+        self.fitAllAction.triggered.connect(self.fitAll)
 
-        self.fitLMSAction = QtGui.QAction('Least Median of Squares', self)
-        self.fitLMSAction.setStatusTip('Fit using the least median of squares')
-        self.fitLMSAction.setToolTip('Fit using the least median of squares')
-        self.fitLMSAction.triggered.connect(self.plotLinearLeastMedianOfSquares)
+        self.cancelFitAction = QtGui.QAction('&Cancel Fit', self)
+        self.cancelFitAction.setStatusTip('Cancel the running fit')
+        self.cancelFitAction.setToolTip('Cancel the running fit')
+        self.cancelFitAction.setShortcut('Esc')
+        self.cancelFitAction.setEnabled(False)
+        self.cancelFitAction.triggered.connect(self.fitRunner.cancel)
+
+        self.statsAction = QtGui.QAction('Fit &Statistics...', self)
+        self.statsAction.setStatusTip('Show the statistics of the last fit')
+        self.statsAction.setToolTip('Show the statistics of the last fit')
+        self.statsAction.setEnabled(False)
+        self.statsAction.triggered.connect(self.showFitStats)
+
+        self.bootstrapAction = QtGui.QAction('&Bootstrap Last Fit...', self)
+        self.bootstrapAction.setStatusTip('Draw a bootstrap confidence band '
+                                          'of the last fit')
+        self.bootstrapAction.setToolTip('Draw a bootstrap confidence band of '
+                                        'the last fit')
+        self.bootstrapAction.setEnabled(False)
+        self.bootstrapAction.triggered.connect(self.bootstrapLastFit)
+
+        self.processesAction = QtGui.QAction('Worker &Processes...', self)
+        self.processesAction.setStatusTip('Set the number of processes used '
+                                          'by parallel fits')
+        self.processesAction.setToolTip('Set the number of processes used '
+                                        'by parallel fits')
+        self.processesAction.triggered.connect(self.setProcesses)
+
+        self.diagnosticsAction = QtGui.QAction('Residual &Diagnostics', self)
+        self.diagnosticsAction.setStatusTip('Show the standardized residuals '
+                                            'of the last fit, and color its '
+                                            'outliers')
+        self.diagnosticsAction.setToolTip('Show the standardized residuals of '
+                                          'the last fit, and color its '
+                                          'outliers')
+        self.diagnosticsAction.setCheckable(True)
+        self.diagnosticsAction.triggered.connect(self.setDiagnosticsShown)
+
+        self.includeAllAction = QtGui.QAction('&Include All Points', self)
+        self.includeAllAction.setStatusTip('Include the points excluded with '
+                                           'Shift+drag in the fits')
+        self.includeAllAction.setToolTip('Include the points excluded with '
+                                         'Shift+drag in the fits')
+        self.includeAllAction.setEnabled(False)
+        self.includeAllAction.triggered.connect(self.includeAllPoints)
 
         menubar = self.menuBar()
         fileMenu = menubar.addMenu('&File')
         fileMenu.addAction(self.openAction)
+        fileMenu.addAction(self.columnsAction)
+        fileMenu.addAction(self.followAction)
+        fileMenu.addAction(self.followIntervalAction)
         fileMenu.addAction(self.closeAction)
         fitMenu = menubar.addMenu('Fi&t')
-        fitMenu.addAction(self.fitLSAction)
-        fitMenu.addAction(self.fitLMSAction)
+        # The estimators' actions are added when the menu is first shown
+        self.fitMenu = fitMenu
+        self.fitActions = {}
+        fitMenu.aboutToShow.connect(self.addEstimatorActions)
+        fitMenu.addAction(self.fitAllAction)
+        fitMenu.addAction(self.autoFallbackAction)
+        fitMenu.addSeparator()
+        fitMenu.addAction(self.includeAllAction)
+        fitMenu.addSeparator()
+        fitMenu.addAction(self.cancelFitAction)
+        fitMenu.addAction(self.statsAction)
+        fitMenu.addAction(self.diagnosticsAction)
+        fitMenu.addAction(self.bootstrapAction)
+        fitMenu.addAction(self.processesAction)
         aboutMenu = menubar.addMenu('&About')
         aboutMenu.addAction(self.aboutAction)
 
@@ -102,8 +321,63 @@ class MainWindow(QtGui.QMainWindow):
 
         self.view = pg.GraphicsLayoutWidget()
         self.setCentralWidget(self.view)
-        self.plot = self.view.addPlot()
+        # Shift+drag excludes the points in a rectangle from the fits, and
+        # Ctrl+Shift+drag includes them again
+        self.plot = self.view.addPlot(viewBox=SelectionViewBox())
         self.view.addItem(self.plot, 0, 0)
+        self.plot.getViewBox().sigSelected.connect(self.selectPoints)
+
+        # The residual plot is added below the data when diagnostics are
+        # shown, and pans and zooms in x with it. The points are colored by
+        # their outlier flags with an array of brushes, indexed by the flags.
+        self.pointBrush = pg.mkBrush(50, 50, 150)
+        self.outlierBrush = pg.mkBrush(220, 0, 0)
+        self.brushes = numpy.array([self.pointBrush, self.outlierBrush],
+                                   dtype=object)
+        self.residualPlot = pg.PlotItem()
+        self.residualPlot.setLabel('left', 'Standardized residual')
+        self.residualPlot.setXLink(self.plot)
+        self.residualScatter = self.residualPlot.plot([], [], pen=None,
+                                                      symbol='o',
+                                                      antialias=False)
+        pen = pg.mkPen('k', style=QtCore.Qt.DashLine)
+        self.cutoffLines = [pg.InfiniteLine(angle=0, pen=pen),
+                            pg.InfiniteLine(angle=0, pen=pen)]
+        for line in self.cutoffLines:
+            self.residualPlot.addItem(line)
+
+        # The results of Fit All, one row per estimator, in the order they
+        # finished
+        self.comparisonTable = QtGui.QTableWidget(0, 6)
+        self.comparisonTable.setHorizontalHeaderLabels(
+            ['Estimator', 'alpha', 'beta', 'd*', 'scale', 'Time (s)'])
+        self.comparisonTable.setEditTriggers(
+            QtGui.QAbstractItemView.NoEditTriggers)
+        self.comparisonTable.verticalHeader().hide()
+        self.comparisonDock = QtGui.QDockWidget('Comparison', self)
+        self.comparisonDock.setObjectName('comparisonDock')
+        self.comparisonDock.setWidget(self.comparisonTable)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea,
+                           self.comparisonDock)
+        self.comparisonDock.hide()
+
+        # Redraw the scatter plot for the new view range once panning or
+        # zooming pauses, rather than on every step
+        self.lodTimer = QtCore.QTimer(self)
+        self.lodTimer.setSingleShot(True)
+        self.lodTimer.setInterval(30)
+        self.lodTimer.timeout.connect(self.updateLOD)
+        self.plot.getViewBox().sigRangeChanged.connect(self.viewRangeChanged)
+
+        # In follow mode, changes to the file start a timer, and the file is
+        # read when it fires, so changes that come faster than the follow
+        # interval are coalesced into one refresh
+        self.followWatcher = QtCore.QFileSystemWatcher(self)
+        self.followWatcher.fileChanged.connect(self.fileChanged)
+        self.followTimer = QtCore.QTimer(self)
+        self.followTimer.setSingleShot(True)
+        self.followTimer.setInterval(self.getFollowInterval())
+        self.followTimer.timeout.connect(self.followRefresh)
 
         self.setWindowTitle('VisFitter')
         from .resources.icons import logoIcon
@@ -124,28 +398,903 @@ class MainWindow(QtGui.QMainWindow):
         self.settings.setValue('lastOpened', filepath)
 
         # Read in the data, and plot it
-        self.x, self.y = parser.getXY(filepath)
-        self.plot.clearPlots()
-        self.plotXY()
+        self.setFollowing(False)
+        self.fitRunner.cancel()
+        xcol, ycol, sep = self.getColumns()
+        regressors, wcol, sigma = self.getRegressors()
+        cols = [xcol, ycol] + regressors
+        if wcol is not None:
+            cols.append(wcol)
+        columns, info = dataset_cache.getColumns(filepath, cols, sep,
+                                                 full_output=True)
+        self.filepath = filepath
+        self.fileColumns = (cols, sep, len(regressors), wcol is not None,
+                            sigma)
+        self.loadColumns(columns)
+        if info['cached']:
+            self.setStatusText('Loaded {} points from the cached copy of {} '
+                               'in {:.3f} s'.format(info['rows'],
+                                    os.path.basename(filepath),
+                                    info['seconds']))
+        else:
+            self.setStatusText('Loaded {} points from {} ({}, {} rows '
+                               'rejected, {:.1f} MB/s)'.format(info['rows'],
+                                    os.path.basename(filepath),
+                                    info['format'],
+                                    info['rejected'],
+                                    info['bytes'] / 1e6 /
+                                    max(info['seconds'], 1e-9)))
 #         self.plotLinearLeastSumOfSquares()
 #         self.plotLinearLeastMedianOfSquares()
 
+    def loadColumns(self, columns):
+        '''
+        Shows a new data set, from the columns of self.fileColumns.
+        '''
+        self.setDataColumns(columns)
+        self.dataId += 1
+        self.mask = None
+        self.spatialIndex = None
+        self.accumulator = None
+        self.lastDiagnostics = None
+        self.includeAllAction.setEnabled(False)
+        self.plot.clearPlots()
+        self.lines = {}
+        self.comparedKeys = set()
+        self.comparisonTable.setRowCount(0)
+        self.removeBand()
+        if self.densityImage is not None:
+            self.plot.removeItem(self.densityImage)
+        self.plotXY()
+
+    def setDataColumns(self, columns):
+        _cols, _sep, nregressors, weighted, sigma = self.fileColumns
+        self.x, self.y = columns[:2]
+        self.otherRegressors = columns[2:2 + nregressors]
+        self.regressorMedians = numpy.array([numpy.median(c) for c in
+                                             self.otherRegressors])
+        self.regressors = None
+        self.weights = None
+        if weighted:
+            self.weights = numpy.array(columns[-1])
+            if sigma:
+                self.weights = 1 / self.weights ** 2
+        self.dataHash = None
+        self.regressorHash = None
+
+    def appendColumns(self, columns, new):
+        '''
+        Shows the rows, new, that were appended to the data set, given the
+        columns of the whole data set. If the whole data set was in view, the
+        view is extended to the new rows.
+        '''
+        self.setDataColumns(columns)
+        self.spatialIndex = None
+        if self.mask is not None:
+            self.mask = numpy.concatenate((self.mask, numpy.ones(new[0].size,
+                                                                 dtype=bool)))
+        xmin, xmax, ymin, ymax = self.pyramid.bounds
+        (vxmin, vxmax), (vymin, vymax) = self.plot.getViewBox().viewRange()
+        inView = (vxmin <= xmin and vxmax >= xmax and vymin <= ymin and
+                  vymax >= ymax)
+        self.pyramid.extend(new[0], new[1])
+        if inView:
+            xmin, xmax, ymin, ymax = self.pyramid.bounds
+            self.plot.setRange(xRange=(xmin, xmax), yRange=(ymin, ymax))
+        self.updateLOD()
+
+    def setFollowing(self, following):
+        '''
+        Starts or stops following the open file. In follow mode, the rows
+        appended to the file are read as they are written (see
+        parser.TailReader), added to the plot, and the last fit is redone.
+        '''
+        if following and self.follower is None and self.filepath is not None:
+            cols, sep = self.fileColumns[:2]
+            try:
+                follower = parser.TailReader(self.filepath, cols, sep)
+                follower.read()
+            except (IOError, ValueError) as e:
+                self.setStatusText('Could not follow {}: {}'.format(
+                    os.path.basename(self.filepath), e))
+            else:
+                self.follower = follower
+                rows = self.x.size
+                if follower.rows >= rows:
+                    self.appendColumns(follower.columns,
+                                       [c[rows:] for c in follower.columns])
+                else:
+                    self.loadColumns(follower.columns)
+                self.followWatcher.addPath(self.filepath)
+                self.setStatusText('Following {} ({} points)'.format(
+                    os.path.basename(self.filepath), follower.rows))
+        elif not following and self.follower is not None:
+            self.follower = None
+            self.followTimer.stop()
+            files = self.followWatcher.files()
+            if files:
+                self.followWatcher.removePaths(files)
+        self.followAction.setChecked(self.follower is not None)
+
+    @QtCore.Slot(str)
+    def fileChanged(self, path):
+        if not self.followTimer.isActive():
+            self.followTimer.start()
+
+    @QtCore.Slot()
+    def followRefresh(self):
+        follower = self.follower
+        if follower is None:
+            return
+        # Some programs replace the file rather than appending to it, which
+        # drops it from the watcher
+        if (self.filepath not in self.followWatcher.files() and
+                os.path.exists(self.filepath)):
+            self.followWatcher.addPath(self.filepath)
+        generation = follower.generation
+        new = follower.read()
+        name = os.path.basename(self.filepath)
+        if follower.generation != generation:
+            self.loadColumns(follower.columns)
+            self.setStatusText('Following {}: reloaded ({} points)'.format(
+                name, follower.rows))
+            return
+        if new[0].size == 0:
+            return
+        self.appendColumns(follower.columns, new)
+        self.setStatusText('Following {}: {} points (+{})'.format(
+            name, follower.rows, new[0].size))
+        self.refitLastFit()
+
+    def refitLastFit(self):
+        '''
+        Redoes the last fit of the data set after rows were appended, or
+        points were excluded or included. Least squares is updated from its
+        sufficient statistics in O(changed points), and the estimators that
+        can be warm-started start from the last fit.
+        '''
+        job = self.lastFit
+        if job is None or job.data_id != self.dataId:
+            return
+        if job.func is linear_regression.leastSquares:
+            try:
+                self.lastResult = self.getAccumulator().fit()
+            except ValueError:
+                return
+            self.showFit(job.name, self.lastResult, job.color)
+            self.diagnosticsChanged()
+            return
+        kwargs = dict((k, v) for k, v in job.kwargs.iteritems()
+                      if k not in ('stats', 'weights', 'mask'))
+        if (job.func in (linear_regression.leastMedianOfSquaresRandom,
+                         linear_regression.leastTrimmedSquares) and
+                self.lastResult is not None):
+            kwargs['initial'] = tuple(self.lastResult[:2])
+        if job.x.ndim == 1:
+            self.startFit(job.name, job.func, job.color,
+                          cancellable=job.cancellable, **kwargs)
+        else:
+            self.startMultipleFit(job.name, job.func, job.color,
+                                  cancellable=job.cancellable, **kwargs)
+
+    def getAccumulator(self):
+        '''
+        Returns the LeastSquaresAccumulator of the included points, which is
+        made when first needed, and updated with any rows appended since.
+        '''
+        if self.accumulator is None:
+            x, y = linear_regression.applyMask(self.x, self.y, self.mask)
+            self.accumulator = (
+                linear_regression.LeastSquaresAccumulator.fromPoints(x, y))
+            self.accumulatorRows = self.x.size
+        elif self.accumulatorRows < self.x.size:
+            start = self.accumulatorRows
+            mask = None if self.mask is None else self.mask[start:]
+            x, y = linear_regression.applyMask(self.x[start:], self.y[start:],
+                                               mask)
+            self.accumulator.update(x, y)
+            self.accumulatorRows = self.x.size
+        return self.accumulator
+
+    def getFollowInterval(self):
+        return int(self.settings.value('followInterval', 250))
+
+    def setFollowInterval(self):
+        interval, ok = QtGui.QInputDialog.getInt(self, 'Follow Interval',
+                'Minimum time between refreshes in follow mode (ms):',
+                value=self.getFollowInterval(), minValue=10, maxValue=60000)
+        if ok:
+            self.settings.setValue('followInterval', interval)
+            self.followTimer.setInterval(interval)
+
     def plotXY(self):
-        self.scatter = self.plot.plot(self.x, self.y,
-                                      pen=None, symbol='o')
+        '''
+        Plots the points that are visible at the current zoom, using a
+        DecimationPyramid of the data set, which is built once here.
+        '''
+        self.pyramid = lod.DecimationPyramid(self.x, self.y)
+        self.scatter = self.plot.plot([], [], pen=None, symbol='o',
+                                      antialias=False)
+        self.excludedScatter = self.plot.plot([], [], pen=None, symbol='x',
+                                              symbolPen=None,
+                                              symbolBrush=(128, 128, 128),
+                                              antialias=False)
+        self.densityImage = pg.ImageItem()
+        self.densityImage.setLookupTable(self.getDensityLookupTable())
+        self.densityImage.hide()
+        self.plot.addItem(self.densityImage)
+        # Auto ranging would follow the decimated points, so set the range
+        # to the whole data set instead
+        xmin, xmax, ymin, ymax = self.pyramid.bounds
+        self.plot.disableAutoRange()
+        self.plot.setRange(xRange=(xmin, xmax), yRange=(ymin, ymax))
+        self.updateLOD()
 
-    def plotLinearLeastSquares(self):
-        alpha, beta = linear_regression.leastSquares(self.x, self.y)
-        x = numpy.array([self.x.min(), self.x.max()])
-        y = alpha + beta * x
-        self.scatter = self.plot.plot(x, y, pen=pg.mkPen('r'))
+    @staticmethod
+    def getDensityLookupTable():
+        # white to dark blue, to match the white background
+        t = numpy.linspace(0, 1, 256)[:, numpy.newaxis]
+        white = numpy.array([255, 255, 255])
+        blue = numpy.array([0, 0, 139])
+        return (white + t * (blue - white)).astype(numpy.ubyte)
+
+    def viewRangeChanged(self, *args):
+        self.lodTimer.start()
+
+    @QtCore.Slot()
+    def updateLOD(self):
+        if self.pyramid is None:
+            return
+        (xmin, xmax), (ymin, ymax) = self.plot.getViewBox().viewRange()
+        count = self.pyramid.estimateCount(xmin, xmax, ymin, ymax)
+        if count > self.densityThreshold:
+            # one bin per two pixels
+            rect = self.plot.getViewBox().boundingRect()
+            bins = (max(int(rect.width()) // 2, 1),
+                    max(int(rect.height()) // 2, 1))
+            counts = self.pyramid.density(xmin, xmax, ymin, ymax, bins)
+            self.scatter.setData([], [])
+            self.densityImage.setImage(numpy.log1p(counts))
+            self.densityImage.setRect(QtCore.QRectF(xmin, ymin, xmax - xmin,
+                                                    ymax - ymin))
+            self.densityImage.show()
+        else:
+            x, y, _fraction, index = self.pyramid.points(xmin, xmax, ymin,
+                                                         ymax, self.maxPoints,
+                                                         full_output=True)
+            self.densityImage.hide()
+            self.scatter.setData(x, y, symbolBrush=self.getBrushes(index))
+        self.updateResidualPlot(xmin, xmax)
+
+    def setDiagnosticsShown(self, shown):
+        if shown:
+            self.view.addItem(self.residualPlot, 1, 0)
+            self.view.ci.layout.setRowStretchFactor(0, 3)
+            self.view.ci.layout.setRowStretchFactor(1, 1)
+        else:
+            self.view.removeItem(self.residualPlot)
+            self.lastDiagnostics = None
+        self.updateLOD()
 
-    def plotLinearLeastMedianOfSquares(self):
-        alpha, beta = linear_regression.leastMedianOfSquaresCrude(self.x,
-                                                                  self.y)
-        x = numpy.array([self.x.min(), self.x.max()])
+    def diagnosticsChanged(self):
+        '''
+        Redraws the diagnostics, if they are shown, after the last fit or
+        the mask changed.
+        '''
+        if self.diagnosticsAction.isChecked():
+            self.updateLOD()
+
+    def getDiagnostics(self):
+        '''
+        Returns the diagnostics.Diagnostics of the last fit of the data set,
+        or None if there isn't one. They are computed when first needed, and
+        kept until the fit, the mask or the data change, so that panning and
+        zooming only look up the flags of the points that are drawn.
+        '''
+        job = self.lastFit
+        result = self.lastResult
+        if job is None or result is None or job.data_id != self.dataId:
+            return None
+        cached = self.lastDiagnostics
+        if (cached is not None and cached.result is result and
+                cached.mask is self.mask and
+                cached.residuals.size == self.x.size):
+            return cached
+        regressors = None
+        if job.x.ndim != 1:
+            regressors = self.getRegressorArray()
+        weights = self.weights if 'weights' in job.kwargs else None
+        try:
+            self.lastDiagnostics = diagnostics.getDiagnostics(
+                result, self.x, self.y, regressors, weights, self.mask)
+        except ValueError:
+            log.debug('No diagnostics for %s', job.name, exc_info=True)
+            self.lastDiagnostics = None
+        return self.lastDiagnostics
+
+    def getBrushes(self, index):
+        '''
+        Returns the brushes of the scatter points with the given indices,
+        which are colored by their outlier flags if diagnostics are shown.
+        '''
+        if not self.diagnosticsAction.isChecked():
+            return self.pointBrush
+        diagnostics = self.getDiagnostics()
+        if diagnostics is None:
+            return self.pointBrush
+        return self.brushes[diagnostics.outliers[index].astype(numpy.intp)]
+
+    def updateResidualPlot(self, xmin, xmax):
+        '''
+        Plots the standardized residuals of up to maxPoints of the points in
+        the x range.
+        '''
+        if not self.diagnosticsAction.isChecked():
+            return
+        diagnostics = self.getDiagnostics()
+        if diagnostics is None:
+            self.residualScatter.setData([], [])
+            self.residualPlot.setTitle(None)
+            return
+        x, _y, _fraction, index = self.pyramid.points(xmin, xmax, -numpy.inf,
+                                                      numpy.inf,
+                                                      self.maxPoints,
+                                                      full_output=True)
+        # Gross outliers are drawn at the edge, so they don't squash the
+        # rest of the points
+        limit = 4 * diagnostics.cutoff
+        r = numpy.clip(diagnostics.standardized[index], -limit, limit)
+        self.residualScatter.setData(x, r, symbolBrush=self.brushes[
+            diagnostics.outliers[index].astype(numpy.intp)])
+        self.residualPlot.setTitle(str(diagnostics))
+        self.cutoffLines[0].setValue(-diagnostics.cutoff)
+        self.cutoffLines[1].setValue(diagnostics.cutoff)
+
+    @QtCore.Slot(object, bool)
+    def selectPoints(self, rect, include):
+        '''
+        Excludes the points in rect from the fits, or includes them again if
+        include is True, and redoes the last fit. The points are found with
+        a spatial index, and only the k points that change are touched, so a
+        least squares fit is updated in O(k).
+        '''
+        if self.x is None:
+            return
+        if self.spatialIndex is None:
+            self.spatialIndex = spatial_index.StripIndex(self.x, self.y)
+        found = self.spatialIndex.query(rect.left(), rect.right(),
+                                        rect.top(), rect.bottom())
+        # The mask is replaced rather than changed in place, since a fit of
+        # the old one may be running
+        if self.mask is None:
+            mask = numpy.ones(self.x.size, dtype=bool)
+        else:
+            mask = self.mask.copy()
+        changed = found[mask[found] != include]
+        mask[changed] = include
+        self.setMask(mask, changed, include)
+
+    def includeAllPoints(self):
+        if self.mask is not None:
+            self.setMask(None, numpy.flatnonzero(~self.mask), True)
+
+    def setMask(self, mask, changed, include):
+        '''
+        Sets the mask of the included points, after the points changed were
+        included (or excluded), and redoes the last fit.
+        '''
+        if changed.size == 0:
+            return
+        excluded = 0 if mask is None else mask.size - numpy.count_nonzero(mask)
+        self.mask = mask if excluded else None
+        if self.accumulator is not None:
+            changed = changed[changed < self.accumulatorRows]
+            if include:
+                self.accumulator.update(self.x[changed], self.y[changed])
+            elif self.accumulator.n > 2 * changed.size:
+                self.accumulator.remove(self.x[changed], self.y[changed])
+            else:
+                # Downdating most of the points would lose precision
+                self.accumulator = None
+        self.includeAllAction.setEnabled(self.mask is not None)
+        self.updateExcluded()
+        self.setStatusText('{} of {} points excluded'.format(excluded,
+                                                              self.x.size))
+        self.refitLastFit()
+        self.diagnosticsChanged()
+
+    def updateExcluded(self):
+        '''
+        Marks the excluded points, or an even sample of up to maxPoints of
+        them.
+        '''
+        if self.mask is None:
+            self.excludedScatter.setData([], [])
+            return
+        excluded = numpy.flatnonzero(~self.mask)
+        if excluded.size > self.maxPoints:
+            excluded = excluded[numpy.linspace(0, excluded.size - 1,
+                                               self.maxPoints).astype(int)]
+        self.excludedScatter.setData(self.x[excluded], self.y[excluded])
+
+    def getEstimators(self):
+        '''
+        Returns the registry of estimators, importing them when first
+        called.
+        '''
+        multiple_regression.load()  # registers its estimators
+        return linear_regression.ESTIMATORS
+
+    def addEstimatorActions(self):
+        '''
+        Adds one action per estimator of the registry to the Fit menu when
+        it is first shown, so that the estimators aren't imported at
+        startup.
+        '''
+        if self.fitActions:
+            return
+        multipleMenu = QtGui.QMenu('&Multiple Regression', self)
+        for key, estimator in self.getEstimators().iteritems():
+            action = QtGui.QAction(estimator.name, self)
+            tip = '{} ({})'.format(estimator.description,
+                                   estimator.complexity)
+            action.setStatusTip(tip)
+            action.setToolTip(tip)
+            action.triggered.connect(functools.partial(self.fitEstimator,
+                                                       key))
+            self.fitActions[key] = action
+            if estimator.multiple:
+                multipleMenu.addAction(action)
+            else:
+                self.fitMenu.insertAction(self.fitAllAction, action)
+        self.fitMenu.insertMenu(self.fitAllAction, multipleMenu)
+
+    def fitEstimator(self, key, checked=False):
+        '''
+        Fits the current data with the estimator registered as key. If the
+        fit is estimated to take longer than slowFitSeconds, a faster
+        fallback estimator is used instead if Use Faster Estimators
+        Automatically is checked, and otherwise the user is asked.
+        '''
+        if self.x is None:
+            return
+        estimator = self.getEstimators()[key]
+        n = self.x.size if self.mask is None else numpy.count_nonzero(
+            self.mask)
+        processes = self.getProcesses() if estimator.parallel else 1
+        seconds = estimator.estimateSeconds(n, processes)
+        if seconds > self.slowFitSeconds:
+            fallback = linear_regression.getFallback(
+                estimator, n, self.slowFitSeconds, processes)
+            if (fallback is not estimator and
+                    self.autoFallbackAction.isChecked()):
+                log.info('Fitting %d points with %s instead of %s', n,
+                         fallback.key, estimator.key)
+                estimator = fallback
+            else:
+                estimator = self.askSlowFit(estimator, fallback, n, seconds,
+                                            processes)
+                if estimator is None:
+                    return
+        self.startEstimator(estimator, processes)
+
+    def askSlowFit(self, estimator, fallback, n, seconds, processes):
+        '''
+        Warns that a fit is estimated to be slow, and returns the estimator
+        the user chooses to run: estimator, fallback, or None to cancel.
+        '''
+        text = ('{} is estimated to take about {} to fit {} points ({}).'
+                ''.format(estimator.name, formatSeconds(seconds), n,
+                          estimator.complexity))
+        box = QtGui.QMessageBox(QtGui.QMessageBox.Warning, 'Slow Fit', text,
+                                parent=self)
+        fallbackButton = None
+        if fallback is not estimator:
+            box.setInformativeText('{} is estimated to take about {}.'.format(
+                fallback.name,
+                formatSeconds(fallback.estimateSeconds(n, processes))))
+            fallbackButton = box.addButton('Use ' + fallback.name,
+                                           QtGui.QMessageBox.AcceptRole)
+        runButton = box.addButton('Fit Anyway',
+                                  QtGui.QMessageBox.DestructiveRole)
+        box.addButton(QtGui.QMessageBox.Cancel)
+        box.exec_()
+        clicked = box.clickedButton()
+        if clicked is runButton:
+            return estimator
+        if fallbackButton is not None and clicked is fallbackButton:
+            return fallback
+        return None
+
+    def startEstimator(self, estimator, processes=1):
+        kwargs = dict(estimator.kwargs)
+        if estimator.parallel:
+            kwargs['processes'] = processes
+        start = self.startMultipleFit if estimator.multiple else self.startFit
+        start(estimator.name, estimator.func, estimator.color,
+              cancellable=estimator.cancellable, **kwargs)
+
+    def setAutoFallback(self, checked):
+        self.settings.setValue('autoFallback', 'true' if checked else 'false')
+
+    def fitAll(self):
+        '''
+        Asks which line estimators to compare, and fits the current data
+        with all of them at once in the background, on the number of worker
+        processes that was set, or if none has been, on one per estimator,
+        up to one per core (see comparison.compareEstimators). Each line is
+        plotted as soon as its fit finishes, and the Comparison table lists
+        the fits. The estimators that are estimated to take longer than
+        slowFitSeconds are unchecked at first, unless they were chosen last
+        time.
+        '''
+        if self.x is None:
+            return
+        n = self.x.size if self.mask is None else numpy.count_nonzero(
+            self.mask)
+        saved = self.settings.value('compareEstimators', '').split()
+        items = []
+        for key, estimator in self.getEstimators().iteritems():
+            if estimator.multiple:
+                continue
+            seconds = estimator.estimateSeconds(n)
+            text = '{} (about {})'.format(estimator.name,
+                                          formatSeconds(seconds))
+            checked = (key in saved if saved else
+                       seconds <= self.slowFitSeconds)
+            items.append((key, text, checked))
+        dialog = EstimatorsDialog(items, parent=self)
+        if dialog.exec_() != QtGui.QDialog.Accepted:
+            return
+        keys = dialog.getKeys()
+        if not keys:
+            return
+        self.settings.setValue('compareEstimators', ' '.join(keys))
+        if self.dataHash is None:
+            self.dataHash = fit_cache.hashData(self.x, self.y)
+        for key in self.comparedKeys:
+            line = self.lines.pop(self.getEstimators()[key].name,
+                                  None)
+            if line is not None:
+                self.plot.removeItem(line)
+        self.comparedKeys = set()
+        self.comparisonTable.setRowCount(0)
+        self.comparisonDock.show()
+        self.fitRunner.submit(fit_job.FitJob(
+            'Fit All', comparison.compareEstimators, self.x, self.y,
+            updates=True, data_id=self.dataId, keys=keys, mask=self.mask,
+            processes=self.getProcesses(min(parallel.cpuCount(),
+                                            len(keys)))))
+
+    def showComparison(self, job, rows):
+        '''
+        Plots the lines of the fits of a comparison that haven't been
+        plotted yet, caches their results as if they had been fit one at a
+        time, and lists all of the rows in the Comparison table.
+        '''
+        for row in rows:
+            if row.key in self.comparedKeys or row.error is not None:
+                continue
+            self.comparedKeys.add(row.key)
+            estimator = self.getEstimators()[row.key]
+            self.showFit(estimator.name, row.result, estimator.color)
+            kwargs = dict(estimator.kwargs)
+            if job.kwargs['mask'] is not None:
+                kwargs['mask'] = job.kwargs['mask']
+            self.fitCache.put(fit_cache.getKey(estimator.func, self.dataHash,
+                                               kwargs), row.result)
+
+        table = self.comparisonTable
+        table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            if row.error is None:
+                cells = [row.name] + ['{:g}'.format(value) for value in
+                                      (row.alpha, row.beta, row.d_star,
+                                       row.scale)]
+            else:
+                cells = [row.name, 'failed', '', '', '']
+            cells.append('{:.3f}'.format(row.seconds))
+            for j, text in enumerate(cells):
+                item = QtGui.QTableWidgetItem(text)
+                if row.error is not None:
+                    item.setToolTip(row.error)
+                table.setItem(i, j, item)
+        table.resizeColumnsToContents()
+
+    def comparisonFinished(self, job, rows):
+        self.showComparison(job, rows)
+        failed = sum(1 for row in rows if row.error is not None)
+        text = '{}: {} estimators'.format(job.name, len(rows))
+        if failed:
+            text += ' ({} failed)'.format(failed)
+        self.setStatusText(text)
+
+    def startFit(self, name, func, color, **kwargs):
+        '''
+        Fits the current data with func in the background, and plots the
+        fitted line when it finishes. The estimator fills in a FitStats,
+        which can be shown afterwards. If the same fit of the same data has
+        been done before, the cached result is plotted right away instead.
+        '''
+        if self.x is None:
+            return
+        if self.dataHash is None:
+            self.dataHash = fit_cache.hashData(self.x, self.y)
+        if self.mask is not None:
+            kwargs['mask'] = self.mask
+        self.submitFit(name, func, self.x, self.dataHash, color, **kwargs)
+
+    def startMultipleFit(self, name, func, color, **kwargs):
+        '''
+        Fits y to x and the other regressor columns with a
+        multiple_regression estimator, like startFit, weighting the points
+        if a weight column was chosen.
+        '''
+        if self.x is None:
+            return
+        regressors = self.getRegressorArray()
+        if self.regressorHash is None:
+            self.regressorHash = fit_cache.hashData(regressors, self.y)
+        if self.weights is not None:
+            kwargs['weights'] = self.weights
+        if self.mask is not None:
+            kwargs['mask'] = self.mask
+        self.submitFit(name, func, regressors, self.regressorHash, color,
+                       **kwargs)
+
+    def getRegressorArray(self):
+        '''
+        Returns x and the other regressors as the columns of an (n, k) array.
+        '''
+        if self.regressors is None:
+            self.regressors = numpy.column_stack([self.x] +
+                                                 self.otherRegressors)
+        return self.regressors
+
+    def submitFit(self, name, func, x, data_hash, color, **kwargs):
+        key = fit_cache.getKey(func, data_hash, kwargs)
+        stats = linear_regression.FitStats()
+        job = fit_job.FitJob(name, func, x, self.y, color, cache_key=key,
+                             data_id=self.dataId, stats=stats, **kwargs)
+        result = self.fitCache.get(key)
+        if result is not None:
+            self.fitDone(job, result, cached=True)
+            return
+        self.fitRunner.submit(job)
+
+    def showFit(self, name, result, color):
+        '''
+        Plots the line of a fit, replacing the line of any earlier fit with
+        the same name.
+        '''
+        line = self.lines.pop(name, None)
+        if line is not None:
+            self.plot.removeItem(line)
+        self.lines[name] = self.plotFit(result, color)
+
+    def plotFit(self, result, color):
+        '''
+        Plots the line of a fit. The estimators of linear_regression return
+        alpha, beta, ..., and those of multiple_regression return an array
+        of coefficients, the intercept, x's, and the other regressors'. The
+        line of a multiple regression is drawn with the other regressors
+        held at their medians.
+        '''
+        if isinstance(result, numpy.ndarray):
+            alpha = result[0] + numpy.dot(result[2:], self.regressorMedians)
+            beta = result[1]
+        else:
+            alpha, beta = result[:2]
+        return self.plotLine(alpha, beta, color)
+
+    @staticmethod
+    def describeFit(result):
+        if isinstance(result, numpy.ndarray):
+            return 'coefficients = {}'.format(', '.join('{:g}'.format(c)
+                                                        for c in result))
+        alpha, beta = result[:2]
+        text = 'alpha = {:g}, beta = {:g}'.format(alpha, beta)
+        if len(result) > 2 and isinstance(result[2], tuple):
+            text += ' (beta in [{:g}, {:g}])'.format(*result[2])
+        return text
+
+    def plotLine(self, alpha, beta, color):
+        xmin, xmax = self.pyramid.bounds[:2]
+        x = numpy.array([xmin, xmax])
         y = alpha + beta * x
-        self.scatter = self.plot.plot(x, y, pen=pg.mkPen('b'))
+        return self.plot.plot(x, y, pen=pg.mkPen(color))
+
+    @QtCore.Slot(object)
+    def fitStarted(self, job):
+        self.cancelFitAction.setEnabled(True)
+        self.setStatusText('{}...'.format(job.name))
+
+    @QtCore.Slot(object, float)
+    def fitProgress(self, job, fraction):
+        self.setStatusText('{}: {:.0%}'.format(job.name, fraction))
+
+    @QtCore.Slot(object, object)
+    def fitUpdated(self, job, result):
+        if job.data_id != self.dataId:
+            return
+        if job.func is comparison.compareEstimators:
+            self.showComparison(job, result)
+            self.setStatusText('{}: {} of {} estimators'.format(
+                job.name, len(result), len(job.kwargs['keys'])))
+            return
+        self.plotBand(result, job.color)
+        self.setStatusText('{}: {} of {} resamples'.format(
+            job.name, result.done, result.resamples))
+
+    @QtCore.Slot(object, object)
+    def fitFinished(self, job, result):
+        if job.data_id != self.dataId:
+            return  # another data set has been opened since the fit started
+        if job.updates:
+            if job.func is comparison.compareEstimators:
+                self.comparisonFinished(job, result)
+            else:
+                self.bootstrapFinished(job, result)
+            return
+        self.fitCache.put(job.cache_key, result)
+        self.fitDone(job, result)
+
+    def fitDone(self, job, result, cached=False):
+        '''
+        Plots the result of a fit that finished, or was found in the cache,
+        and makes it the last fit, which the diagnostics, bootstrap, stats
+        and refits act on.
+        '''
+        self.showFit(job.name, result, job.color)
+        self.lastFit = job
+        self.lastResult = result
+        self.diagnosticsChanged()
+        self.statsAction.setEnabled(True)
+        self.bootstrapAction.setEnabled(True)
+        if cached:
+            self.setStatusText('{}: {} (cached)'.format(
+                job.name, self.describeFit(result)))
+        else:
+            self.setStatusText('{}: {} ({:.3f} s)'.format(
+                job.name, self.describeFit(result),
+                job.kwargs['stats'].seconds))
+
+    @QtCore.Slot(object)
+    def fitCancelled(self, job):
+        self.setStatusText('{}: cancelled'.format(job.name))
+
+    @QtCore.Slot(object, str)
+    def fitFailed(self, job, message):
+        self.setStatusText('{}: failed'.format(job.name))
+        QtGui.QMessageBox.warning(self, 'Fit Failed', message)
+
+    @QtCore.Slot()
+    def fitIdle(self):
+        self.cancelFitAction.setEnabled(False)
+
+    def bootstrapLastFit(self):
+        '''
+        Refits the last line fit to resamples of the data in the background,
+        and draws the 95% pointwise confidence band of the line as the
+        resamples are done.
+        '''
+        job = self.lastFit
+        if job is None or self.x is None:
+            return
+        if job.x.ndim != 1:
+            self.setStatusText('Only line fits can be bootstrapped')
+            return
+        resamples, ok = QtGui.QInputDialog.getInt(self, 'Bootstrap',
+                'Number of resamples:',
+                value=int(self.settings.value('resamples', 200)),
+                minValue=10, maxValue=100000)
+        if not ok:
+            return
+        self.settings.setValue('resamples', resamples)
+        kwargs = dict((k, v) for k, v in job.kwargs.iteritems()
+                      if k not in ('stats', 'full_output', 'processes',
+                                   'mask'))
+        if self.mask is not None:
+            kwargs['mask'] = self.mask
+        self.removeBand()
+        self.fitRunner.submit(fit_job.FitJob(
+            'Bootstrap ' + job.name,
+            functools.partial(bootstrap.bootstrap, job.func), self.x, self.y,
+            job.color, updates=True, data_id=self.dataId, resamples=resamples,
+            processes=self.getProcesses(), **kwargs))
+
+    def bootstrapFinished(self, job, result):
+        self.plotBand(result, job.color)
+        (alpha_low, alpha_high), (beta_low, beta_high) = result.intervals()
+        self.setStatusText('{}: alpha in [{:g}, {:g}], beta in [{:g}, {:g}] '
+                           '(95%, {} resamples, {} failed)'.format(
+                               job.name, alpha_low, alpha_high, beta_low,
+                               beta_high, result.resamples, result.failures))
+
+    def plotBand(self, result, color):
+        '''
+        Draws the confidence band of a bootstrap.BootstrapResult as a filled
+        region, or updates the one that is drawn.
+        '''
+        xmin, xmax = self.pyramid.bounds[:2]
+        x = numpy.linspace(xmin, xmax, 100)
+        lower, upper = result.band(x)
+        if self.band is None:
+            pen = pg.mkPen(color)
+            brush = pg.mkColor(color)
+            brush.setAlpha(48)
+            lowerCurve = pg.PlotCurveItem(x, lower, pen=pen)
+            upperCurve = pg.PlotCurveItem(x, upper, pen=pen)
+            fill = pg.FillBetweenItem(lowerCurve, upperCurve,
+                                      brush=pg.mkBrush(brush))
+            self.band = (lowerCurve, upperCurve, fill)
+            for item in self.band:
+                self.plot.addItem(item)
+        else:
+            self.band[0].setData(x, lower)
+            self.band[1].setData(x, upper)
+
+    def removeBand(self):
+        if self.band is not None:
+            for item in self.band:
+                self.plot.removeItem(item)
+            self.band = None
+
+    def showFitStats(self):
+        if self.lastFit is None:
+            return
+        stats = self.lastFit.kwargs['stats']
+        text = '\n'.join('{}: {}'.format(name, value) for name, value in
+                         sorted(stats.asDict().items()))
+        QtGui.QMessageBox.information(self, '{} Statistics'
+                                      ''.format(self.lastFit.name), text)
+
+    def getProcesses(self, default=1):
+        '''
+        Returns the number of worker processes that was set, or default if
+        none has been.
+        '''
+        processes = self.settings.value('processes')
+        if processes is None:
+            return default
+        return int(processes)
+
+    def setProcesses(self):
+        processes, ok = QtGui.QInputDialog.getInt(self, 'Worker Processes',
+                'Number of processes for parallel fits:',
+                value=self.getProcesses(), minValue=1,
+                maxValue=parallel.cpuCount())
+        if ok:
+            self.settings.setValue('processes', processes)
+
+    def getColumns(self):
+        sep = self.settings.value('sep', '')
+        return (int(self.settings.value('xcol', 0)),
+                int(self.settings.value('ycol', 1)),
+                sep or None)
+
+    def getRegressors(self):
+        regressors = self.settings.value('regressors', '')
+        wcol = int(self.settings.value('wcol', -1))
+        return ([int(col) for col in regressors.split()],
+                None if wcol < 0 else wcol,
+                self.settings.value('sigma', 'false') == 'true')
+
+    def setColumns(self):
+        xcol, ycol, sep = self.getColumns()
+        regressors, wcol, sigma = self.getRegressors()
+        dialog = ColumnsDialog(xcol, ycol, sep, regressors, wcol, sigma,
+                               parent=self)
+        if dialog.exec_() == QtGui.QDialog.Accepted:
+            xcol, ycol, sep = dialog.getColumns()
+            regressors, wcol, sigma = dialog.getRegressors()
+            self.settings.setValue('xcol', xcol)
+            self.settings.setValue('ycol', ycol)
+            self.settings.setValue('sep', sep or '')
+            self.settings.setValue('regressors',
+                                   ' '.join(str(col) for col in regressors))
+            self.settings.setValue('wcol', -1 if wcol is None else wcol)
+            self.settings.setValue('sigma', 'true' if sigma else 'false')
 
     def about(self):
         title = 'About VisFitter'
@@ -190,6 +1339,7 @@ class MainWindow(QtGui.QMainWindow):
 
         if reply == QtGui.QMessageBox.Yes:
             self.writeWindowSettings()
+            self.fitRunner.wait()
             event.accept()
         else:
             event.ignore()
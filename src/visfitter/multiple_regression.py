@@ -0,0 +1,356 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Fits y = X b with several regressors, the columns of X, and optional
+per-point weights.
+
+The estimators take an (n, k) array, X, of regressors (or a 1-D array for a
+single regressor) and n values of y. Unless intercept is False, a column of
+ones is prepended to X, so the coefficients returned are the intercept
+followed by the coefficients of the k regressors. Weights, if given,
+multiply the squared residuals, e.g. 1 / sigma**2 for measurement
+uncertainties sigma, and points with a weight of 0 are left out. A boolean
+mask, if given, leaves out the points where it is False, as described in
+linear_regression.applyMask.
+'''
+
+# std lib imports
+import itertools
+import time
+import logging
+log = logging.getLogger(__name__)
+
+# third party imports
+import numpy
+
+# local imports
+from .linear_regression import (_report, _startStats, _finishStats,
+                                _requiredSubsets, _leastMedianIntercept,
+                                CostModel, Estimator, registerEstimator)
+
+
+def designMatrix(X, intercept=True):
+    '''
+    Returns the regressors X as an (n, p) float64 array, with a column of
+    ones prepended if intercept is True.
+    '''
+    X = numpy.asarray(X, dtype=numpy.float64)
+    if X.ndim == 1:
+        X = X[:, None]
+    if X.ndim != 2:
+        raise ValueError('expected one or two dimensional regressors, '
+                         'not {} dimensional'.format(X.ndim))
+    if intercept:
+        X = numpy.column_stack((numpy.ones(X.shape[0]), X))
+    return X
+
+
+def _prepare(X, y, weights, intercept, mask=None):
+    '''
+    Returns the design matrix, y, and the square roots of the weights (None
+    if there are none), after checking their shapes, without the points
+    that are masked out or have a weight of 0. Those would otherwise have a
+    weighted residual of 0 for every fit, and always be counted among the h
+    smallest.
+    '''
+    A = designMatrix(X, intercept)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    if y.shape != (A.shape[0],):
+        raise ValueError('expected {} values of y, not {}'
+                         ''.format(A.shape[0], y.size))
+    if A.shape[1] == 0:
+        raise ValueError('there are no coefficients to fit')
+    if weights is not None:
+        weights = numpy.asarray(weights, dtype=numpy.float64)
+        if weights.shape != y.shape:
+            raise ValueError('expected {} weights, not {}'
+                             ''.format(y.size, weights.size))
+        if numpy.any(weights < 0) or not numpy.all(numpy.isfinite(weights)):
+            raise ValueError('weights must be finite and non-negative')
+    if mask is not None:
+        mask = numpy.asarray(mask, dtype=bool)
+        if mask.shape != y.shape:
+            raise ValueError('expected {} mask entries, not {}'
+                             ''.format(y.size, mask.size))
+        A = A[mask]
+        y = y[mask]
+        if weights is not None:
+            weights = weights[mask]
+    if weights is None:
+        return A, y, None
+    positive = weights > 0
+    if not positive.all():
+        A = A[positive]
+        y = y[positive]
+        weights = weights[positive]
+    return A, y, numpy.sqrt(weights)
+
+
+def weightedLeastSquares(X, y, weights=None, intercept=True, mask=None,
+                         full_output=False, stats=None):
+    '''
+    Weighted least squares fit, which minimizes the sum of
+    weights * (y - A b)**2, where A is the design matrix of X.
+
+    Returns the coefficients, b. If full_output is True, their standard
+    errors are returned as well, estimated from the weighted residuals.
+    Raises ValueError if the columns of the design matrix are linearly
+    dependent. The stats argument is described in
+    linear_regression.FitStats.
+    '''
+    start_time = time.time()
+    stats = _startStats(stats)
+    A, y, sw = _prepare(X, y, weights, intercept, mask)
+    if sw is not None:
+        A = A * sw[:, None]
+        y = y * sw
+    n, p = A.shape
+    coef, _ssr, rank, _sv = numpy.linalg.lstsq(A, y, rcond=None)
+    if rank < p:
+        raise ValueError('the regressors are linearly dependent')
+    if stats is not None:
+        stats.candidates += 1
+    _finishStats('weightedLeastSquares', stats, start_time)
+    if not full_output:
+        return coef
+    if n <= p:
+        return coef, numpy.full(p, numpy.nan)
+    r = y - A.dot(coef)
+    variance = r.dot(r) / (n - p)
+    covariance = numpy.linalg.inv(A.T.dot(A)) * variance
+    return coef, numpy.sqrt(numpy.diag(covariance))
+
+
+def leastMedianOfSquares(X, y, weights=None, intercept=True,
+                         confidence=0.99, outlier_fraction=0.5, subsets=3000,
+                         time_budget=None, seed=None, chunk_size=2 ** 18,
+                         mask=None, full_output=False, callback=None,
+                         stats=None):
+    '''
+    Approximate least median of squares fit by random p-subsets, where p is
+    the number of coefficients, as in PROGRESS [1]. Minimizes the h-th
+    smallest weighted absolute residual, sqrt(weights) * abs(y - A b), with
+    h = n // 2 + (p + 1) // 2, which is n // 2 + 1 for a line.
+
+    The candidates, which fit p random points exactly, are drawn, solved
+    and scored in batches of at most chunk_size residuals, with one stacked
+    LAPACK solve and one matrix product per batch. Singular subsets are
+    skipped. The arguments that control the number of subsets are as for
+    linear_regression.leastMedianOfSquaresRandom. Without weights, the
+    intercept of the best fit is then adjusted to the exact least median of
+    squares intercept for its other coefficients.
+
+    Returns the coefficients, b. If full_output is True, the h-th smallest
+    weighted absolute residual, d_star, is returned as well. The progress
+    callback and the stats argument are described in
+    linear_regression.FitCancelled and linear_regression.FitStats.
+
+    [1] P. J. Rousseeuw and A. M. Leroy, Robust Regression and Outlier
+    Detection. New York: Wiley, 1987, ch. 5.
+    '''
+    start_time = time.time()
+    stats = _startStats(stats)
+    A, y, sw = _prepare(X, y, weights, intercept, mask)
+    h = _coverage(A)
+    coef, d_star = _subsetSearch('leastMedianOfSquares', A, y, sw, h,
+                                 confidence, outlier_fraction, subsets,
+                                 time_budget, seed, chunk_size, callback,
+                                 stats)
+    if intercept and sw is None and d_star < numpy.inf:
+        coef[0], d_star = _leastMedianIntercept(y - A[:, 1:].dot(coef[1:]), h)
+    _finishStats('leastMedianOfSquares', stats, start_time)
+    if full_output:
+        return coef, d_star
+    return coef
+
+
+def leastTrimmedSquares(X, y, weights=None, intercept=True,
+                        confidence=0.99, outlier_fraction=0.5, subsets=3000,
+                        time_budget=None, seed=None, chunk_size=2 ** 18,
+                        mask=None, full_output=False, callback=None,
+                        stats=None):
+    '''
+    Approximate least trimmed squares fit by random p-subsets. Minimizes
+    the sum of the h smallest weighted squared residuals, with h as for
+    leastMedianOfSquares. The subsets are drawn and scored in batches as
+    for leastMedianOfSquares, and the best candidate is then refit by
+    weighted least squares to the h points it fits best.
+
+    Returns the coefficients, b. If full_output is True, the trimmed sum of
+    squares is returned as well. The progress callback and the stats
+    argument are described in linear_regression.FitCancelled and
+    linear_regression.FitStats.
+    '''
+    start_time = time.time()
+    stats = _startStats(stats)
+    A, y, sw = _prepare(X, y, weights, intercept, mask)
+    h = _coverage(A)
+    coef, q = _subsetSearch('leastTrimmedSquares', A, y, sw, h, confidence,
+                            outlier_fraction, subsets, time_budget, seed,
+                            chunk_size, callback, stats)
+    if q < numpy.inf:
+        refit, refit_q = _trimmedRefit(A, y, sw, coef, h)
+        if refit_q <= q:
+            coef, q = refit, refit_q
+    _finishStats('leastTrimmedSquares', stats, start_time)
+    if full_output:
+        return coef, q
+    return coef
+
+
+def _coverage(A):
+    n, p = A.shape
+    if n < p:
+        raise ValueError('at least {} points are needed to fit {} '
+                         'coefficients'.format(p, p))
+    return min(n // 2 + (p + 1) // 2, n)
+
+
+def _subsetSearch(name, A, y, sw, h, confidence, outlier_fraction, subsets,
+                  time_budget, seed, chunk_size, callback, stats):
+    '''
+    Fits p-subsets of the points exactly, and returns the coefficients
+    with the least objective and the objective. The objective of
+    leastMedianOfSquares is the h-th smallest weighted absolute residual,
+    and that of leastTrimmedSquares is the sum of the h smallest weighted
+    squared residuals. If every subset is singular, the objective is inf.
+    '''
+    start_time = time.time()
+    n, p = A.shape
+    trimmed = name == 'leastTrimmedSquares'
+    best = numpy.inf
+    coef_star = numpy.zeros(p)
+    rows = max(1, chunk_size // n)
+    if _countSubsets(n, p, subsets) <= subsets:
+        exhaustive = numpy.array(list(itertools.combinations(xrange(n), p)),
+                                 dtype=numpy.intp).reshape(-1, p)
+        required = exhaustive.shape[0]
+    else:
+        exhaustive = None
+        rng = numpy.random.RandomState(seed)
+        required = _requiredSubsets(confidence, outlier_fraction, subsets, p)
+
+    drawn = 0
+    while drawn < required:
+        _report(callback, float(drawn) / required)
+        if time_budget is not None and time.time() - start_time > time_budget:
+            log.debug('%s: time budget exhausted after %d subsets', name,
+                      drawn)
+            break
+        b = min(rows, required - drawn)
+        if exhaustive is not None:
+            idx = exhaustive[drawn:drawn + b]
+        else:
+            idx = rng.randint(n, size=(b, p))
+            idx.sort(axis=1)
+            idx = idx[numpy.all(idx[:, 1:] != idx[:, :-1], axis=1)]
+        drawn += b
+
+        # Solve the nonsingular subsets together
+        sub = A[idx]
+        sign, _logdet = numpy.linalg.slogdet(sub)
+        keep = sign != 0
+        if not numpy.any(keep):
+            continue
+        coefs = numpy.linalg.solve(sub[keep], y[idx[keep]][:, :, None])
+        coefs = coefs[:, :, 0]
+
+        # Score them with one matrix product
+        z = y - coefs.dot(A.T)
+        if sw is not None:
+            z *= sw
+        if trimmed:
+            z *= z
+        else:
+            numpy.absolute(z, out=z)
+        if stats is not None:
+            t = time.time()
+        z.partition(h - 1, axis=1)
+        if stats is not None:
+            stats.selectSeconds += time.time() - t
+            stats.candidates += coefs.shape[0]
+            stats.selections += coefs.shape[0]
+        if trimmed:
+            d = z[:, :h].sum(axis=1)
+        else:
+            d = z[:, h - 1]
+        k = d.argmin()
+        if d[k] < best:
+            best = d[k]
+            coef_star = coefs[k]
+            if stats is not None:
+                stats.updates += 1
+
+    log.debug('%s: %s (%d subsets)', name, coef_star, drawn)
+    return coef_star.copy(), best
+
+
+def _countSubsets(n, p, limit):
+    '''
+    Returns the number of p-subsets of n points, or limit + 1 if there are
+    more than limit.
+    '''
+    count = 1
+    for i in xrange(p):
+        count = count * (n - i) // (i + 1)
+    return min(count, limit + 1)
+
+
+def _trimmedRefit(A, y, sw, coef, h):
+    '''
+    Returns the weighted least squares fit to the h points with the
+    smallest weighted squared residuals of coef, and its trimmed sum of
+    squares, or (coef, inf) if those points don't determine a fit.
+    '''
+    z = y - A.dot(coef)
+    if sw is not None:
+        z *= sw
+    subset = numpy.argpartition(z * z, h - 1)[:h]
+    As = A[subset]
+    ys = y[subset]
+    if sw is not None:
+        As = As * sw[subset, None]
+        ys = ys * sw[subset]
+    refit, _ssr, rank, _sv = numpy.linalg.lstsq(As, ys, rcond=None)
+    if rank < A.shape[1]:
+        return coef, numpy.inf
+    z = y - A.dot(refit)
+    if sw is not None:
+        z *= sw
+    z *= z
+    z.partition(h - 1)
+    return refit, z[:h].sum()
+
+
+registerEstimator(Estimator(
+    'wls', 'Weighted Least Squares', 'Fit y to x and the other regressors '
+    'using weighted least squares', weightedLeastSquares, CostModel(5e-8),
+    weights=True, cancellable=False, multiple=True, color='r'))
+registerEstimator(Estimator(
+    'lms-multiple', 'Least Median of Squares (Multiple)', 'Fit y to x and '
+    'the other regressors using the least median of squares',
+    leastMedianOfSquares, CostModel(4e-7, overhead=0.01), exact=False,
+    randomized=True, weights=True, multiple=True, color='b'))
+registerEstimator(Estimator(
+    'lts-multiple', 'Least Trimmed Squares (Multiple)', 'Fit y to x and the '
+    'other regressors using least trimmed squares', leastTrimmedSquares,
+    CostModel(4e-7, overhead=0.01), exact=False, randomized=True,
+    weights=True, multiple=True, color='c'))
@@ -0,0 +1,461 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Robust line fits of data files that are too large to read into memory.
+
+The file is read in chunks of a fixed number of rows, twice or more:
+
+1. A uniform random sample of the points is drawn with a reservoir, and
+   the least squares line of all of the points is accumulated.
+2. Candidate lines are fit to the sample with the (fast) estimators of the
+   linear_regression registry, and each candidate is scored by the exact
+   median of its absolute residuals over all of the points, which is
+   selected from the chunks with a bracket taken from the sample. The
+   candidate with the smallest median is the fit.
+
+Only if a bracket holds more points than can be buffered is it narrowed
+with a histogram and selected in further passes. Memory use is bounded by
+the chunk, sample and buffer sizes, whatever the size of the file:
+
+    alpha, beta = fitFile('huge.txt', keys=['lms-random', 'lts'])
+'''
+
+# std lib imports
+import math
+import time
+import logging
+log = logging.getLogger(__name__)
+
+# third party imports
+import numpy
+
+# local imports
+from . import parser
+from .linear_regression import (ESTIMATORS, LeastSquaresAccumulator,
+                                _report, getFallback, leastSquares)
+
+# The number of rows per chunk
+CHUNK_ROWS = 2 ** 20
+
+# The number of points in the random sample
+SAMPLE_SIZE = 2 ** 16
+
+# The most absolute residuals that are buffered per candidate for selection
+BUFFER_SIZE = 2 ** 20
+
+# The longest an estimator is estimated to take to fit the sample, in
+# seconds; slower estimators are replaced by their fallbacks
+SAMPLE_SECONDS = 10.
+
+# The number of bins used to narrow a bracket that overflows the buffer
+BINS = 1024
+
+# The width of the bracket of a median, in standard errors of the sample
+# quantile
+BRACKET_WIDTH = 4.
+
+# The default candidates; they are fit to the sample, so they should be
+# fast at SAMPLE_SIZE points
+DEFAULT_KEYS = ('ls', 'lms-random', 'lts', 'theil-sen-approx',
+                'repeated-median-approx')
+
+
+class ChunkReader(object):
+    '''
+    Reads the xcol and ycol columns of a data file in chunks of chunk_rows
+    points (the last chunk may be smaller), and can be iterated over any
+    number of times, reading the file again each time. Rows with a
+    non-finite x or y are skipped.
+
+    rows is the number of points read so far in the current pass, and
+    fraction the estimated fraction of the file that has been read.
+    '''
+
+    def __init__(self, filepath, xcol=0, ycol=1, sep=None,
+                 chunk_rows=CHUNK_ROWS):
+        self.filepath = filepath
+        self.xcol = xcol
+        self.ycol = ycol
+        self.sep = sep
+        self.chunk_rows = int(chunk_rows)
+        self.rows = 0
+        self.fraction = 0.
+        # The total number of rows, once the file has been read through
+        self._total = None
+
+    def __iter__(self):
+        self.rows = 0
+        self.fraction = 0.
+        parsed = 0
+        pending_x, pending_y, count = [], [], 0
+        with open(self.filepath, 'rb') as f:
+            cls = parser.getParserClass(self.filepath,
+                                        f.read(parser.SNIFF_BYTES))
+            f.seek(0)
+            p = cls(f)
+            for x, y in p.iterXY(self.xcol, self.ycol, self.sep):
+                parsed += x.size
+                total = self._total or p.estimateRows(parsed)
+                if total:
+                    self.fraction = min(float(parsed) / total, 1.)
+                finite = numpy.isfinite(x) & numpy.isfinite(y)
+                if not finite.all():
+                    x, y = x[finite], y[finite]
+                pending_x.append(x)
+                pending_y.append(y)
+                count += x.size
+                if count < self.chunk_rows:
+                    continue
+                x = numpy.concatenate(pending_x)
+                y = numpy.concatenate(pending_y)
+                stop = count - count % self.chunk_rows
+                for start in xrange(0, stop, self.chunk_rows):
+                    self.rows += self.chunk_rows
+                    yield (x[start:start + self.chunk_rows],
+                           y[start:start + self.chunk_rows])
+                pending_x, pending_y = [x[stop:]], [y[stop:]]
+                count -= stop
+        self._total = parsed
+        self.fraction = 1.
+        if count:
+            self.rows += count
+            yield numpy.concatenate(pending_x), numpy.concatenate(pending_y)
+
+
+class ReservoirSample(object):
+    '''
+    A uniform random sample, without replacement, of up to size of the
+    points passed to update, which are seen only once (Algorithm R of
+    Vitter [1], vectorized per chunk). x and y are the sampled points, and
+    seen the number of points passed so far. The seed is passed to
+    numpy.random.RandomState.
+
+    [1] J. S. Vitter, "Random sampling with a reservoir," ACM Transactions
+    on Mathematical Software, vol. 11, no. 1, pp. 37-57, Mar. 1985.
+    '''
+
+    def __init__(self, size=SAMPLE_SIZE, seed=None):
+        self.size = int(size)
+        self.seen = 0
+        self._x = numpy.empty(self.size)
+        self._y = numpy.empty(self.size)
+        self._rng = numpy.random.RandomState(seed)
+
+    @property
+    def x(self):
+        return self._x[:min(self.seen, self.size)]
+
+    @property
+    def y(self):
+        return self._y[:min(self.seen, self.size)]
+
+    def update(self, x, y):
+        m = x.size
+        # Fill the reservoir first
+        fill = min(max(self.size - self.seen, 0), m)
+        self._x[self.seen:self.seen + fill] = x[:fill]
+        self._y[self.seen:self.seen + fill] = y[:fill]
+        # The i-th point seen (from 0) then replaces a random point of the
+        # reservoir with probability size / (i + 1)
+        i = numpy.arange(self.seen + fill, self.seen + m, dtype=numpy.float64)
+        j = (self._rng.random_sample(i.size) * (i + 1)).astype(numpy.int64)
+        keep = numpy.flatnonzero(j < self.size)
+        if keep.size:
+            j = j[keep]
+            # Where a slot is replaced more than once, the last point wins,
+            # as it would one point at a time
+            j, last = numpy.unique(j[::-1], return_index=True)
+            keep = fill + keep[keep.size - 1 - last]
+            self._x[j] = x[keep]
+            self._y[j] = y[keep]
+        self.seen += m
+
+
+class Candidate(object):
+    '''
+    A candidate line, y = alpha + beta x, of an out of core fit, fit by the
+    estimator registered as key (the fallback of the one asked for, if that
+    was too slow for the sample), and d_star, the exact h-th smallest
+    absolute residual of all of the points, h = n // 2 + 1 (None if it
+    hasn't been scored).
+    '''
+
+    def __init__(self, key, alpha, beta, d_star=None):
+        self.key = key
+        self.alpha = alpha
+        self.beta = beta
+        self.d_star = d_star
+
+    def __repr__(self):
+        return 'Candidate({!r}, {!r}, {!r}, {!r})'.format(
+            self.key, self.alpha, self.beta, self.d_star)
+
+
+class OutOfCoreFit(object):
+    '''
+    The full output of fitFile: best, the Candidate with the smallest
+    d_star, all of the candidates, the number of points, n, the number of
+    points in the sample, the number of passes over the file, and the
+    time taken, in seconds.
+    '''
+
+    def __init__(self, candidates, n, sample_size, passes, seconds):
+        self.candidates = candidates
+        self.best = min(candidates, key=lambda c: c.d_star)
+        self.n = n
+        self.sample_size = sample_size
+        self.passes = passes
+        self.seconds = seconds
+
+
+def fitFile(filepath, xcol=0, ycol=1, sep=None, keys=DEFAULT_KEYS,
+            sample_size=SAMPLE_SIZE, chunk_rows=CHUNK_ROWS,
+            buffer_size=BUFFER_SIZE, bins=BINS, seed=None,
+            sample_seconds=SAMPLE_SECONDS, full_output=False, callback=None):
+    '''
+    Fits the xcol and ycol columns of a data file, read in chunks of
+    chunk_rows points, with the estimators named in keys, and returns the
+    alpha, beta of the line with the smallest median absolute residual.
+
+    Least squares is fit to all of the points, with a
+    LeastSquaresAccumulator, and the other estimators to a random sample of
+    sample_size points. An estimator that is estimated to take longer than
+    sample_seconds to fit the sample is replaced by its fallback (see
+    linear_regression.getFallback), and a ValueError is raised if there
+    isn't a fast enough one. Each candidate's median is then selected
+    exactly from all of the points (see selectAbsoluteResiduals). If
+    full_output is True, an OutOfCoreFit is returned as well.
+
+    The seed is passed to ReservoirSample and the randomized estimators,
+    and the progress callback is described in
+    linear_regression.FitCancelled.
+    '''
+    start = time.time()
+    for key in keys:
+        if ESTIMATORS[key].multiple:
+            raise ValueError('{} is not a line estimator'.format(key))
+    reader = ChunkReader(filepath, xcol, ycol, sep, chunk_rows)
+    passes = [0]
+
+    def chunks():
+        # Reports the progress of each pass, which take half the time
+        # left, since few fits need more than two
+        done = 1 - 0.5 ** passes[0]
+        passes[0] += 1
+        for x, y in reader:
+            _report(callback, done + (1 - done) * 0.5 * reader.fraction)
+            yield x, y
+
+    sample = ReservoirSample(sample_size, seed)
+    accumulator = LeastSquaresAccumulator() if 'ls' in keys else None
+    for x, y in chunks():
+        sample.update(x, y)
+        if accumulator is not None:
+            accumulator.update(x, y)
+    n = sample.seen
+    if n == 0:
+        raise ValueError('no rows could be read')
+
+    m = sample.x.size
+    candidates = []
+    for key in keys:
+        estimator = ESTIMATORS[key]
+        if estimator.func is leastSquares:
+            alpha, beta = accumulator.fit()
+        else:
+            estimator = getFallback(estimator, m, sample_seconds)
+            seconds = estimator.estimateSeconds(m)
+            if seconds > sample_seconds:
+                raise ValueError('{} would take about {:.3g} s to fit the '
+                                 'sample of {} points'.format(estimator.key,
+                                                              seconds, m))
+            if estimator.key != key:
+                log.info('fitFile: fitting the sample of %d points with %s '
+                         'instead of %s', m, estimator.key, key)
+            if any(c.key == estimator.key for c in candidates):
+                continue
+            kwargs = dict(seed=seed) if estimator.randomized else {}
+            alpha, beta = estimator(sample.x, sample.y, **kwargs)[:2]
+        candidates.append(Candidate(estimator.key, alpha, beta))
+
+    h = n // 2 + 1
+    lines = [(c.alpha, c.beta) for c in candidates]
+    d_stars = selectAbsoluteResiduals(chunks, lines, h, n, sample,
+                                      buffer_size, bins)
+    for candidate, d_star in zip(candidates, d_stars):
+        candidate.d_star = d_star
+    result = OutOfCoreFit(candidates, n, sample.x.size, passes[0],
+                          time.time() - start)
+    log.debug('fitFile: %s of %d points in %d passes in %.3f s',
+              result.best, n, result.passes, result.seconds)
+    if full_output:
+        return result.best.alpha, result.best.beta, result
+    return result.best.alpha, result.best.beta
+
+
+def selectAbsoluteResiduals(chunks, lines, h, n, sample=None,
+                            buffer_size=BUFFER_SIZE, bins=BINS):
+    '''
+    Returns a list of the exact h-th smallest absolute residuals of the n
+    points yielded as (x, y) chunks by chunks(), which is called once per
+    pass, from each of the lines, (alpha, beta) pairs.
+
+    If a sample of the points is given (e.g. a ReservoirSample), the h-th
+    smallest residual is bracketed with the sample quantiles, and the
+    residuals in the bracket are buffered in the first pass and selected
+    from. Otherwise, or if there are more than buffer_size of them, the
+    bin of a histogram that holds the h-th residual is found instead,
+    which narrows the bracket for the next pass.
+    '''
+    if not 1 <= h <= n:
+        raise ValueError('h must be between 1 and n')
+    selections = []
+    for alpha, beta in lines:
+        if sample is None:
+            edges = numpy.array([0., numpy.inf])
+            selections.append(_Selection(alpha, beta, edges, 0, 0))
+        else:
+            r = _absoluteResiduals(alpha, beta, sample.x, sample.y)
+            selections.append(_Selection.fromSample(alpha, beta, r, h, n,
+                                                    bins))
+    remaining = selections
+    while remaining:
+        for x, y in chunks():
+            for selection in remaining:
+                selection.update(_absoluteResiduals(
+                    selection.alpha, selection.beta, x, y), buffer_size)
+        remaining = [s for s in remaining if not s.finish(h, buffer_size,
+                                                          bins)]
+    return [s.result for s in selections]
+
+
+class _Selection(object):
+    '''
+    The state of the selection of the h-th smallest absolute residual of a
+    line, in one pass: the residuals are counted in half-open bins, [edges[i],
+    edges[i + 1]), which cover the range that holds it, and those in bins
+    first to stop - 1 are buffered, unless there are more than buffer_size
+    of them.
+    '''
+
+    def __init__(self, alpha, beta, edges, first, stop):
+        self.alpha = alpha
+        self.beta = beta
+        self.result = None
+        self.reset(edges, first, stop)
+
+    @classmethod
+    def fromSample(cls, alpha, beta, r, h, n, bins):
+        '''
+        Returns the selection of a line whose absolute residuals in a
+        sample are r, with the bins of the buffer spanning the sample
+        quantiles h / n plus and minus BRACKET_WIDTH standard errors.
+        '''
+        m = r.size
+        q = float(h) / n
+        error = BRACKET_WIDTH * math.sqrt(m * q * (1 - q)) + 1
+        low = int(math.floor(q * m - error))
+        high = int(math.ceil(q * m + error))
+        r = numpy.sort(r)
+        low = r[low] if low >= 0 else 0.
+        high = r[min(high, m - 1)]
+        edges = _edges(low, numpy.nextafter(high, numpy.inf), bins)
+        first = 1 if low > 0 else 0
+        edges = numpy.concatenate([[0.] if low > 0 else [], edges,
+                                   [numpy.inf]])
+        return cls(alpha, beta, edges, first, edges.size - 2)
+
+    def reset(self, edges, first, stop):
+        self.edges = edges
+        self.first = first
+        self.stop = stop
+        # Every pass counts the residuals below the range afresh
+        self.below = 0
+        self.counts = numpy.zeros(edges.size - 1, dtype=numpy.int64)
+        self.min = numpy.inf
+        self.max = -numpy.inf
+        self.buffer = parser.GrowableArray()
+        self.overflowed = False
+
+    def update(self, r, buffer_size):
+        low, high = self.edges[0], self.edges[-1]
+        self.below += numpy.count_nonzero(r < low)
+        r = r[(r >= low) & (r < high)]
+        if r.size == 0:
+            return
+        self.min = min(self.min, r.min())
+        self.max = max(self.max, r.max())
+        bins = self.edges.searchsorted(r, 'right') - 1
+        self.counts += numpy.bincount(bins, minlength=self.counts.size)
+        if self.overflowed:
+            return
+        values = r[(bins >= self.first) & (bins < self.stop)]
+        if self.buffer.size + values.size > buffer_size:
+            self.overflowed = True
+            self.buffer = None
+        else:
+            self.buffer.append(values)
+
+    def finish(self, h, buffer_size, bins):
+        '''
+        Sets result and returns True if the h-th smallest residual was
+        found in this pass, and otherwise narrows the range to the bin that
+        holds it, for the next pass.
+        '''
+        rank = h - self.below
+        cumulative = self.counts.cumsum()
+        if rank > cumulative[-1]:
+            # Only an infinite residual is outside of the bins
+            self.result = numpy.inf
+            return True
+        if self.min == self.max:
+            self.result = self.min
+            return True
+        i = cumulative.searchsorted(rank)
+        if not self.overflowed and self.first <= i < self.stop:
+            before = cumulative[self.first - 1] if self.first else 0
+            values = self.buffer.array
+            k = rank - before - 1
+            values.partition(k)
+            self.result = values[k]
+            return True
+        # The residuals of the bin are all in [min, max]
+        low = max(self.edges[i], self.min)
+        high = min(self.edges[i + 1], numpy.nextafter(self.max, numpy.inf))
+        edges = _edges(low, high, bins)
+        # Buffer the whole range if it fits
+        stop = edges.size - 1 if self.counts[i] <= buffer_size else 0
+        self.reset(edges, 0, stop)
+        return False
+
+
+def _edges(low, high, bins):
+    '''
+    Returns up to bins + 1 distinct, increasing bin edges from low to high.
+    '''
+    return numpy.unique(numpy.linspace(low, high, bins + 1))
+
+
+def _absoluteResiduals(alpha, beta, x, y):
+    r = beta * x
+    r += alpha
+    numpy.subtract(y, r, out=r)
+    return numpy.absolute(r, out=r)
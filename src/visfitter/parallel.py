@@ -0,0 +1,89 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import multiprocessing
+import multiprocessing.sharedctypes
+import logging
+log = logging.getLogger(__name__)
+
+# third party imports
+import numpy
+
+
+# The shared x and y arrays of the worker process
+_x = None
+_y = None
+
+
+def cpuCount():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def sharedCopy(a):
+    '''
+    Returns a copy of the float64 array, a, in shared memory.
+    '''
+    a = numpy.ascontiguousarray(a, dtype=numpy.float64).ravel()
+    buf = multiprocessing.sharedctypes.RawArray('d', max(a.size, 1))
+    numpy.frombuffer(buf)[:a.size] = a
+    return buf, a.size
+
+
+def _initWorker(x_shared, y_shared):
+    global _x, _y
+    (x_buf, x_size), (y_buf, y_size) = x_shared, y_shared
+    _x = numpy.frombuffer(x_buf)[:x_size]
+    _y = numpy.frombuffer(y_buf)[:y_size]
+
+
+def _callWorker(task):
+    func, args = task
+    return func(_x, _y, *args)
+
+
+def imapShared(func, x, y, tasks, processes=None):
+    '''
+    Calls func(x, y, *args) for each args in tasks, using a pool of
+    processes worker processes (one per core if None), and yields the
+    results in the order they complete.
+
+    x and y are copied once into shared memory when the pool is created,
+    and each worker maps them with numpy.frombuffer, so only the task
+    arguments and results are pickled. func must be a module level
+    function, so that it can be pickled by reference.
+    '''
+    if processes is None:
+        processes = cpuCount()
+    tasks = [(func, tuple(args)) for args in tasks]
+    pool = multiprocessing.Pool(processes, _initWorker,
+                                (sharedCopy(x), sharedCopy(y)))
+    log.debug('imapShared: %d tasks on %d processes', len(tasks), processes)
+    try:
+        for result in pool.imap_unordered(_callWorker, tasks):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
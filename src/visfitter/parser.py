@@ -20,6 +20,10 @@
 #############################################################################
 
 # std lib imports
+import os
+import bz2
+import gzip
+import time
 import logging
 log = logging.getLogger(__name__)
 
@@ -28,29 +32,674 @@ import numpy
 
 
 class AbstractParser(object):
+    '''
+    Base class of the data file parsers.
+
+    A parser is given an open binary file, f, positioned at the start, and
+    reads columns from it in chunks. Subclasses are registered
+    with registerParser, and are chosen by their sniff method, which looks
+    only at the first SNIFF_BYTES bytes of the file.
+    '''
+    # The name of the format, for display
+    name = None
+
+    # Whether it is worth keeping a binary copy of the parsed data
+    cacheable = True
+
     def __init__(self, f):
         self.f = f
+        self.rejected = 0
+        self.bytesRead = 0
 
-    def parse(self):
+    @classmethod
+    def sniff(cls, head, filepath):
+        '''
+        Returns True if the parser can read a file that starts with the
+        bytes, head.
+        '''
         raise NotImplementedError()
 
-def getXY(filepath, xcol=0, ycol=1, sep=None):
-    x = []
-    y = []
-    with open(filepath, 'rU') as f:
-        # Find the first parser that accepts the input
-        for line in f:
-            try:
-                if sep is None:
-                    tokens = line.split()
+    def iterColumns(self, cols, sep=None, chunk_size=2 ** 22):
+        '''
+        Yields the columns with the indices in cols in chunks, as lists of
+        arrays, with about chunk_size bytes of input per chunk. The number
+        of rejected rows and the number of bytes read so far are kept in the
+        rejected and bytesRead attributes.
+        '''
+        raise NotImplementedError()
+
+    def iterXY(self, xcol=0, ycol=1, sep=None, chunk_size=2 ** 22):
+        '''
+        Yields the xcol and ycol columns in chunks of (x, y) arrays, like
+        iterColumns.
+        '''
+        for x, y in self.iterColumns((xcol, ycol), sep, chunk_size):
+            yield x, y
+
+    def estimateRows(self, rows):
+        '''
+        Returns an estimate of the total number of rows, given that rows
+        rows have been read so far, or None if there is no estimate.
+        '''
+        return None
+
+    def parseColumns(self, cols, sep=None, chunk_size=2 ** 22):
+        '''
+        Returns a list of contiguous float64 arrays of the columns with the
+        indices in cols.
+        '''
+        arrays = None
+        for chunk in self.iterColumns(cols, sep, chunk_size):
+            if arrays is None:
+                capacity = self.estimateRows(chunk[0].size)
+                if capacity is None:
+                    capacity = max(chunk[0].size, 1024)
                 else:
-                    tokens = line.split(sep)
-                x.append(float(tokens[xcol]))
-                y.append(float(tokens[ycol]))
-            except:
-                continue
-    x = numpy.array(x)
-    y = numpy.array(y)
-    log.debug('x = {}'.format(x))
-    log.debug('y = {}'.format(y))
-    return x, y
\ No newline at end of file
+                    capacity = capacity * 1.05 + 1024
+                arrays = [GrowableArray(capacity) for _ in chunk]
+            for a, values in zip(arrays, chunk):
+                a.append(values)
+        if arrays is None:
+            return [numpy.empty(0) for _ in cols]
+        return [a.array for a in arrays]
+
+    def parse(self, xcol=0, ycol=1, sep=None, chunk_size=2 ** 22):
+        '''
+        Returns contiguous float64 arrays of the xcol and ycol columns.
+        '''
+        x, y = self.parseColumns((xcol, ycol), sep, chunk_size)
+        return x, y
+
+
+class TextParser(AbstractParser):
+    '''
+    Parses text files with one row per line and whitespace separated
+    columns. Lines where any of the requested columns is missing or isn't a
+    number, such as headers and comments, are skipped and counted as
+    rejected.
+
+    Chunks where every line has the same number of numeric columns are
+    parsed in bulk by numpy, and only the other chunks are parsed line by
+    line.
+    '''
+    name = 'Text'
+
+    # The separator used if none is given
+    defaultSep = None
+
+    @classmethod
+    def sniff(cls, head, filepath):
+        return '\0' not in head
+
+    def iterColumns(self, cols, sep=None, chunk_size=2 ** 22):
+        if sep is None:
+            sep = self.defaultSep
+        ncols = None
+        for text in _iterLines(self._open(), chunk_size):
+            self.bytesRead += len(text)
+            columns, ncols, rejected = _parseLines(text, cols, sep, ncols)
+            self.rejected += rejected
+            yield columns
+
+    def estimateRows(self, rows):
+        # Assume the rest of the file has the same density of rows
+        if not self.bytesRead:
+            return None
+        try:
+            size = os.fstat(self.f.fileno()).st_size
+        except (AttributeError, OSError):
+            return None
+        return rows * float(size) / self.bytesRead
+
+    def _open(self):
+        '''
+        Returns the file object to read the text from.
+        '''
+        return self.f
+
+
+class CSVParser(TextParser):
+    '''
+    Parses text files with comma separated columns.
+    '''
+    name = 'CSV'
+    defaultSep = ','
+
+    @classmethod
+    def sniff(cls, head, filepath):
+        if not TextParser.sniff(head, filepath):
+            return False
+        if filepath.lower().endswith('.csv'):
+            return True
+        return _sniffSeparator(head) == ','
+
+
+class CompressedTextParser(TextParser):
+    '''
+    Parses gzip or bzip2 compressed text files, with whitespace or comma
+    separated columns. The file is decompressed as it is read.
+    '''
+    name = 'Compressed text'
+
+    _magic = {'\x1f\x8b': 'gzip', 'BZh': 'bz2'}
+
+    @classmethod
+    def sniff(cls, head, filepath):
+        return cls._compression(head) is not None
+
+    @classmethod
+    def _compression(cls, head):
+        for magic, compression in cls._magic.iteritems():
+            if head.startswith(magic):
+                return compression
+        return None
+
+    def iterColumns(self, cols, sep=None, chunk_size=2 ** 22):
+        stream = self._open()
+        head = stream.read(SNIFF_BYTES)
+        if sep is None:
+            sep = _sniffSeparator(head)
+        self._stream = _Prepended(head, stream)
+        return TextParser.iterColumns(self, cols, sep, chunk_size)
+
+    def estimateRows(self, rows):
+        return None  # the decompressed size isn't known
+
+    def _open(self):
+        if getattr(self, '_stream', None) is not None:
+            return self._stream
+        head = self.f.read(SNIFF_BYTES)
+        compression = self._compression(head)
+        self.f.seek(0)
+        if compression == 'gzip':
+            return gzip.GzipFile(fileobj=self.f, mode='rb')
+        else:
+            return _BZ2Stream(self.f)
+
+
+class NumpyParser(AbstractParser):
+    '''
+    Parses NumPy .npy files and .npz archives. The columns are taken from a
+    two dimensional array with one row per point. If an .npz archive has
+    arrays named 'x' and 'y', those are used instead, as columns 0 and 1.
+    Otherwise, its first array is used. .npy files are memory mapped, so
+    only the requested columns are read.
+    '''
+    name = 'NumPy'
+    cacheable = False
+
+    @classmethod
+    def sniff(cls, head, filepath):
+        return (head.startswith('\x93NUMPY') or
+                (head.startswith('PK\x03\x04') and
+                 filepath.lower().endswith('.npz')))
+
+    def iterColumns(self, cols, sep=None, chunk_size=2 ** 22):
+        columns = self._columns(cols)
+        self._rows = columns[0].shape[0]
+        rows = max(1, chunk_size // sum(c.itemsize for c in columns))
+        for start in xrange(0, self._rows, rows):
+            chunk = [numpy.array(c[start:start + rows], dtype=numpy.float64)
+                     for c in columns]
+            self.bytesRead += sum(c.nbytes for c in chunk)
+            yield chunk
+
+    def estimateRows(self, rows):
+        return getattr(self, '_rows', None)
+
+    def _columns(self, cols):
+        if self.f.read(6) == '\x93NUMPY':
+            self.f.seek(0)
+            a = numpy.load(self.f.name, mmap_mode='r')
+        else:
+            self.f.seek(0)
+            archive = numpy.load(self.f)
+            if 'x' in archive.files and 'y' in archive.files:
+                xy = [archive['x'].ravel(), archive['y'].ravel()]
+                return [xy[col] for col in cols]
+            a = archive[archive.files[0]]
+        if a.ndim != 2:
+            raise ValueError('expected a two dimensional array, '
+                             'not {} dimensional'.format(a.ndim))
+        return [a[:, col] for col in cols]
+
+
+# The number of bytes at the start of a file that are used to choose a parser
+SNIFF_BYTES = 2 ** 12
+
+# The registered parser classes, in the order they are tried
+_parsers = []
+
+
+def registerParser(cls, first=False):
+    '''
+    Registers a parser class. Parsers are tried in the order they were
+    registered, unless first is True.
+    '''
+    if first:
+        _parsers.insert(0, cls)
+    else:
+        _parsers.append(cls)
+
+
+def getParsers():
+    return list(_parsers)
+
+
+def getParserClass(filepath, head=None):
+    '''
+    Returns the first registered parser class that accepts the file.
+    '''
+    if head is None:
+        with open(filepath, 'rb') as f:
+            head = f.read(SNIFF_BYTES)
+    for cls in _parsers:
+        if cls.sniff(head, filepath):
+            return cls
+    raise ValueError('unrecognized file format: {}'.format(filepath))
+
+
+registerParser(NumpyParser)
+registerParser(CompressedTextParser)
+registerParser(CSVParser)
+registerParser(TextParser)
+
+
+class GrowableArray(object):
+    '''
+    A one dimensional array that doubles its capacity whenever it runs
+    out of room, so that appending n values takes amortized O(n) time.
+    '''
+
+    def __init__(self, capacity=1024, dtype=numpy.float64):
+        self._data = numpy.empty(max(int(capacity), 1), dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return self._data.size
+
+    @property
+    def array(self):
+        '''
+        A contiguous view of the values appended so far.
+        '''
+        return self._data[:self.size]
+
+    def reserve(self, capacity):
+        if capacity > self._data.size:
+            data = numpy.empty(int(capacity), self._data.dtype)
+            data[:self.size] = self._data[:self.size]
+            self._data = data
+
+    def append(self, values):
+        values = numpy.asarray(values)
+        size = self.size + values.size
+        if size > self._data.size:
+            self.reserve(max(size, 2 * self._data.size))
+        self._data[self.size:size] = values.ravel()
+        self.size = size
+
+
+def getColumns(filepath, cols, sep=None, full_output=False,
+               chunk_size=2 ** 22):
+    '''
+    Reads the columns with the indices in cols from a data file, using the
+    first registered parser that accepts it. For text files, the columns of
+    each line are separated by sep, or by the parser's default separator if
+    None.
+
+    Returns a list of contiguous float64 arrays, one per column. If
+    full_output is True, a dict with the name of the format, the number of
+    rows read, the number of rejected rows, the number of bytes read, and
+    the time taken is returned as well.
+    '''
+    start = time.time()
+    with open(filepath, 'rb') as f:
+        cls = getParserClass(filepath, f.read(SNIFF_BYTES))
+        f.seek(0)
+        log.info('Reading %s as %s', filepath, cls.name)
+        p = cls(f)
+        columns = p.parseColumns(cols, sep, chunk_size)
+
+    seconds = time.time() - start
+    rows = columns[0].size if columns else 0
+    rate = p.bytesRead / 1e6 / seconds if seconds > 0 else numpy.inf
+    log.info('Read %d rows from %s (%d rejected) in %.3f s (%.1f MB/s)',
+             rows, filepath, p.rejected, seconds, rate)
+    if full_output:
+        info = dict(format=cls.name, rows=rows, rejected=p.rejected,
+                    bytes=p.bytesRead, seconds=seconds)
+        return columns, info
+    return columns
+
+
+def getXY(filepath, xcol=0, ycol=1, sep=None, full_output=False,
+          chunk_size=2 ** 22):
+    '''
+    Reads the xcol and ycol columns of a data file, like getColumns.
+
+    Returns contiguous float64 arrays x and y, and the info dict of
+    getColumns if full_output is True.
+    '''
+    (x, y), info = getColumns(filepath, (xcol, ycol), sep, True, chunk_size)
+    if full_output:
+        return x, y, info
+    return x, y
+
+
+def iterColumns(filepath, cols, sep=None, chunk_size=2 ** 22):
+    '''
+    Yields the columns with the indices in cols of a data file in chunks,
+    as lists of arrays, without reading the whole file into memory.
+    '''
+    with open(filepath, 'rb') as f:
+        cls = getParserClass(filepath, f.read(SNIFF_BYTES))
+        f.seek(0)
+        p = cls(f)
+        for chunk in p.iterColumns(cols, sep, chunk_size):
+            yield chunk
+
+
+def iterXY(filepath, xcol=0, ycol=1, sep=None, chunk_size=2 ** 22):
+    '''
+    Yields the xcol and ycol columns of a data file in chunks of (x, y)
+    arrays, without reading the whole file into memory.
+    '''
+    for x, y in iterColumns(filepath, (xcol, ycol), sep, chunk_size):
+        yield x, y
+
+
+class TailReader(object):
+    '''
+    Reads the columns with the indices in cols of a text data file that is
+    being appended to, e.g. by an instrument.
+
+    Each call to read parses only the bytes appended since the last one,
+    and appends the new rows to GrowableArrays, so following a file costs
+    amortized O(1) time per row. A trailing partial line is held back until
+    its line ending is written. If the file is truncated or replaced, it is
+    read again from the start, and generation is incremented.
+    '''
+
+    def __init__(self, filepath, cols, sep=None, chunk_size=2 ** 22):
+        cls = getParserClass(filepath)
+        if (not issubclass(cls, TextParser) or
+                issubclass(cls, CompressedTextParser)):
+            raise ValueError('only uncompressed text files can be followed, '
+                             'not {} files'.format(cls.name))
+        self.filepath = filepath
+        self.cols = list(cols)
+        self.sep = cls.defaultSep if sep is None else sep
+        self.chunk_size = chunk_size
+        self.generation = 0
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.rejected = 0
+        self._inode = None
+        self._rest = ''
+        self._ncols = None
+        self._columns = [GrowableArray() for _col in self.cols]
+
+    @property
+    def rows(self):
+        return self._columns[0].size
+
+    @property
+    def columns(self):
+        '''
+        Views of all of the rows read so far, one array per column.
+        '''
+        return [c.array for c in self._columns]
+
+    def read(self):
+        '''
+        Reads the rows appended since the last read, and returns them as a
+        list of arrays, one per column. If the file can't be opened, e.g.
+        while it is being replaced, no rows are returned.
+        '''
+        start = self.rows
+        try:
+            f = open(self.filepath, 'rb')
+        except IOError:
+            return [c[start:] for c in self.columns]
+        with f:
+            stat = os.fstat(f.fileno())
+            if (stat.st_size < self.offset or
+                    self._inode not in (None, stat.st_ino)):
+                log.info('%s was truncated or replaced; reading it again',
+                         self.filepath)
+                self._reset()
+                self.generation += 1
+                start = 0
+            self._inode = stat.st_ino
+            f.seek(self.offset)
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                self.offset += len(chunk)
+                text, self._rest = _splitLines(self._rest + chunk)
+                if not text:
+                    continue
+                columns, self._ncols, rejected = _parseLines(
+                    text, self.cols, self.sep, self._ncols)
+                self.rejected += rejected
+                for growable, column in zip(self._columns, columns):
+                    growable.append(column)
+        return [c[start:] for c in self.columns]
+
+
+class _Prepended(object):
+    '''
+    A read-only stream that returns head before the rest of stream.
+    '''
+
+    def __init__(self, head, stream):
+        self.head = head
+        self.stream = stream
+
+    def read(self, size):
+        if self.head:
+            data, self.head = self.head[:size], self.head[size:]
+            if len(data) < size:
+                data += self.stream.read(size - len(data))
+            return data
+        return self.stream.read(size)
+
+
+class _BZ2Stream(object):
+    '''
+    A read-only stream of the decompressed contents of a bzip2 file object.
+    '''
+
+    def __init__(self, f):
+        self.f = f
+        self.decompressor = bz2.BZ2Decompressor()
+        self.buffer = ''
+
+    def read(self, size):
+        while len(self.buffer) < size:
+            data = self.f.read(2 ** 20)
+            if not data:
+                break
+            try:
+                self.buffer += self.decompressor.decompress(data)
+            except EOFError:
+                # Concatenated bzip2 streams, as written by pbzip2
+                unused = self.decompressor.unused_data + data
+                self.decompressor = bz2.BZ2Decompressor()
+                self.buffer += self.decompressor.decompress(unused)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def _sniffSeparator(head):
+    '''
+    Returns ',' if the data lines at the start of some text look comma
+    separated, or None for whitespace.
+    '''
+    for line in head.splitlines()[:-1]:
+        tokens = line.split(',')
+        if len(tokens) < 2:
+            continue
+        try:
+            map(float, tokens)
+        except ValueError:
+            continue  # probably a header
+        return ','
+    return None
+
+
+# The most lines at the start of a chunk that are parsed one by one to find
+# the number of columns
+HEADER_LINES = 64
+
+
+def _iterLines(f, chunk_size):
+    '''
+    Yields chunks of about chunk_size bytes from the file, f, that end at a
+    line ending, with the line endings normalized to '\\n'.
+    '''
+    rest = ''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        text, rest = _splitLines(rest + chunk)
+        if text:
+            yield text
+    rest = rest.replace('\r', '\n')
+    if rest.strip():
+        yield rest + '\n'
+
+
+def _splitLines(text):
+    '''
+    Returns the complete lines of text, with the line endings normalized to
+    '\\n', and the rest of the text after the last line ending.
+    '''
+    # Hold back a trailing '\r', in case it is the start of a '\r\n'
+    carry = ''
+    if text.endswith('\r'):
+        text, carry = text[:-1], '\r'
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    end = text.rfind('\n') + 1
+    return text[:end], text[end:] + carry
+
+
+def _parseLines(text, cols, sep, ncols):
+    '''
+    Parses the lines of text, which must end with '\\n'. ncols is the
+    number of columns of the data lines, or None if it isn't known yet.
+
+    Returns (columns, ncols, rejected), where columns is a list of arrays.
+    '''
+    parts = []
+    rejected = 0
+    # Parse up to HEADER_LINES leading lines one by one until the number of
+    # columns is known, which also skips any header. If it still isn't
+    # known, the rest is parsed slowly.
+    start = 0
+    for _ in xrange(HEADER_LINES):
+        if ncols is not None or start == len(text):
+            break
+        end = text.find('\n', start) + 1
+        lcolumns, ncols, lrejected = _parseLinesSlowly(text[start:end], cols,
+                                                       sep, ncols)
+        parts.append(lcolumns)
+        rejected += lrejected
+        start = end
+    if start:
+        text = text[start:]
+
+    if text:
+        bcolumns = None
+        if ncols is not None:
+            bcolumns = _parseLinesInBulk(text, cols, sep, ncols)
+        if bcolumns is None:
+            bcolumns, ncols, brejected = _parseLinesSlowly(text, cols, sep,
+                                                           ncols)
+            rejected += brejected
+        parts.append(bcolumns)
+    if len(parts) == 1:
+        return parts[0], ncols, rejected
+    return map(numpy.concatenate, zip(*parts)), ncols, rejected
+
+
+def _parseLinesInBulk(text, cols, sep, ncols):
+    '''
+    Parses the lines of text with numpy, if every line is either blank or
+    has ncols numeric columns. Otherwise, returns None.
+    '''
+    if sep is not None:
+        if len(sep) != 1:
+            return None
+        b = numpy.frombuffer(text, dtype=numpy.uint8)
+        nseps = _countPerLine(numpy.flatnonzero(b == ord(sep)),
+                              numpy.flatnonzero(b == 10))
+        text = text.replace(sep, ' ')
+    # Count the tokens on each line. Bytes up to ' ' are taken as
+    # whitespace, and a token starts after each whitespace to non-whitespace
+    # transition.
+    b = numpy.frombuffer(text, dtype=numpy.uint8)
+    space = b <= 32
+    starts = numpy.flatnonzero(space[:-1] > space[1:]) + 1
+    if not space[0]:
+        starts = numpy.concatenate(([0], starts))
+    counts = _countPerLine(starts, numpy.flatnonzero(b == 10))
+    blank = counts == 0
+    if not numpy.all((counts == ncols) | blank):
+        return None
+    if sep is not None and not numpy.all(nseps == numpy.where(blank, 0,
+                                                              ncols - 1)):
+        return None  # there are empty or extra columns
+    if max(cols) >= ncols or min(cols) < -ncols:
+        return None  # let the slow path reject the lines
+    values = numpy.fromstring(text, sep=' ')
+    if values.size != starts.size:
+        return None  # not all of the tokens are numbers
+    values = values.reshape(-1, ncols)
+    return [values[:, col] for col in cols]
+
+
+def _countPerLine(positions, newlines):
+    '''
+    Returns the number of the sorted positions that fall on each line.
+    '''
+    ends = numpy.searchsorted(positions, newlines)
+    return numpy.diff(numpy.concatenate(([0], ends)))
+
+
+def _parseLinesSlowly(text, cols, sep, ncols):
+    '''
+    Parses the lines of text one by one, skipping lines where any of the
+    columns is missing or non-numeric. The number of columns, ncols, is
+    taken from the first line that isn't skipped, if it isn't known yet.
+
+    Returns (columns, ncols, rejected).
+    '''
+    # The values of the rows, one after another, which numpy converts
+    # faster than a list of rows
+    values = []
+    extend = values.extend
+    rejected = 0
+    for line in text.split('\n'):
+        tokens = line.split(sep)
+        try:
+            row = [float(tokens[col]) for col in cols]
+        except (IndexError, ValueError):
+            if line.strip():
+                rejected += 1
+            continue
+        extend(row)
+        if ncols is None:
+            ncols = len(tokens)
+    values = numpy.array(values, dtype=numpy.float64).reshape(-1, len(cols))
+    return [values[:, i] for i in xrange(len(cols))], ncols, rejected
@@ -0,0 +1,127 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Spatial index of scatter data, for selecting the points in a rectangle.
+'''
+
+# std lib imports
+import time
+import logging
+log = logging.getLogger(__name__)
+
+# third party imports
+import numpy
+
+
+class StripIndex(object):
+    '''
+    Finds the points of x, y in a rectangle in O(s log n + k) time, where k
+    is the number of points found, and s is the number of strips that the
+    rectangle spans.
+
+    The points are split by x into about sqrt(n) strips holding equal
+    numbers of points, so that the strips adapt to the distribution of the
+    data (e.g. points crowded along a line, which would leave most of the
+    cells of a uniform grid empty), and each strip is sorted by y. The
+    points of a strip in a y range are then found with a binary search,
+    and only the points of the two edge strips, in the y range, need to be
+    checked against the x range. Points with a non-finite coordinate are
+    never found.
+
+    The index is built in O(n log n) time, and takes four arrays of n
+    values; it doesn't follow changes to x and y, so it must be rebuilt if
+    they change.
+    '''
+
+    def __init__(self, x, y, points_per_strip=None):
+        start = time.time()
+        x = numpy.asarray(x, dtype=numpy.float64)
+        y = numpy.asarray(y, dtype=numpy.float64)
+        if x.shape != y.shape or x.ndim != 1:
+            raise ValueError('x and y must be one dimensional arrays of the '
+                             'same size')
+        self.size = x.size
+        index = numpy.flatnonzero(numpy.isfinite(x) & numpy.isfinite(y))
+        x, y = x[index], y[index]
+        m = index.size
+        if points_per_strip is None:
+            points_per_strip = max(int(numpy.sqrt(m)), 1)
+
+        # The lower x edges of the strips; a strip holds edges[i] <= x <
+        # edges[i + 1], so equal x never span two strips
+        order = numpy.argsort(x)
+        self.edges = numpy.unique(x[order[::points_per_strip]])
+        del order
+        strip = self.edges.searchsorted(x, 'right') - 1
+
+        # Sort by strip, then by the rank of y, in a single integer key
+        order = numpy.argsort(y)
+        self.ys = y[order]
+        rank = numpy.empty(m, dtype=numpy.int64)
+        rank[order] = numpy.arange(m)
+        del order
+        keys = strip * numpy.int64(m)
+        keys += rank
+        del strip, rank
+        order = numpy.argsort(keys)
+        self.keys = keys[order]
+        self.index = index[order]
+        self.x = x[order]
+        log.debug('StripIndex: %d strips for %d points in %.3f s',
+                  self.edges.size, m, time.time() - start)
+
+    def query(self, xmin, xmax, ymin, ymax):
+        '''
+        Returns the indices of the points with xmin <= x <= xmax and ymin <=
+        y <= ymax, in no particular order.
+        '''
+        m = self.keys.size
+        empty = numpy.empty(0, dtype=numpy.intp)
+        if m == 0 or not (xmin <= xmax and ymin <= ymax):
+            return empty
+        first = max(self.edges.searchsorted(xmin, 'right') - 1, 0)
+        last = self.edges.searchsorted(xmax, 'right') - 1
+        low = self.ys.searchsorted(ymin, 'left')
+        high = self.ys.searchsorted(ymax, 'right')
+        if last < 0 or low >= high:
+            return empty
+        strips = numpy.arange(first, last + 1, dtype=numpy.int64) * m
+        starts = self.keys.searchsorted(strips + low)
+        stops = self.keys.searchsorted(strips + high)
+        pos = _ranges(starts, stops)
+        # Only the edge strips can hold points outside of the x range
+        px = self.x[pos]
+        pos = pos[(px >= xmin) & (px <= xmax)]
+        return self.index[pos]
+
+
+def _ranges(starts, stops):
+    '''
+    Returns the concatenation of the ranges start:stop, without a python
+    loop over them.
+    '''
+    lengths = stops - starts
+    total = lengths.sum()
+    if total == 0:
+        return numpy.empty(0, dtype=numpy.intp)
+    # Each range continues from where the previous one ended
+    shift = starts - (numpy.cumsum(lengths) - lengths)
+    return numpy.arange(total) + numpy.repeat(shift, lengths)
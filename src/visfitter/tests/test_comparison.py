@@ -0,0 +1,111 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Tests of the comparison of estimators.
+'''
+
+# std lib imports
+import unittest
+
+# third party imports
+import numpy
+
+# local imports
+from .. import comparison
+from .. import linear_regression
+from .. import multiple_regression
+
+# Estimators that don't draw random numbers, so that every run gives the
+# same fits
+KEYS = ['ls', 'lms', 'lms-steele-steiger', 'theil-sen', 'repeated-median']
+
+
+class TestCompareEstimators(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.x = rng.uniform(0, 10, 60)
+        self.y = 1. + 2. * self.x + rng.normal(0, 0.5, 60)
+        self.y[:15] += 30.
+        self.mask = numpy.ones(60, dtype=bool)
+        self.mask[40:45] = False
+
+    def compare(self, processes):
+        rows = comparison.compareEstimators(self.x, self.y, KEYS, processes,
+                                            self.mask)
+        return dict((row.key, row) for row in rows)
+
+    def testSerial(self):
+        rows = self.compare(1)
+        self.assertEqual(sorted(rows), sorted(KEYS))
+        x, y = self.x[self.mask], self.y[self.mask]
+        for key, row in rows.iteritems():
+            self.assertIsNone(row.error)
+            self.assertEqual(row.name, linear_regression.ESTIMATORS[key].name)
+            expected = linear_regression.ESTIMATORS[key](x, y)
+            self.assertEqual(row.result[:2], expected[:2])
+            r = numpy.sort(numpy.absolute(y - row.alpha - row.beta * x))
+            self.assertAlmostEqual(row.d_star, r[x.size // 2])
+
+    def testPooledMatchesSerial(self):
+        serial = self.compare(1)
+        pooled = self.compare(2)
+        self.assertEqual(sorted(pooled), sorted(serial))
+        for key, row in serial.iteritems():
+            other = pooled[key]
+            self.assertIsNone(other.error)
+            self.assertEqual(other.result[:2], row.result[:2])
+            self.assertEqual(other.d_star, row.d_star)
+            self.assertEqual(other.scale, row.scale)
+
+    def testUpdates(self):
+        updates = []
+        progress = []
+        rows = comparison.compareEstimators(self.x, self.y, KEYS, 2,
+                                            callback=progress.append,
+                                            update=updates.append)
+        self.assertEqual(len(updates), len(KEYS))
+        self.assertEqual([len(u) for u in updates], range(1, len(KEYS) + 1))
+        self.assertEqual(updates[-1], rows)
+        self.assertEqual(progress[0], 0.)
+        self.assertEqual(progress[-1], 1.)
+
+    def testFailedFit(self):
+        # Theil-Sen can't fit points that all have the same x; the failure
+        # is reported in its row
+        x = numpy.ones(10)
+        y = numpy.arange(10.)
+        rows = comparison.compareEstimators(x, y, ['theil-sen', 'ls'], 1)
+        self.assertEqual(len(rows), 2)
+        for row in rows:
+            self.assertIsNotNone(row.error)
+            self.assertIsNone(row.result)
+
+    def testMultiple(self):
+        estimator = linear_regression.ESTIMATORS['lms-multiple']
+        self.assertEqual(estimator.func.__module__,
+                         multiple_regression.__name__)
+        with self.assertRaises(ValueError):
+            comparison.compareEstimators(self.x, self.y, ['lms-multiple'])
+
+
+if __name__ == '__main__':
+    unittest.main()
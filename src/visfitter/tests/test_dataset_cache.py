@@ -0,0 +1,185 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Tests of when the dataset cache reuses its binary copy of a data file.
+'''
+
+# std lib imports
+import os
+import logging
+import shutil
+import tempfile
+import unittest
+
+# third party imports
+import numpy
+
+# local imports
+from .. import dataset_cache
+from . import RecordingHandler
+
+
+class TestDatasetCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.dir, 'cache')
+        self.path = os.path.join(self.dir, 'data.txt')
+        self.write('1 2 3\n4 5 6\n7 8 9\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, text, mtime=None):
+        with open(self.path, 'wb') as f:
+            f.write(text)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def getXY(self, *args, **kwargs):
+        return dataset_cache.getXY(self.path, *args, cache_dir=self.cache_dir,
+                                   full_output=True, **kwargs)
+
+    def testReused(self):
+        x, y, info = self.getXY()
+        self.assertFalse(info['cached'])
+        x, y, info = self.getXY()
+        self.assertTrue(info['cached'])
+        self.assertEqual(info['rows'], 3)
+        numpy.testing.assert_array_equal(x, [1, 4, 7])
+        numpy.testing.assert_array_equal(y, [2, 5, 8])
+        self.assertIsInstance(x, numpy.memmap)
+        self.assertFalse(x.flags.writeable)
+
+    def testColumnsAndSeparator(self):
+        # Each choice of columns and separator has its own copy
+        self.getXY()
+        x, y, info = self.getXY(0, 2)
+        self.assertFalse(info['cached'])
+        numpy.testing.assert_array_equal(y, [3, 6, 9])
+        x, y, info = self.getXY(sep=' ')
+        self.assertFalse(info['cached'])
+        self.assertTrue(self.getXY()[2]['cached'])
+        self.assertTrue(self.getXY(0, 2)[2]['cached'])
+
+    def testModified(self):
+        self.getXY()
+        self.write('1 2 3\n4 5 6\n7 8 9\n10 11 12\n')
+        x, y, info = self.getXY()
+        self.assertFalse(info['cached'])
+        numpy.testing.assert_array_equal(x, [1, 4, 7, 10])
+
+    def testModifiedReplacesCopy(self):
+        # The copy of a modified file is replaced, not left behind
+        self.getXY()
+        self.write('1 2 3\n4 5 6\n7 8 9\n10 11 12\n')
+        self.getXY()
+        names = sorted(os.listdir(self.cache_dir))
+        self.assertEqual([os.path.splitext(n)[1] for n in names],
+                         ['.json', '.npy'])
+        self.assertEqual(len(set(os.path.splitext(n)[0] for n in names)), 1)
+
+    def getCopies(self):
+        return sorted(os.path.splitext(n)[0]
+                      for n in os.listdir(self.cache_dir)
+                      if n.endswith('.npy'))
+
+    def testEvicted(self):
+        self.getXY()
+        size = sum(os.path.getsize(os.path.join(self.cache_dir, n))
+                   for n in os.listdir(self.cache_dir))
+        self.getXY(0, 2)
+        self.assertEqual(len(self.getCopies()), 2)
+        # Use the first copy, so the second is the least recently used
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            os.utime(path, (1e9, 1e9))
+        self.assertTrue(self.getXY()[2]['cached'])
+        first, = [c for c in self.getCopies()
+                  if os.path.getmtime(os.path.join(self.cache_dir,
+                                                   c + '.npy')) > 1e9]
+        x, y, info = self.getXY(1, 2, max_bytes=2 * size + size // 2)
+        self.assertFalse(info['cached'])
+        numpy.testing.assert_array_equal(y, [3, 6, 9])
+        copies = self.getCopies()
+        self.assertEqual(len(copies), 2)
+        self.assertIn(first, copies)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 4)
+        self.assertTrue(self.getXY()[2]['cached'])
+        self.assertFalse(self.getXY(0, 2)[2]['cached'])
+
+    def testNewestKept(self):
+        # The copy just written is kept even if it alone is too large
+        self.getXY()
+        x, y, info = self.getXY(0, 2, max_bytes=0)
+        self.assertEqual(len(self.getCopies()), 1)
+        self.assertTrue(self.getXY(0, 2)[2]['cached'])
+
+    def testSameSizeAndTime(self):
+        # A change that keeps the size and modification time is caught by
+        # the fingerprint
+        self.write('1 2 3\n4 5 6\n7 8 9\n', mtime=1e9)
+        self.getXY()
+        self.write('1 2 3\n4 5 6\n7 0 9\n', mtime=1e9)
+        x, y, info = self.getXY()
+        self.assertFalse(info['cached'])
+        numpy.testing.assert_array_equal(y, [2, 5, 0])
+
+    def testTouched(self):
+        # Only the description of the file is compared, so touching it
+        # parses it again
+        self.write('1 2 3\n4 5 6\n7 8 9\n', mtime=1e9)
+        self.getXY()
+        os.utime(self.path, (2e9, 2e9))
+        self.assertFalse(self.getXY()[2]['cached'])
+        self.assertTrue(self.getXY()[2]['cached'])
+
+    def testUnreadableCopy(self):
+        self.getXY()
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npy'):
+                with open(os.path.join(self.cache_dir, name), 'wb') as f:
+                    f.write('garbage')
+        handler = RecordingHandler()
+        logger = logging.getLogger(dataset_cache.__name__)
+        logger.addHandler(handler)
+        try:
+            x, y, info = self.getXY()
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual([r.levelno for r in handler.records],
+                         [logging.WARNING])
+        self.assertFalse(info['cached'])
+        numpy.testing.assert_array_equal(x, [1, 4, 7])
+        self.assertTrue(self.getXY()[2]['cached'])
+
+    def testNumpyNotCached(self):
+        path = os.path.join(self.dir, 'data.npy')
+        numpy.save(path, numpy.arange(6.).reshape(3, 2))
+        x, y, info = dataset_cache.getXY(path, cache_dir=self.cache_dir,
+                                         full_output=True)
+        self.assertFalse(info['cached'])
+        numpy.testing.assert_array_equal(y, [1, 3, 5])
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
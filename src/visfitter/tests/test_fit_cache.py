@@ -0,0 +1,159 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Tests of the keys of the fit cache, and of the cache itself.
+'''
+
+# std lib imports
+import os
+import logging
+import shutil
+import tempfile
+import unittest
+
+# third party imports
+import numpy
+
+# local imports
+from .. import fit_cache
+from .. import linear_regression
+from . import RecordingHandler
+
+
+class TestKeys(unittest.TestCase):
+
+    def setUp(self):
+        self.x = numpy.arange(10.)
+        self.y = 2. * self.x + 1.
+        self.hash = fit_cache.hashData(self.x, self.y)
+
+    def getKey(self, func=linear_regression.leastSquares, **kwargs):
+        return fit_cache.getKey(func, self.hash, kwargs)
+
+    def testHashData(self):
+        self.assertEqual(fit_cache.hashData(self.x, self.y),
+                         fit_cache.hashData(list(self.x), self.y[::-1][::-1]))
+        self.assertNotEqual(fit_cache.hashData(self.y, self.x), self.hash)
+        self.assertNotEqual(fit_cache.hashData(self.x, self.y + 1e-12),
+                            self.hash)
+        # The shapes are hashed as well as the values
+        self.assertNotEqual(fit_cache.hashData(self.x.reshape(5, 2)),
+                            fit_cache.hashData(self.x))
+
+    def testIgnoredKwargs(self):
+        key = self.getKey()
+        self.assertEqual(self.getKey(callback=lambda fraction: None,
+                                     stats=linear_regression.FitStats(),
+                                     processes=4, cancellable=False), key)
+
+    def testKwargs(self):
+        key = self.getKey()
+        self.assertNotEqual(self.getKey(full_output=True), key)
+        self.assertNotEqual(self.getKey(linear_regression.theilSen), key)
+        self.assertEqual(self.getKey(linear_regression.theilSen, seed=1),
+                         self.getKey(linear_regression.theilSen, seed=1))
+        self.assertNotEqual(self.getKey(linear_regression.theilSen, seed=1),
+                            self.getKey(linear_regression.theilSen, seed=2))
+
+    def testArrayKwargs(self):
+        mask = self.x > 3
+        self.assertEqual(self.getKey(mask=mask), self.getKey(mask=mask.copy()))
+        self.assertNotEqual(self.getKey(mask=mask), self.getKey(mask=~mask))
+        self.assertNotEqual(self.getKey(mask=mask), self.getKey())
+
+    def testTimeBudget(self):
+        self.assertIsNone(self.getKey(linear_regression.leastTrimmedSquares,
+                                      time_budget=1.))
+        self.assertIsNotNone(self.getKey(
+            linear_regression.leastTrimmedSquares, time_budget=None))
+
+    def testSingleAndFitAllAgree(self):
+        # Fit All caches its results under the registry's kwargs, which
+        # single fits add cancellable and processes to
+        for estimator in linear_regression.ESTIMATORS.itervalues():
+            kwargs = dict(estimator.kwargs, cancellable=estimator.cancellable,
+                          processes=2)
+            self.assertEqual(self.getKey(estimator.func, **kwargs),
+                             self.getKey(estimator.func, **estimator.kwargs))
+
+
+class TestFitCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testMemory(self):
+        cache = fit_cache.FitCache(max_entries=2)
+        cache.put('a', (1., 2.))
+        cache.put('b', (3., 4.))
+        self.assertEqual(cache.get('a'), (1., 2.))
+        cache.put('c', (5., 6.))
+        # b was the least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), (1., 2.))
+        self.assertEqual(cache.get('c'), (5., 6.))
+        cache.put(None, (7., 8.))
+        self.assertIsNone(cache.get(None))
+
+    def testDisk(self):
+        cache = fit_cache.FitCache(cache_dir=self.dir)
+        cache.put('a', (1., 2.))
+        cache = fit_cache.FitCache(cache_dir=self.dir)
+        self.assertEqual(cache.get('a'), (1., 2.))
+        cache.clear()
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def testUnreadable(self):
+        with open(os.path.join(self.dir, 'a.pickle'), 'wb') as f:
+            f.write('garbage')
+        cache = fit_cache.FitCache(cache_dir=self.dir)
+        handler = RecordingHandler()
+        logger = logging.getLogger(fit_cache.__name__)
+        logger.addHandler(handler)
+        try:
+            self.assertIsNone(cache.get('a'))
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(len(handler.records), 1)
+        # and it is removed
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def testCall(self):
+        calls = []
+
+        def fit(x, y, offset=0.):
+            calls.append(offset)
+            return x.sum() + offset, y.sum()
+        cache = fit_cache.FitCache()
+        x, y = numpy.arange(3.), numpy.ones(3)
+        self.assertEqual(cache.call(fit, x, y), (3., 3.))
+        self.assertEqual(cache.call(fit, x.copy(), y, callback=None),
+                         (3., 3.))
+        self.assertEqual(cache.call(fit, x, y, offset=1.), (4., 3.))
+        self.assertEqual(calls, [0., 1.])
+
+
+if __name__ == '__main__':
+    unittest.main()
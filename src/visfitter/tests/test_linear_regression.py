@@ -0,0 +1,361 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Tests of the line estimators of linear_regression, against simple
+reference implementations on small random data sets.
+'''
+
+# std lib imports
+import unittest
+
+# third party imports
+import numpy
+
+# local imports
+from .. import linear_regression
+
+
+def bruteForceLeastMedian(x, y):
+    '''
+    Returns the smallest h-th smallest absolute residual, h = n // 2 + 1, of
+    any line, by trying the slopes of all pairs of points, one of which is
+    the slope of the optimal line, with the best intercept for each.
+    '''
+    n = x.size
+    h = n // 2 + 1
+    best = numpy.inf
+    for i in xrange(n):
+        for j in xrange(i + 1, n):
+            if x[i] == x[j]:
+                continue
+            beta = (y[j] - y[i]) / (x[j] - x[i])
+            r = numpy.sort(y - beta * x)
+            best = min(best, (r[h - 1:] - r[:n - h + 1]).min() / 2)
+    return best
+
+
+def hthResidual(alpha, beta, x, y):
+    '''
+    Returns the h-th smallest absolute residual, h = n // 2 + 1, of the line.
+    '''
+    r = numpy.sort(numpy.absolute(y - alpha - beta * x))
+    return r[x.size // 2]
+
+
+def getRandomData(rng, n):
+    '''
+    Returns n points near a line, a quarter of which are outliers.
+    '''
+    x = rng.uniform(-10, 10, n)
+    y = 1. + 2. * x + rng.normal(0, 1, n)
+    outliers = rng.rand(n) < 0.25
+    y[outliers] += rng.uniform(10, 50, outliers.sum())
+    return x, y
+
+
+def referenceSlopes(x, y, i=None):
+    '''
+    Returns the slopes of the lines through all pairs of points with
+    distinct x, or through point i and each of the others.
+    '''
+    n = x.size
+    if i is None:
+        pairs = [(k, l) for k in xrange(n) for l in xrange(k + 1, n)]
+    else:
+        pairs = [(i, l) for l in xrange(n) if l != i]
+    return numpy.array([(y[l] - y[k]) / (x[l] - x[k]) for k, l in pairs
+                        if x[k] != x[l]])
+
+
+def slopeMatrix(x, y, rows=None):
+    '''
+    Returns the array of the slopes of the lines through each pair of
+    points, which is nan where their x are equal, with one row per point,
+    or per point in rows.
+    '''
+    if rows is None:
+        rows = slice(None)
+    dx = x[None, :] - x[rows, None]
+    dy = y[None, :] - y[rows, None]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        slopes = dy / dx
+    slopes[dx == 0] = numpy.nan
+    return slopes
+
+
+def getLargeData(rng, n, ties):
+    '''
+    Returns n points with more than 2 ** 20 pairs with distinct x, so that
+    slope selection takes the randomized narrowing steps (for the repeated
+    median, only if n is at least 3000).
+    '''
+    if ties:
+        x = rng.randint(0, n // 4, n).astype(float)
+    else:
+        x = rng.uniform(0, 10, n)
+    y = 1. + 2. * x + rng.standard_cauchy(n)
+    return x, y
+
+
+def lowerMedian(values):
+    values = numpy.sort(values)
+    return values[(values.size - 1) // 2]
+
+
+class TestLeastMedianOfSquares(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = numpy.random.RandomState(0)
+
+    def checkExact(self, func, n):
+        for _ in xrange(10):
+            x, y = getRandomData(self.rng, n)
+            alpha, beta, d_star = func(x, y, full_output=True)
+            expected = bruteForceLeastMedian(x, y)
+            self.assertAlmostEqual(d_star, expected, places=9)
+            self.assertAlmostEqual(hthResidual(alpha, beta, x, y), d_star,
+                                   places=9)
+
+    def testSweepOdd(self):
+        self.checkExact(linear_regression.leastMedianOfSquaresSweep, 13)
+
+    def testSweepEven(self):
+        self.checkExact(linear_regression.leastMedianOfSquaresSweep, 12)
+
+    def testAlgorithm2Odd(self):
+        self.checkExact(linear_regression.leastMedianOfSquares, 13)
+
+    def testAlgorithm2Even(self):
+        self.checkExact(linear_regression.leastMedianOfSquares, 12)
+
+    def testAlgorithm2SmallChunks(self):
+        # Blocks of a single row of pairs
+        def func(x, y, **kwargs):
+            return linear_regression.leastMedianOfSquares(x, y, chunk_size=1,
+                                                          **kwargs)
+        self.checkExact(func, 11)
+
+    def testCrudeOdd(self):
+        # For even n, the crude algorithm minimizes the mean of the two
+        # middle absolute residuals instead
+        self.checkExact(linear_regression.leastMedianOfSquaresCrude, 11)
+
+    def testVariantsAgree(self):
+        for n in (9, 10, 15, 16):
+            x, y = getRandomData(self.rng, n)
+            sweep = linear_regression.leastMedianOfSquaresSweep(
+                x, y, full_output=True)[2]
+            algorithm2 = linear_regression.leastMedianOfSquares(
+                x, y, full_output=True)[2]
+            self.assertAlmostEqual(sweep, algorithm2, places=9)
+            if n % 2:
+                crude = linear_regression.leastMedianOfSquaresCrude(
+                    x, y, full_output=True)[2]
+                self.assertAlmostEqual(sweep, crude, places=9)
+
+    def testMask(self):
+        x, y = getRandomData(self.rng, 15)
+        mask = self.rng.rand(15) < 0.7
+        masked = linear_regression.leastMedianOfSquaresSweep(
+            x, y, mask=mask, full_output=True)[2]
+        self.assertAlmostEqual(masked, bruteForceLeastMedian(x[mask],
+                                                             y[mask]),
+                               places=9)
+
+    def testExactLine(self):
+        # More than half of the points on a line are fit exactly
+        x = numpy.arange(11.)
+        y = 3. - 0.5 * x
+        y[[1, 4, 8]] += [5., -7., 2.]
+        for func in (linear_regression.leastMedianOfSquaresSweep,
+                     linear_regression.leastMedianOfSquares,
+                     linear_regression.leastMedianOfSquaresCrude):
+            alpha, beta, d_star = func(x, y, full_output=True)
+            self.assertAlmostEqual(alpha, 3.)
+            self.assertAlmostEqual(beta, -0.5)
+            self.assertAlmostEqual(d_star, 0.)
+
+
+
+class TestLeastSquaresAccumulator(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(3)
+        # Offset, so that raw sums would lose precision
+        self.x = 1e6 + rng.uniform(0, 10, 1000)
+        self.y = 5. - 3. * self.x + rng.normal(0, 1, 1000)
+
+    def assertFits(self, accumulator, x, y):
+        a = numpy.column_stack([numpy.ones_like(x), x])
+        expected = numpy.linalg.lstsq(a, y, rcond=None)[0]
+        alpha, beta = accumulator.fit()
+        self.assertEqual(accumulator.n, x.size)
+        self.assertAlmostEqual(beta, expected[1], places=6)
+        # alpha is far from the data, at x = 0
+        self.assertAlmostEqual(alpha, expected[0], delta=1e-6 * 1e6)
+
+    def testFromPoints(self):
+        accumulator = linear_regression.LeastSquaresAccumulator.fromPoints(
+            self.x, self.y)
+        self.assertFits(accumulator, self.x, self.y)
+
+    def testUpdateInChunks(self):
+        accumulator = linear_regression.LeastSquaresAccumulator()
+        for start in xrange(0, 1000, 37):
+            accumulator.update(self.x[start:start + 37],
+                               self.y[start:start + 37])
+        self.assertFits(accumulator, self.x, self.y)
+
+    def testMerge(self):
+        fromPoints = linear_regression.LeastSquaresAccumulator.fromPoints
+        parts = [fromPoints(self.x[i::3], self.y[i::3]) for i in xrange(3)]
+        accumulator = parts[0] + parts[1]
+        accumulator += parts[2]
+        self.assertFits(accumulator, self.x, self.y)
+        # The parts are unchanged by +
+        self.assertFits(parts[0], self.x[::3], self.y[::3])
+
+    def testMergeEmpty(self):
+        accumulator = linear_regression.LeastSquaresAccumulator()
+        accumulator.merge(linear_regression.LeastSquaresAccumulator())
+        self.assertEqual(accumulator.n, 0)
+        accumulator.update(self.x, self.y)
+        accumulator.merge(linear_regression.LeastSquaresAccumulator())
+        self.assertFits(accumulator, self.x, self.y)
+
+    def testRemove(self):
+        accumulator = linear_regression.LeastSquaresAccumulator.fromPoints(
+            self.x, self.y)
+        excluded = numpy.zeros(1000, dtype=bool)
+        excluded[100:400] = True
+        accumulator.remove(self.x[excluded], self.y[excluded])
+        self.assertFits(accumulator, self.x[~excluded], self.y[~excluded])
+        # and returned again
+        accumulator.update(self.x[100:200], self.y[100:200])
+        excluded[100:200] = False
+        self.assertFits(accumulator, self.x[~excluded], self.y[~excluded])
+
+    def testUnmerge(self):
+        fromPoints = linear_regression.LeastSquaresAccumulator.fromPoints
+        accumulator = fromPoints(self.x, self.y)
+        accumulator -= fromPoints(self.x[::2], self.y[::2])
+        self.assertFits(accumulator, self.x[1::2], self.y[1::2])
+        everything = fromPoints(self.x, self.y)
+        rest = everything - fromPoints(self.x[:-1], self.y[:-1])
+        self.assertEqual(rest.n, 1)
+        self.assertAlmostEqual(rest.xmean, self.x[-1], places=6)
+        self.assertEqual((everything - everything).n, 0)
+        with self.assertRaises(ValueError):
+            fromPoints(self.x[:5], self.y[:5]).unmerge(everything)
+
+    def testTooFewPoints(self):
+        accumulator = linear_regression.LeastSquaresAccumulator.fromPoints(
+            [1., 1.], [2., 3.])
+        with self.assertRaises(ValueError):
+            accumulator.fit()
+
+
+class TestTheilSen(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = numpy.random.RandomState(1)
+
+    def testAgainstAllSlopes(self):
+        # Odd and even numbers of slopes, and ties in x
+        for n in (7, 8, 30, 61):
+            for _ in xrange(5):
+                x = self.rng.randint(0, n // 2, n).astype(float)
+                y = 1. + 2. * x + self.rng.standard_cauchy(n)
+                alpha, beta = linear_regression.theilSen(x, y)
+                expected = numpy.median(referenceSlopes(x, y))
+                self.assertAlmostEqual(beta, expected, places=9)
+                self.assertAlmostEqual(alpha, numpy.median(y - beta * x),
+                                       places=9)
+
+    def testLarge(self):
+        for n, ties in ((2000, False), (2001, True)):
+            x, y = getLargeData(self.rng, n, ties)
+            slopes = slopeMatrix(x, y)[numpy.triu_indices(n, 1)]
+            slopes = slopes[~numpy.isnan(slopes)]
+            self.assertGreater(slopes.size, 2 ** 20)
+            beta = linear_regression.theilSen(x, y)[1]
+            self.assertAlmostEqual(beta, numpy.median(slopes), places=9)
+
+    def testApproximateFewSlopes(self):
+        # The sample is only used if there are more slopes than samples
+        x = self.rng.uniform(0, 1, 20)
+        y = self.rng.uniform(0, 1, 20)
+        exact = linear_regression.theilSen(x, y)
+        approximate = linear_regression.theilSen(x, y, approximate=True)
+        self.assertEqual(exact, approximate)
+
+    def testSingleX(self):
+        with self.assertRaises(ValueError):
+            linear_regression.theilSen(numpy.ones(5), numpy.arange(5.))
+
+
+class TestRepeatedMedian(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = numpy.random.RandomState(2)
+
+    def referenceSlope(self, x, y):
+        medians = [lowerMedian(slopes) for slopes in
+                   (referenceSlopes(x, y, i) for i in xrange(x.size))
+                   if slopes.size]
+        return lowerMedian(medians)
+
+    def testAgainstAllSlopes(self):
+        for n in (7, 8, 30, 61):
+            for _ in xrange(5):
+                x = self.rng.randint(0, n // 2, n).astype(float)
+                y = 1. + 2. * x + self.rng.standard_cauchy(n)
+                alpha, beta = linear_regression.repeatedMedian(x, y)
+                self.assertAlmostEqual(beta, self.referenceSlope(x, y),
+                                       places=9)
+                self.assertAlmostEqual(alpha, numpy.median(y - beta * x),
+                                       places=9)
+
+    def testLarge(self):
+        for n, ties in ((3000, True), (3001, False)):
+            x, y = getLargeData(self.rng, n, ties)
+            medians = []
+            for start in xrange(0, n, 500):
+                slopes = slopeMatrix(x, y, slice(start, start + 500))
+                counts = n - numpy.isnan(slopes).sum(axis=1)
+                slopes.sort(axis=1)  # nan last
+                valid = numpy.flatnonzero(counts)
+                medians.append(slopes[valid, (counts[valid] - 1) // 2])
+            beta = linear_regression.repeatedMedian(x, y)[1]
+            self.assertAlmostEqual(beta, lowerMedian(numpy.concatenate(
+                medians)), places=9)
+
+    def testApproximateFewPoints(self):
+        # With no more than samples points, the approximation is exact
+        x = self.rng.uniform(0, 1, 25)
+        y = self.rng.uniform(0, 1, 25)
+        beta = linear_regression.repeatedMedian(x, y, approximate=True,
+                                                samples=25)[1]
+        self.assertAlmostEqual(beta, self.referenceSlope(x, y), places=9)
+
+
+if __name__ == '__main__':
+    unittest.main()
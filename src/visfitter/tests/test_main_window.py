@@ -0,0 +1,86 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Tests of the main window's handling of fits. They are skipped if PySide
+and pyqtgraph aren't installed.
+'''
+
+# std lib imports
+import unittest
+
+# third party imports
+import numpy
+try:
+    from PySide import QtGui
+    from ..main_window import MainWindow
+except ImportError:
+    MainWindow = None
+
+# local imports
+from .. import fit_cache
+from .. import linear_regression
+
+
+@unittest.skipIf(MainWindow is None, 'PySide and pyqtgraph are needed')
+class TestCachedFits(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QtGui.QApplication.instance() or QtGui.QApplication([])
+
+    def setUp(self):
+        self.window = MainWindow()
+        # Only in memory, so that the tests don't touch the user's cache
+        self.window.fitCache = fit_cache.FitCache()
+        self.window.fileColumns = ((0, 1), None, 0, False, False)
+        x = numpy.arange(20.)
+        y = 1. + 2. * x
+        self.window.loadColumns([x, y])
+        self.hash = fit_cache.hashData(x, y)
+
+    def tearDown(self):
+        self.window.fitRunner.cancel()
+        self.window.close()
+
+    def cache(self, func, result):
+        self.window.fitCache.put(fit_cache.getKey(func, self.hash, {}),
+                                 result)
+
+    def testCacheHit(self):
+        # A cache hit becomes the last fit, like a fit that finished
+        self.cache(linear_regression.leastSquares, (1., 2.))
+        self.cache(linear_regression.theilSen, (1.5, 2.5))
+        self.window.startFit('Least Squares', linear_regression.leastSquares,
+                             'r')
+        self.assertEqual(self.window.lastFit.name, 'Least Squares')
+        self.assertEqual(self.window.lastResult, (1., 2.))
+        self.assertTrue(self.window.statsAction.isEnabled())
+        self.assertTrue(self.window.bootstrapAction.isEnabled())
+        self.window.startFit('Theil-Sen', linear_regression.theilSen, 'b',
+                             cancellable=True)
+        self.assertIs(self.window.lastFit.func, linear_regression.theilSen)
+        self.assertEqual(self.window.lastResult, (1.5, 2.5))
+        self.assertEqual(set(self.window.lines),
+                         set(['Least Squares', 'Theil-Sen']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Tests of the weighted multiple regression estimators.
+'''
+
+# std lib imports
+import unittest
+
+# third party imports
+import numpy
+
+# local imports
+from .. import multiple_regression
+
+
+class TestWeights(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.X = rng.uniform(0, 10, (40, 2))
+        self.y = (1. + self.X.dot([2., -3.]) + rng.normal(0, 0.1, 40))
+        self.y[:10] += rng.uniform(20, 50, 10)
+
+    def testUnitWeights(self):
+        # Weights of 1 don't change the subsets tried or their scores
+        ones = numpy.ones(40)
+        lts = multiple_regression.leastTrimmedSquares
+        numpy.testing.assert_array_equal(
+            lts(self.X, self.y, ones, seed=1, full_output=True)[0],
+            lts(self.X, self.y, seed=1, full_output=True)[0])
+        # Without weights, the intercept of the best LMS fit is then made
+        # exact, which can only lower d_star
+        lms = multiple_regression.leastMedianOfSquares
+        weighted, weighted_d = lms(self.X, self.y, ones, seed=1,
+                                   full_output=True)
+        unweighted, unweighted_d = lms(self.X, self.y, seed=1,
+                                       full_output=True)
+        numpy.testing.assert_array_equal(weighted[1:], unweighted[1:])
+        self.assertLessEqual(unweighted_d, weighted_d)
+
+    def testZeroWeights(self):
+        # Points with a weight of 0 are left out, like masked out points
+        weights = numpy.ones(40)
+        weights[::3] = 0
+        mask = weights > 0
+        for func in (multiple_regression.leastMedianOfSquares,
+                     multiple_regression.leastTrimmedSquares,
+                     multiple_regression.weightedLeastSquares):
+            kwargs = {} if func is multiple_regression.weightedLeastSquares \
+                else dict(seed=2)
+            numpy.testing.assert_array_equal(
+                func(self.X, self.y, weights, **kwargs),
+                func(self.X, self.y, numpy.ones(40), mask=mask, **kwargs))
+
+    def testZeroWeightsDontCount(self):
+        # More than h of the points have a weight of 0, and lie far from
+        # the line of the others. If they counted as fit exactly, every fit
+        # would score 0.
+        rng = numpy.random.RandomState(3)
+        X = rng.uniform(0, 10, (40, 1))
+        y = 1. + 2. * X[:, 0] + rng.normal(0, 0.1, 40)
+        weights = numpy.ones(40)
+        weights[:25] = 0
+        y[:25] = 100. - 5. * X[:25, 0]
+        for func in (multiple_regression.leastMedianOfSquares,
+                     multiple_regression.leastTrimmedSquares):
+            coef = func(X, y, weights, seed=4)
+            self.assertAlmostEqual(coef[1], 2., delta=0.2)
+
+    def testNegativeWeights(self):
+        weights = numpy.ones(40)
+        weights[0] = -1
+        with self.assertRaises(ValueError):
+            multiple_regression.leastTrimmedSquares(self.X, self.y, weights)
+
+
+if __name__ == '__main__':
+    unittest.main()
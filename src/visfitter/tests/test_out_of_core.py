@@ -0,0 +1,205 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Tests of the out of core fits, against fits and selections of all of the
+points in memory.
+'''
+
+# std lib imports
+import os
+import shutil
+import tempfile
+import unittest
+
+# third party imports
+import numpy
+
+# local imports
+from .. import out_of_core
+from .. import linear_regression
+from .. import multiple_regression
+
+
+def exactSelection(alpha, beta, x, y, h):
+    # Rounded like out_of_core._absoluteResiduals
+    r = numpy.absolute(y - (alpha + beta * x))
+    return numpy.partition(r, h - 1)[h - 1]
+
+
+class TestSelection(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.x = rng.uniform(0, 10, 5000)
+        self.y = 1. + 2. * self.x + rng.standard_cauchy(5000)
+        self.lines = [(1., 2.), (0., 0.), (30., -3.)]
+        self.passes = 0
+
+    def chunks(self, x=None, y=None, size=700):
+        x = self.x if x is None else x
+        y = self.y if y is None else y
+
+        def chunks():
+            self.passes += 1
+            for start in xrange(0, x.size, size):
+                yield x[start:start + size], y[start:start + size]
+        return chunks
+
+    def getSample(self, x=None, y=None, size=500):
+        x = self.x if x is None else x
+        y = self.y if y is None else y
+        sample = out_of_core.ReservoirSample(size, seed=1)
+        sample.update(x, y)
+        return sample
+
+    def checkSelection(self, x, y, h, **kwargs):
+        self.passes = 0
+        selected = out_of_core.selectAbsoluteResiduals(
+            self.chunks(x, y), self.lines, h, x.size, **kwargs)
+        expected = [exactSelection(alpha, beta, x, y, h)
+                    for alpha, beta in self.lines]
+        self.assertEqual(selected, expected)
+
+    def testBracketedBySample(self):
+        for h in (1, 100, 4999, 5000):
+            self.checkSelection(self.x, self.y, h, sample=self.getSample())
+        # The bracket of the median is buffered in a single pass
+        self.checkSelection(self.x, self.y, 2501, sample=self.getSample())
+        self.assertEqual(self.passes, 1)
+
+    def testSmallBuffer(self):
+        # The brackets overflow the buffer, and are narrowed by histograms
+        # in further passes
+        for h in (1, 2501, 5000):
+            self.checkSelection(self.x, self.y, h, sample=self.getSample(),
+                                buffer_size=16, bins=8)
+        self.assertGreater(self.passes, 1)
+
+    def testWithoutSample(self):
+        for h in (1, 2501, 5000):
+            self.checkSelection(self.x, self.y, h)
+            self.checkSelection(self.x, self.y, h, buffer_size=64, bins=4)
+
+    def testTies(self):
+        # Integer data, so many of the absolute residuals are equal
+        rng = numpy.random.RandomState(2)
+        x = rng.randint(0, 5, 3000).astype(float)
+        y = rng.randint(0, 20, 3000).astype(float)
+        for h in (1, 1501, 3000):
+            self.checkSelection(x, y, h, sample=self.getSample(x, y))
+            self.checkSelection(x, y, h, sample=self.getSample(x, y),
+                                buffer_size=16, bins=4)
+
+    def testRange(self):
+        for h in (0, 5001):
+            with self.assertRaises(ValueError):
+                out_of_core.selectAbsoluteResiduals(self.chunks(),
+                                                    self.lines, h, 5000)
+
+
+class TestReservoirSample(unittest.TestCase):
+
+    def testSample(self):
+        x = numpy.arange(10000.)
+        sample = out_of_core.ReservoirSample(300, seed=0)
+        for start in xrange(0, 10000, 999):
+            sample.update(x[start:start + 999], -x[start:start + 999])
+        self.assertEqual(sample.seen, 10000)
+        self.assertEqual(sample.x.size, 300)
+        # Distinct points, with their y
+        self.assertEqual(numpy.unique(sample.x).size, 300)
+        numpy.testing.assert_array_equal(sample.y, -sample.x)
+        # The same seed draws the same sample, however the points are
+        # chunked
+        again = out_of_core.ReservoirSample(300, seed=0)
+        again.update(x, -x)
+        numpy.testing.assert_array_equal(again.x, sample.x)
+
+    def testFewPoints(self):
+        sample = out_of_core.ReservoirSample(300, seed=0)
+        sample.update(numpy.arange(100.), numpy.arange(100.))
+        numpy.testing.assert_array_equal(sample.x, numpy.arange(100.))
+
+
+class TestFitFile(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'data.txt')
+        rng = numpy.random.RandomState(3)
+        self.x = rng.uniform(0, 10, 3000)
+        self.y = 1. + 2. * self.x + rng.normal(0, 0.1, 3000)
+        self.y[:900] += rng.uniform(20, 50, 900)
+        numpy.savetxt(self.path, numpy.column_stack([self.x, self.y]))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def fitFile(self, keys, **kwargs):
+        return out_of_core.fitFile(self.path, keys=keys, chunk_rows=700,
+                                   sample_size=500, seed=4,
+                                   full_output=True, **kwargs)
+
+    def testCandidates(self):
+        alpha, beta, result = self.fitFile(['ls', 'lms-random', 'lts'])
+        self.assertEqual(result.n, 3000)
+        self.assertEqual([c.key for c in result.candidates],
+                         ['ls', 'lms-random', 'lts'])
+        h = 3000 // 2 + 1
+        for c in result.candidates:
+            self.assertEqual(c.d_star,
+                             exactSelection(c.alpha, c.beta, self.x, self.y,
+                                            h))
+        # Least squares is fit to all of the points
+        ls = result.candidates[0]
+        expected = linear_regression.leastSquares(self.x, self.y)
+        self.assertAlmostEqual(ls.alpha, expected[0])
+        self.assertAlmostEqual(ls.beta, expected[1])
+        self.assertIs(result.best, min(result.candidates,
+                                       key=lambda c: c.d_star))
+        self.assertEqual((alpha, beta), (result.best.alpha,
+                                         result.best.beta))
+        self.assertAlmostEqual(beta, 2., places=1)
+
+    def testSeed(self):
+        keys = ['lms-random', 'theil-sen-approx']
+        self.assertEqual(self.fitFile(keys)[:2], self.fitFile(keys)[:2])
+
+    def testFallback(self):
+        # The sweep would take too long for the sample, so the fallback is
+        # fit instead, once
+        result = self.fitFile(['lms', 'lms-random'], sample_seconds=0.1)[2]
+        self.assertEqual([c.key for c in result.candidates], ['lms-random'])
+
+    def testTooSlow(self):
+        with self.assertRaises(ValueError):
+            self.fitFile(['lms-random'], sample_seconds=1e-9)
+
+    def testMultiple(self):
+        estimator = linear_regression.ESTIMATORS['lms-multiple']
+        self.assertEqual(estimator.func.__module__,
+                         multiple_regression.__name__)
+        with self.assertRaises(ValueError):
+            self.fitFile(['lms-multiple'])
+
+
+if __name__ == '__main__':
+    unittest.main()
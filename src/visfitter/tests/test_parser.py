@@ -0,0 +1,228 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Tests of the choice of parser by sniffing the start of a file, and of the
+columns read by each parser.
+'''
+
+# std lib imports
+import os
+import bz2
+import gzip
+import shutil
+import tempfile
+import unittest
+
+# third party imports
+import numpy
+
+# local imports
+from .. import parser
+
+X = numpy.array([0., 1.5, -2., 3e3])
+Y = numpy.array([1., -0.25, 4., 5e-3])
+TEXT = '# x y\n' + ''.join('{!r} {!r}\n'.format(*p) for p in zip(X, Y))
+CSV = 'x,y\n' + ''.join('{!r},{!r}\n'.format(*p) for p in zip(X, Y))
+
+
+class TestSniffing(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def assertParses(self, path, cls, rejected=1):
+        self.assertIs(parser.getParserClass(path), cls)
+        x, y, info = parser.getXY(path, full_output=True)
+        numpy.testing.assert_array_equal(x, X)
+        numpy.testing.assert_array_equal(y, Y)
+        self.assertEqual(info['format'], cls.name)
+        self.assertEqual(info['rejected'], rejected)
+
+    def testText(self):
+        self.assertParses(self.write('data.txt', TEXT), parser.TextParser)
+
+    def testCSVByExtension(self):
+        self.assertParses(self.write('data.CSV', CSV), parser.CSVParser)
+
+    def testCSVByContent(self):
+        self.assertParses(self.write('data.dat', CSV), parser.CSVParser)
+
+    def testGzip(self):
+        path = os.path.join(self.dir, 'data.txt.gz')
+        f = gzip.open(path, 'wb')
+        f.write(TEXT)
+        f.close()
+        self.assertParses(path, parser.CompressedTextParser)
+
+    def testBzip2CSV(self):
+        # The separator is sniffed from the decompressed text
+        path = self.write('data.bz2', bz2.compress(CSV))
+        self.assertParses(path, parser.CompressedTextParser)
+
+    def testNpy(self):
+        path = os.path.join(self.dir, 'data.npy')
+        numpy.save(path, numpy.column_stack([X, Y]))
+        self.assertParses(path, parser.NumpyParser, rejected=0)
+
+    def testNpz(self):
+        path = os.path.join(self.dir, 'data.npz')
+        numpy.savez(path, y=Y, x=X)
+        self.assertParses(path, parser.NumpyParser, rejected=0)
+
+    def testZipIsNotNpz(self):
+        # A zip file without the .npz extension isn't taken for one, and
+        # isn't text either
+        path = self.write('data.zip', 'PK\x03\x04\0\0')
+        with self.assertRaises(ValueError):
+            parser.getParserClass(path)
+
+    def testHead(self):
+        # Only the head is sniffed, so the file needn't exist
+        self.assertIs(parser.getParserClass('missing.dat', CSV),
+                      parser.CSVParser)
+        self.assertIs(parser.getParserClass('missing.dat', TEXT),
+                      parser.TextParser)
+
+    def testRegisterFirst(self):
+        class AnyParser(parser.TextParser):
+            @classmethod
+            def sniff(cls, head, filepath):
+                return True
+        parsers = parser.getParsers()
+        parser.registerParser(AnyParser, first=True)
+        try:
+            self.assertIs(parser.getParserClass('missing.npy', '\x93NUMPY'),
+                          AnyParser)
+        finally:
+            parser._parsers[:] = parsers
+        self.assertIs(parser.getParserClass('missing.npy', '\x93NUMPY'),
+                      parser.NumpyParser)
+
+
+
+class TestParsing(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        rng = numpy.random.RandomState(0)
+        self.x = rng.normal(0, 1, 1000)
+        self.y = rng.normal(0, 1e3, 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, lines):
+        path = os.path.join(self.dir, 'data.txt')
+        with open(path, 'wb') as f:
+            f.write(''.join(line + '\n' for line in lines))
+        return path
+
+    def assertColumns(self, path, cols, expected, rejected, sep=None):
+        # Small chunks, so that a file spans many of them
+        for chunk_size in (2 ** 22, 1000):
+            columns, info = parser.getColumns(path, cols, sep,
+                                              full_output=True,
+                                              chunk_size=chunk_size)
+            self.assertEqual(len(columns), len(expected))
+            for column, values in zip(columns, expected):
+                numpy.testing.assert_array_equal(column, values)
+            self.assertEqual(info['rows'], len(expected[0]))
+            self.assertEqual(info['rejected'], rejected)
+
+    def testNumeric(self):
+        path = self.write('{!r} {!r} {}'.format(x, y, i)
+                          for i, (x, y) in enumerate(zip(self.x, self.y)))
+        self.assertColumns(path, (0, 1), (self.x, self.y), 0)
+        self.assertColumns(path, (2, 0), (numpy.arange(1000.), self.x), 0)
+        self.assertColumns(path, (-1,), (numpy.arange(1000.),), 0)
+
+    def testHeader(self):
+        path = self.write(['# data', 'x y'] +
+                          ['{!r} {!r}'.format(*p)
+                           for p in zip(self.x, self.y)])
+        self.assertColumns(path, (0, 1), (self.x, self.y), 2)
+
+    def testLongHeader(self):
+        # More header lines than are parsed one by one
+        header = ['header line {}'.format(i)
+                  for i in xrange(parser.HEADER_LINES * 2)]
+        path = self.write(header + ['{!r},{!r}'.format(*p)
+                                    for p in zip(self.x, self.y)])
+        self.assertColumns(path, (0, 1), (self.x, self.y), len(header),
+                           sep=',')
+
+    def testNonNumericColumn(self):
+        path = self.write(['time x label y'] +
+                          ['2014-01-01T00:{} {!r} a{} {!r}'.format(i, x, i, y)
+                           for i, (x, y) in enumerate(zip(self.x,
+                                                          self.y))])
+        self.assertColumns(path, (1, 3), (self.x, self.y), 1)
+        # The number of columns is known after the first data line, so the
+        # rest isn't parsed one line at a time
+        columns, ncols, rejected = parser._parseLines(
+            'time x label y\n2014 1.5 a 2\n', (1, 3), None, None)
+        self.assertEqual((ncols, rejected), (4, 1))
+
+    def testBadLines(self):
+        lines = ['{!r} {!r}'.format(*p) for p in zip(self.x, self.y)]
+        keep = numpy.ones(1000, dtype=bool)
+        for i in (0, 5, 500, 999):
+            lines[i] = 'nan?' if i % 2 else lines[i].split()[0]
+            keep[i] = False
+        lines.insert(300, '')
+        path = self.write(lines)
+        self.assertColumns(path, (0, 1), (self.x[keep], self.y[keep]), 4)
+
+    def testEmptyCSVFields(self):
+        # Only the lines with an empty x or y are skipped
+        path = self.write(['1,2', '3,', ',4', '5,6,', '7,8'])
+        self.assertColumns(path, (0, 1), ([1., 5., 7.], [2., 6., 8.]), 2,
+                           sep=',')
+
+    def testParsedInBulk(self):
+        # Numeric text after a header takes the bulk path, and parses the
+        # same as line by line
+        text = 'x y\n' + ''.join('{!r} {!r}\n'.format(*p)
+                                 for p in zip(self.x, self.y))
+        ncols = 2
+        bulk = parser._parseLinesInBulk(text[4:], (0, 1), None, ncols)
+        slow, ncols, rejected = parser._parseLinesSlowly(text, (0, 1), None,
+                                                         None)
+        self.assertEqual((ncols, rejected), (2, 1))
+        for b, s in zip(bulk, slow):
+            numpy.testing.assert_array_equal(b, s)
+        columns, ncols, rejected = parser._parseLines(text, (0, 1), None,
+                                                      None)
+        numpy.testing.assert_array_equal(columns[1], self.y)
+        self.assertEqual((ncols, rejected), (2, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
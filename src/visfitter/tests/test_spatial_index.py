@@ -0,0 +1,100 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of VisFitter.
+#
+#   VisFitter is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   VisFitter is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with VisFitter.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+'''
+Tests of the spatial index, against a linear scan of the points.
+'''
+
+# std lib imports
+import unittest
+
+# third party imports
+import numpy
+
+# local imports
+from ..spatial_index import StripIndex
+
+
+def scan(x, y, xmin, xmax, ymin, ymax):
+    with numpy.errstate(invalid='ignore'):  # nan is never in the rectangle
+        return numpy.flatnonzero((x >= xmin) & (x <= xmax) &
+                                 (y >= ymin) & (y <= ymax))
+
+
+class TestStripIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = numpy.random.RandomState(0)
+
+    def checkQueries(self, x, y, index, queries=200):
+        for _ in xrange(queries):
+            xmin, xmax = numpy.sort(self.rng.uniform(-1.5, 1.5, 2))
+            ymin, ymax = numpy.sort(self.rng.uniform(-1.5, 1.5, 2))
+            found = numpy.sort(index.query(xmin, xmax, ymin, ymax))
+            numpy.testing.assert_array_equal(
+                found, scan(x, y, xmin, xmax, ymin, ymax))
+
+    def testUniform(self):
+        x = self.rng.uniform(-1, 1, 2000)
+        y = self.rng.uniform(-1, 1, 2000)
+        self.checkQueries(x, y, StripIndex(x, y))
+
+    def testAlongALine(self):
+        x = self.rng.normal(0, 0.5, 2000)
+        y = 0.5 * x + self.rng.normal(0, 0.01, 2000)
+        self.checkQueries(x, y, StripIndex(x, y))
+
+    def testTies(self):
+        # Many equal x and y, which must not span two strips
+        x = self.rng.randint(-3, 4, 1000) / 3.
+        y = self.rng.randint(-3, 4, 1000) / 3.
+        self.checkQueries(x, y, StripIndex(x, y))
+        self.checkQueries(x, y, StripIndex(x, y, points_per_strip=1))
+
+    def testEdges(self):
+        x = self.rng.uniform(-1, 1, 500)
+        y = self.rng.uniform(-1, 1, 500)
+        index = StripIndex(x, y, points_per_strip=7)
+        for i in xrange(0, 500, 50):
+            # Rectangles that only hold one point, on their edges
+            found = index.query(x[i], x[i], y[i], y[i])
+            numpy.testing.assert_array_equal(found, [i])
+        everything = numpy.sort(index.query(-numpy.inf, numpy.inf,
+                                            -numpy.inf, numpy.inf))
+        numpy.testing.assert_array_equal(everything, numpy.arange(500))
+        self.assertEqual(index.query(1, 0, 0, 1).size, 0)
+        self.assertEqual(index.query(2, 3, 2, 3).size, 0)
+
+    def testNonFinite(self):
+        x = self.rng.uniform(-1, 1, 300)
+        y = self.rng.uniform(-1, 1, 300)
+        x[::10] = numpy.nan
+        y[5::10] = numpy.inf
+        index = StripIndex(x, y)
+        self.checkQueries(x, y, index)
+        self.assertEqual(index.query(-2, 2, -2, 2).size, 240)
+
+    def testEmpty(self):
+        index = StripIndex(numpy.empty(0), numpy.empty(0))
+        self.assertEqual(index.query(0, 1, 0, 1).size, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()